@@ -0,0 +1,114 @@
+import statistics
+from urllib.parse import urlparse
+from typing import List, Dict, Any, Tuple
+
+
+class AdSegmentFilter:
+    """
+    广告分片过滤器
+    按#EXT-X-DISCONTINUITY将分片划分为若干分组，根据主机、时长模式和密钥变化
+    判断哪些分组是插入的广告，在下载前剔除，避免浪费流量并破坏ffmpeg合并的时间戳
+    """
+
+    def __init__(self, max_ad_duration: float = 120.0, score_threshold: int = 2):
+        """
+        初始化广告过滤器
+
+        Args:
+            max_ad_duration: 广告分组的最大总时长（秒），超过该时长的分组一律保留
+            score_threshold: 判定为广告所需的最低得分
+        """
+        self.max_ad_duration = max_ad_duration
+        self.score_threshold = score_threshold
+        # 分片时长与正片相差超过该比例时视为时长模式不同
+        self.duration_tolerance = 0.3
+
+    def _group_segments(self, segments: List[Dict[str, Any]]) -> Dict[int, List[Dict[str, Any]]]:
+        """
+        按不连续分组编号归类分片
+        """
+        groups = {}
+        for segment in segments:
+            groups.setdefault(segment.get('group', 0), []).append(segment)
+        return groups
+
+    def _group_profile(self, group_segments: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        统计分组的主机、密钥和时长特征
+        """
+        durations = [s['duration'] for s in group_segments if s.get('duration')]
+        hosts = {}
+        for segment in group_segments:
+            host = urlparse(segment['url']).netloc.lower()
+            hosts[host] = hosts.get(host, 0) + 1
+        return {
+            'host': max(hosts, key=hosts.get) if hosts else '',
+            'key_url': group_segments[0].get('key_url'),
+            'total_duration': sum(durations),
+            'median_duration': statistics.median(durations) if durations else None,
+            'count': len(group_segments)
+        }
+
+    def classify(self, segments: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        对每个不连续分组打分
+
+        Returns:
+            分组信息列表，每项包含 group、score、reasons、is_ad 等字段
+        """
+        groups = self._group_segments(segments)
+        if len(groups) <= 1:
+            return []
+
+        profiles = {group_id: self._group_profile(items) for group_id, items in groups.items()}
+        # 总时长最长的分组视为正片（没有时长信息时按分片数量）
+        main_group = max(profiles, key=lambda g: (profiles[g]['total_duration'], profiles[g]['count']))
+        main = profiles[main_group]
+
+        results = []
+        for group_id, profile in profiles.items():
+            score = 0
+            reasons = []
+            if group_id != main_group:
+                if profile['host'] != main['host']:
+                    score += 2
+                    reasons.append(f"主机不同({profile['host']})")
+                if profile['key_url'] != main['key_url']:
+                    score += 1
+                    reasons.append("密钥变化")
+                if main['median_duration'] and profile['median_duration']:
+                    diff = abs(profile['median_duration'] - main['median_duration']) / main['median_duration']
+                    if diff > self.duration_tolerance:
+                        score += 1
+                        reasons.append(f"分片时长模式不同({profile['median_duration']:.1f}s)")
+                if profile['total_duration'] and profile['total_duration'] <= self.max_ad_duration / 4:
+                    score += 1
+                    reasons.append(f"分组很短({profile['total_duration']:.1f}s)")
+
+            # 过长的分组不可能是广告，避免误删正片
+            too_long = profile['total_duration'] > self.max_ad_duration
+            results.append({
+                'group': group_id,
+                'score': score,
+                'reasons': reasons,
+                'segment_count': profile['count'],
+                'total_duration': profile['total_duration'],
+                'is_ad': group_id != main_group and not too_long and score >= self.score_threshold
+            })
+
+        return sorted(results, key=lambda r: r['group'])
+
+    def filter_segments(self, segments: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """
+        剔除被判定为广告的分组
+
+        Returns:
+            (保留的分片列表, 被剔除的分组信息列表)
+        """
+        ad_groups = [r for r in self.classify(segments) if r['is_ad']]
+        if not ad_groups:
+            return segments, []
+
+        ad_group_ids = {r['group'] for r in ad_groups}
+        kept_segments = [s for s in segments if s.get('group', 0) not in ad_group_ids]
+        return kept_segments, ad_groups
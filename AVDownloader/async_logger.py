@@ -0,0 +1,222 @@
+import os
+import time
+import queue
+import threading
+from collections import deque
+from typing import Any, Dict, Optional
+from utils import utils
+
+
+class AsyncLogger:
+    """
+    异步日志文件写入器
+    调用方只把日志放入有界队列（不阻塞界面线程），由后台线程批量追加到日志文件；
+    日志文件超过大小上限或进入新的时间周期（默认每天）时轮转为 .1、.2 ... 备份。
+    最近的视频下载记录单独保存为JSON索引，不再为此重写原始日志
+    """
+
+    # 停止后台线程的队列标记
+    _CLOSE = object()
+
+    def __init__(self, log_file: str, max_bytes: int = 5 * 1024 * 1024, backup_count: int = 5,
+                 rotate_interval: Optional[float] = 24 * 3600, queue_size: int = 10000,
+                 index_file: Optional[str] = None, index_size: int = 10):
+        """
+        初始化日志写入器
+
+        Args:
+            log_file: 日志文件路径
+            max_bytes: 单个日志文件的大小上限（字节），0表示不按大小轮转
+            backup_count: 保留的轮转备份数量
+            rotate_interval: 按时间轮转的周期（秒，按本地时间对齐，默认每天零点），None表示不按时间轮转
+            queue_size: 等待写入的日志条数上限，队列满时丢弃新的日志并在之后记录丢弃的条数
+            index_file: 最近视频下载记录的索引文件（JSON），None表示不保存
+            index_size: 索引中保留的视频下载记录数
+        """
+        self.log_file = log_file
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.rotate_interval = rotate_interval
+        self.index_file = index_file
+        self.queue = queue.Queue(maxsize=queue_size)
+        # 队列满时丢弃的日志条数
+        self.dropped = 0
+        self.lock = threading.Lock()
+        # 最近的视频下载记录
+        self.video_records = deque(maxlen=index_size)
+        if index_file and os.path.exists(index_file):
+            records = utils.read_json(index_file)
+            if isinstance(records, list):
+                self.video_records.extend(records)
+
+        directory = os.path.dirname(log_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.file = None
+        self.size = 0
+        self.period = None
+        self.closed = False
+        self.thread = threading.Thread(target=self._writer_loop, name="async-logger", daemon=True)
+        self.thread.start()
+
+    def write(self, timestamp: str, level: str, message: str) -> None:
+        """
+        写入一条日志（只放入队列，立即返回）
+        """
+        self._put(f"[{timestamp}] [{level}] {message}\n")
+
+    def record_video(self, status: str, url: Optional[str] = None, **fields) -> None:
+        """
+        记录一次视频下载结果到最近视频索引
+
+        Args:
+            status: 下载结果（success/failed）
+            url: 网页或视频URL
+            fields: 其他信息，如file（保存路径）、error（失败原因）
+        """
+        record: Dict[str, Any] = {'time': utils.get_datetime(), 'status': status}
+        if url:
+            record['url'] = url
+        record.update(fields)
+        with self.lock:
+            self.video_records.append(record)
+        self._put(None)
+
+    def _put(self, item: Optional[str]) -> None:
+        """
+        放入写入队列（None表示需要更新视频索引），队列满时丢弃
+        """
+        if self.closed:
+            return
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            with self.lock:
+                self.dropped += 1
+
+    def _period_of(self, timestamp: float) -> Optional[int]:
+        """
+        计算时间所在的轮转周期（按本地时间对齐）
+        """
+        if not self.rotate_interval:
+            return None
+        local = timestamp + time.localtime(timestamp).tm_gmtoff
+        return int(local // self.rotate_interval)
+
+    def _open(self) -> None:
+        self.file = open(self.log_file, 'a', encoding='utf-8')
+        self.size = self.file.tell()
+        # 已有日志文件按最后修改时间计算周期，重启后跨天也会轮转
+        mtime = os.path.getmtime(self.log_file) if self.size > 0 else time.time()
+        self.period = self._period_of(mtime)
+
+    def _should_rotate(self, length: int) -> bool:
+        """
+        写入length字节前检查是否需要轮转
+        """
+        if self.max_bytes and self.size > 0 and self.size + length > self.max_bytes:
+            return True
+        return self.period is not None and self._period_of(time.time()) != self.period
+
+    def _write_lines(self, lines) -> None:
+        """
+        追加日志行，写到大小上限时轮转（同一批日志可能分在两个文件中）
+        """
+        chunk = []
+        for line in lines:
+            length = len(line.encode('utf-8'))
+            if self._should_rotate(length):
+                self.file.write(''.join(chunk))
+                chunk = []
+                self._rotate()
+            chunk.append(line)
+            self.size += length
+        self.file.write(''.join(chunk))
+        self.file.flush()
+
+    def _rotate(self) -> None:
+        """
+        轮转日志文件：downloader.log -> downloader.log.1 -> downloader.log.2 ...，超出数量的备份被删除
+        """
+        self.file.close()
+        self.file = None
+        try:
+            if self.backup_count > 0:
+                for index in range(self.backup_count - 1, 0, -1):
+                    source = f"{self.log_file}.{index}"
+                    if os.path.exists(source):
+                        os.replace(source, f"{self.log_file}.{index + 1}")
+                os.replace(self.log_file, f"{self.log_file}.1")
+            else:
+                os.remove(self.log_file)
+        except OSError as e:
+            print(f"[日志] 轮转日志文件失败: {e}")
+        self._open()
+
+    def _write_index(self) -> None:
+        with self.lock:
+            records = list(self.video_records)
+        if self.index_file:
+            # 先写临时文件再替换，避免程序退出时留下不完整的索引
+            temp_file = self.index_file + '.tmp'
+            if utils.write_json(temp_file, records):
+                os.replace(temp_file, self.index_file)
+
+    def _writer_loop(self) -> None:
+        """
+        后台写入线程：批量取出队列中的日志一次写入，需要时轮转文件和更新视频索引
+        """
+        try:
+            self._open()
+        except OSError as e:
+            print(f"[日志] 打开日志文件失败: {e}")
+            return
+        stopping = False
+        while not stopping:
+            try:
+                items = [self.queue.get(timeout=1)]
+            except queue.Empty:
+                items = []
+            while True:
+                try:
+                    items.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            stopping = any(item is self._CLOSE for item in items)
+
+            with self.lock:
+                dropped, self.dropped = self.dropped, 0
+            lines = [item for item in items if isinstance(item, str)]
+            if dropped:
+                lines.append(f"[{utils.get_datetime()}] [WARNING] [日志] 写入队列已满，丢弃了 {dropped} 条日志\n")
+            try:
+                if lines:
+                    self._write_lines(lines)
+                if any(item is None for item in items):
+                    self._write_index()
+            except Exception as e:
+                # 避免日志写入失败影响主程序
+                print(f"日志文件写入失败: {e}")
+            for _ in items:
+                self.queue.task_done()
+        if self.file:
+            self.file.close()
+            self.file = None
+
+    def flush(self) -> None:
+        """
+        等待队列中的日志全部写入
+        """
+        if self.thread.is_alive():
+            self.queue.join()
+
+    def close(self) -> None:
+        """
+        写入剩余的日志并停止后台线程
+        """
+        if self.closed:
+            return
+        self.closed = True
+        if self.thread.is_alive():
+            self.queue.put(self._CLOSE)
+            self.thread.join(timeout=5)
@@ -0,0 +1,260 @@
+import time
+import threading
+import queue
+from typing import Dict, Any, Optional
+from urllib.parse import urlparse
+from browser_simulator import create_chrome_driver, quit_chrome_driver
+
+try:
+    import psutil
+    PSUTIL_AVAILABLE = True
+except ImportError:
+    PSUTIL_AVAILABLE = False
+
+
+class BrowserPool:
+    """
+    浏览器池
+    保持若干个已启动的无头Chrome实例，在多个URL之间复用，避免每个URL都启动和关闭一次Chrome。
+    浏览器归还时重置状态（清除存储、关闭多余标签页、清空性能日志），
+    使用达到指定页面数或内存增长过多时回收重建
+    """
+
+    def __init__(self, size: int = 2, max_pages: int = 30, max_memory_growth_mb: int = 500, headless: bool = True,
+                 profile_template: Optional[str] = None, disable_images: bool = True):
+        """
+        初始化浏览器池
+
+        Args:
+            size: 池中浏览器的最大数量
+            max_pages: 单个浏览器最多加载的页面数，超过后回收
+            max_memory_growth_mb: 浏览器进程内存相对启动时增长超过该值（MB）时回收（需要psutil）
+            headless: 是否使用无头模式
+            profile_template: Chrome用户数据目录模板，每个浏览器启动时复制一份使用
+            disable_images: 是否禁止加载图片（池中的浏览器只用于探测视频链接）
+        """
+        self.size = size
+        self.max_pages = max_pages
+        self.max_memory_growth_mb = max_memory_growth_mb
+        self.headless = headless
+        self.profile_template = profile_template
+        self.disable_images = disable_images
+        # 空闲的浏览器
+        self.idle_drivers = queue.LifoQueue()
+        # 所有浏览器的使用统计 {driver: {'pages': 页面数, 'baseline_memory': 启动时内存MB, 'launch_time': 启动用时}}
+        self.driver_stats = {}
+        self.lock = threading.Lock()
+        self.closed = False
+
+    def _get_memory_mb(self, driver) -> Optional[float]:
+        """
+        获取浏览器进程树（chromedriver及其Chrome子进程）的内存占用（MB）
+        """
+        if not PSUTIL_AVAILABLE:
+            return None
+        try:
+            process = psutil.Process(driver.service.process.pid)
+            processes = [process] + process.children(recursive=True)
+            return sum(p.memory_info().rss for p in processes if p.is_running()) / (1024 * 1024)
+        except Exception:
+            return None
+
+    def _create_driver(self):
+        """
+        启动一个新的浏览器并登记
+        """
+        start = time.monotonic()
+        driver = create_chrome_driver(self.headless, self.profile_template, self.disable_images)
+        launch_time = time.monotonic() - start
+        with self.lock:
+            self.driver_stats[driver] = {'pages': 0, 'baseline_memory': self._get_memory_mb(driver),
+                                         'launch_time': launch_time}
+        print(f"[浏览器池] 已启动新浏览器（用时 {launch_time:.2f} 秒），当前数量: {len(self.driver_stats)}/{self.size}")
+        return driver
+
+    def _quit_driver(self, driver) -> None:
+        """
+        退出浏览器并注销
+        """
+        with self.lock:
+            self.driver_stats.pop(driver, None)
+        try:
+            quit_chrome_driver(driver)
+        except Exception as e:
+            print(f"[浏览器池] 关闭浏览器失败: {e}")
+
+    def warm_up(self, count: Optional[int] = None) -> None:
+        """
+        预先启动浏览器
+
+        Args:
+            count: 预启动的数量，默认填满整个池
+        """
+        count = min(count or self.size, self.size)
+        while not self.closed:
+            with self.lock:
+                if len(self.driver_stats) >= count:
+                    return
+                # 与acquire一样先占位，避免并发时超出上限
+                placeholder = object()
+                self.driver_stats[placeholder] = {'pages': 0, 'baseline_memory': None}
+            try:
+                driver = self._create_driver()
+            except Exception as e:
+                print(f"[浏览器池] 预启动浏览器失败: {e}")
+                return
+            finally:
+                with self.lock:
+                    self.driver_stats.pop(placeholder, None)
+            self.idle_drivers.put(driver)
+
+    def acquire(self, timeout: Optional[float] = None):
+        """
+        借用一个浏览器，池中没有空闲浏览器且未达上限时启动新的，否则等待归还
+
+        Args:
+            timeout: 等待空闲浏览器的最长时间（秒），None表示一直等待
+        """
+        if self.closed:
+            raise RuntimeError("浏览器池已关闭")
+
+        try:
+            return self.idle_drivers.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self.lock:
+            can_create = len(self.driver_stats) < self.size
+            if can_create:
+                # 先占位，避免并发时超出上限
+                placeholder = object()
+                self.driver_stats[placeholder] = {'pages': 0, 'baseline_memory': None}
+        if can_create:
+            try:
+                return self._create_driver()
+            finally:
+                with self.lock:
+                    self.driver_stats.pop(placeholder, None)
+
+        try:
+            return self.idle_drivers.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError("等待空闲浏览器超时")
+
+    def is_fresh(self, driver) -> bool:
+        """
+        浏览器是否为新启动的（还没有加载过页面）
+        """
+        with self.lock:
+            stats = self.driver_stats.get(driver)
+        return stats is not None and stats['pages'] == 0
+
+    @staticmethod
+    def _origin_of(url: str) -> Optional[str]:
+        """
+        网页URL的origin（scheme://host[:port]），about:blank等没有origin的返回None
+        """
+        parsed = urlparse(url or '')
+        if parsed.scheme not in ('http', 'https') or not parsed.netloc:
+            return None
+        return f"{parsed.scheme}://{parsed.netloc}"
+
+    @staticmethod
+    def _execute_cdp(driver, command: str, params: Dict[str, Any]) -> None:
+        """
+        执行一条CDP命令，失败只记录日志，不影响后续的清理步骤
+        """
+        try:
+            driver.execute_cdp_cmd(command, params)
+        except Exception as e:
+            print(f"[浏览器池] {command} 执行失败: {e}")
+
+    def _reset_driver(self, driver) -> None:
+        """
+        重置浏览器状态：关闭多余标签页、清除Cookie、访问过的网站的存储和缓存、清空性能日志
+        """
+        origins = set()
+        handles = driver.window_handles
+        for handle in reversed(handles):
+            driver.switch_to.window(handle)
+            origins.add(self._origin_of(driver.current_url))
+            if handle != handles[0]:
+                driver.close()
+        driver.switch_to.window(handles[0])
+        driver.get('about:blank')
+        origins.discard(None)
+        # Cookie和缓存对整个浏览器清除，localStorage、IndexedDB等存储只能按origin清除
+        self._execute_cdp(driver, 'Network.clearBrowserCookies', {})
+        for origin in origins:
+            self._execute_cdp(driver, 'Storage.clearDataForOrigin', {'origin': origin, 'storageTypes': 'all'})
+        self._execute_cdp(driver, 'Network.clearBrowserCache', {})
+        # 丢弃上一个页面遗留的性能日志
+        driver.get_log('performance')
+
+    def _should_recycle(self, driver) -> bool:
+        """
+        判断浏览器是否需要回收（页面数过多或内存增长过多）
+        """
+        with self.lock:
+            stats = self.driver_stats.get(driver)
+        if stats is None:
+            return True
+        if stats['pages'] >= self.max_pages:
+            print(f"[浏览器池] 浏览器已加载 {stats['pages']} 个页面，回收")
+            return True
+        current_memory = self._get_memory_mb(driver)
+        if current_memory is not None and stats['baseline_memory'] is not None:
+            if current_memory - stats['baseline_memory'] > self.max_memory_growth_mb:
+                print(f"[浏览器池] 浏览器内存增长到 {current_memory:.0f}MB，回收")
+                return True
+        return False
+
+    def release(self, driver, discard: bool = False) -> None:
+        """
+        归还浏览器
+
+        Args:
+            driver: 借用的浏览器
+            discard: 为True时直接退出该浏览器（如页面加载异常）
+        """
+        with self.lock:
+            if driver in self.driver_stats:
+                self.driver_stats[driver]['pages'] += 1
+
+        if self.closed or discard or self._should_recycle(driver):
+            self._quit_driver(driver)
+            return
+
+        try:
+            self._reset_driver(driver)
+        except Exception as e:
+            print(f"[浏览器池] 重置浏览器失败，丢弃: {e}")
+            self._quit_driver(driver)
+            return
+        self.idle_drivers.put(driver)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        获取浏览器池状态
+        """
+        with self.lock:
+            return {
+                'total': len(self.driver_stats),
+                'idle': self.idle_drivers.qsize(),
+                'pages': [stats['pages'] for stats in self.driver_stats.values()],
+                'launch_times': [stats['launch_time'] for stats in self.driver_stats.values() if 'launch_time' in stats]
+            }
+
+    def close(self) -> None:
+        """
+        关闭浏览器池中的所有浏览器
+        """
+        self.closed = True
+        while True:
+            try:
+                driver = self.idle_drivers.get_nowait()
+            except queue.Empty:
+                break
+            self._quit_driver(driver)
+        # 正在使用中的浏览器在归还时退出
+        print("[浏览器池] 已关闭")
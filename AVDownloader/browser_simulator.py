@@ -1,8 +1,13 @@
 import requests
 import re
+import os
+import json
 import time
+import queue
+import shutil
+import tempfile
+import threading
 from typing import List, Dict, Optional, Any
-from bs4 import BeautifulSoup
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
@@ -10,9 +15,183 @@ from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.chrome.options import Options
 from selenium.common.exceptions import TimeoutException, WebDriverException
+from perf_log_processor import PerformanceLogProcessor
+from resource_registry import VideoResourceRegistry
+from content_scanner import content_scanner
+
+# 按资源类型屏蔽的URL模式（Network.setBlockedURLs只支持URL通配符，按扩展名对应资源类型）
+RESOURCE_TYPE_PATTERNS = {
+    'image': ['png', 'jpg', 'jpeg', 'gif', 'webp', 'svg', 'ico', 'bmp'],
+    'font': ['woff', 'woff2', 'ttf', 'otf', 'eot'],
+    'stylesheet': ['css'],
+    'media': ['mp4', 'webm', 'mp3', 'ts', 'm4s']
+}
+
+# 默认屏蔽的资源类型（探测视频链接只需要脚本和XHR请求）
+DEFAULT_BLOCKED_RESOURCE_TYPES = ['image', 'font', 'stylesheet']
+
+# 默认屏蔽的统计和广告域名
+DEFAULT_BLOCKED_URL_PATTERNS = [
+    '*cloudflareinsights.com*',
+    '*google-analytics.com*',
+    '*googletagmanager.com*',
+    '*googlesyndication.com*',
+    '*doubleclick.net*',
+    '*bdimg.com*',
+    '*hm.baidu.com*',
+    '*cnzz.com*'
+]
+
+def build_blocked_url_patterns(resource_types: Optional[List[str]] = None,
+                               url_patterns: Optional[List[str]] = None) -> List[str]:
+    """
+    生成Network.setBlockedURLs使用的URL模式列表
+    
+    Args:
+        resource_types: 需要屏蔽的资源类型（RESOURCE_TYPE_PATTERNS中的键）
+        url_patterns: 额外屏蔽的URL通配符模式
+    """
+    patterns = []
+    for resource_type in resource_types or []:
+        for ext in RESOURCE_TYPE_PATTERNS.get(resource_type, []):
+            # 同时匹配带查询参数的URL
+            patterns.append(f'*.{ext}')
+            patterns.append(f'*.{ext}?*')
+    patterns.extend(url_patterns or [])
+    return patterns
+
+# 加快Chrome启动的参数：不加载扩展，跳过首次运行向导、组件更新、同步等后台任务
+FAST_LAUNCH_ARGUMENTS = [
+    '--disable-extensions',
+    '--disable-component-extensions-with-background-pages',
+    '--disable-background-networking',
+    '--disable-component-update',
+    '--disable-default-apps',
+    '--disable-sync',
+    '--disable-client-side-phishing-detection',
+    '--disable-features=Translate,OptimizationHints,MediaRouter',
+    '--no-first-run',
+    '--no-default-browser-check',
+    '--metrics-recording-only',
+    '--password-store=basic',
+    '--mute-audio'
+]
+
+# 复制用户数据目录模板时跳过的文件（进程锁、崩溃报告和缓存）
+PROFILE_COPY_IGNORE = shutil.ignore_patterns(
+    'Singleton*', 'lockfile', 'Crashpad', 'Cache', 'Code Cache', 'GPUCache', 'ShaderCache', 'GrShaderCache'
+)
+
+# 防止多个线程同时初始化用户数据目录模板
+_profile_template_lock = threading.Lock()
+
+def _initialize_profile_template(template_dir: str) -> None:
+    """
+    启动一次Chrome完成首次运行的初始化，生成用户数据目录模板
+    先在临时目录中生成，完成后再改名，避免使用初始化到一半的模板
+    """
+    building_dir = template_dir + '.building'
+    shutil.rmtree(building_dir, ignore_errors=True)
+    os.makedirs(os.path.dirname(os.path.abspath(template_dir)), exist_ok=True)
+    start = time.monotonic()
+    driver = create_chrome_driver(headless=True, user_data_dir=building_dir)
+    try:
+        driver.get('about:blank')
+    finally:
+        driver.quit()
+    os.replace(building_dir, template_dir)
+    print(f"浏览器用户数据目录模板初始化完成（用时 {time.monotonic() - start:.2f} 秒）: {template_dir}")
+
+def prepare_profile_dir(template_dir: str) -> str:
+    """
+    为一个Chrome实例准备用户数据目录：复制预先初始化好的模板（模板不存在时先生成）
+    Chrome会锁定正在使用的用户数据目录，所以每个实例使用独立的副本
+
+    Returns:
+        复制出的用户数据目录
+    """
+    with _profile_template_lock:
+        if not os.path.isdir(template_dir):
+            _initialize_profile_template(template_dir)
+    profile_dir = tempfile.mkdtemp(prefix='avdownloader_chrome_')
+    shutil.copytree(template_dir, profile_dir, ignore=PROFILE_COPY_IGNORE, dirs_exist_ok=True)
+    return profile_dir
+
+def create_chrome_driver(headless: bool = True, profile_template: Optional[str] = None,
+                         disable_images: bool = False, user_data_dir: Optional[str] = None) -> webdriver.Chrome:
+    """
+    创建Chrome浏览器驱动（启用性能日志以捕获网络请求）
+    
+    Args:
+        headless: 是否使用无头模式
+        profile_template: 用户数据目录模板，指定时复制一份使用，不必每次重新初始化用户数据目录
+        disable_images: 是否禁止加载和解码图片（探测视频链接不需要图片）
+        user_data_dir: 直接使用的用户数据目录（生成模板时使用）
+    """
+    chrome_options = Options()
+    if headless:
+        chrome_options.add_argument('--headless')
+    chrome_options.add_argument('--no-sandbox')
+    chrome_options.add_argument('--disable-dev-shm-usage')
+    chrome_options.add_argument('--disable-gpu')
+    chrome_options.add_argument('--window-size=1920,1080')
+    # 多标签页并行探测时，后台标签页不降低定时器和渲染优先级
+    chrome_options.add_argument('--disable-background-timer-throttling')
+    chrome_options.add_argument('--disable-renderer-backgrounding')
+    chrome_options.add_argument('--disable-backgrounding-occluded-windows')
+    for argument in FAST_LAUNCH_ARGUMENTS:
+        chrome_options.add_argument(argument)
+    chrome_options.add_argument('--user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36')
+    if disable_images:
+        chrome_options.add_argument('--blink-settings=imagesEnabled=false')
+        chrome_options.add_experimental_option('prefs', {'profile.managed_default_content_settings.images': 2})
+    
+    profile_dir = None
+    if user_data_dir is None and profile_template:
+        try:
+            profile_dir = user_data_dir = prepare_profile_dir(profile_template)
+        except Exception as e:
+            print(f"准备浏览器用户数据目录失败，使用临时目录: {e}")
+    if user_data_dir:
+        chrome_options.add_argument(f'--user-data-dir={user_data_dir}')
+    
+    # 启用性能日志以捕获网络请求
+    chrome_options.set_capability('goog:loggingPrefs', {'performance': 'ALL'})
+    # driver.get()立即返回，由load_page自行决定等待页面加载到什么程度
+    chrome_options.page_load_strategy = 'none'
+    
+    try:
+        driver = webdriver.Chrome(options=chrome_options)
+    except Exception:
+        if profile_dir:
+            shutil.rmtree(profile_dir, ignore_errors=True)
+        raise
+    # 复制出的用户数据目录在退出浏览器时删除（见quit_chrome_driver）
+    driver.profile_dir = profile_dir
+    return driver
+
+def quit_chrome_driver(driver: webdriver.Chrome) -> None:
+    """
+    退出浏览器并删除为其复制的用户数据目录
+    """
+    try:
+        driver.quit()
+    finally:
+        profile_dir = getattr(driver, 'profile_dir', None)
+        if profile_dir:
+            shutil.rmtree(profile_dir, ignore_errors=True)
 
 class BrowserSimulator:
-    def __init__(self):
+    def __init__(self, pool=None):
+        """
+        初始化浏览器模拟器
+        
+        Args:
+            pool: 浏览器池，提供时从池中借用已启动的浏览器，关闭时归还而不是退出
+        """
+        self.pool = pool
+        # 借用的浏览器是否处于异常状态（如页面加载线程仍未结束），异常时不归还到池中
+        self.driver_tainted = False
         self.session = requests.Session()
         self.session.headers.update({
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
@@ -22,10 +201,35 @@ class BrowserSimulator:
             'Upgrade-Insecure-Requests': '1',
             'Cache-Control': 'max-age=0'
         })
-        self.video_resources = []
+        # 请求屏蔽：加载页面时不下载图片、字体、样式表以及统计和广告请求
+        self.block_requests = True
+        self.blocked_resource_types = list(DEFAULT_BLOCKED_RESOURCE_TYPES)
+        self.blocked_url_patterns = list(DEFAULT_BLOCKED_URL_PATTERNS)
+        # 视频资源登记表（按规范化URL去重并合并来源）
+        self.resource_registry = VideoResourceRegistry()
         self.network_requests = []
+        # 已捕获的请求URL（分批处理性能日志时跨批次去重）
+        self.captured_requests = set()
+        # 性能日志增量处理器（只解析需要的事件）
+        self.log_processor = PerformanceLogProcessor()
+        # 完整加载模式：页面加载期间读取性能日志的间隔（秒）
+        self.log_drain_interval = 0.5
         self.page_content = ''
         self.driver = None
+        # 不使用浏览器池时的启动配置：用户数据目录模板、是否禁止加载图片
+        self.profile_template = None
+        self.disable_images = True
+        # 耗时统计（秒）：driver_start 获取浏览器、cold_start 是否新启动的浏览器、
+        # first_navigation 从开始导航到收到页面第一个字节、capture 处理性能日志和提取视频资源
+        self.timings = {}
+        # 提前结束模式：发现可用视频链接后再等待的宽限时间（秒）
+        self.early_exit_grace = 1.0
+        # 提前结束模式：最长等待时间（秒）
+        self.early_exit_deadline = 20
+        # 提前结束模式：读取性能日志的间隔（秒）
+        self.log_poll_interval = 0.1
+        # 提前结束模式：从开始导航到发现可用视频链接的时间（秒），没有发现时为None
+        self.candidate_latency = None
         # 视频文件扩展名
         self.video_extensions = {
             'mp4', 'avi', 'mov', 'wmv', 'flv', 'mkv', 'webm', 
@@ -34,32 +238,86 @@ class BrowserSimulator:
         # 视频链接正则表达式（更精确，避免匹配脚本文件）
         self.video_url_pattern = re.compile(r'https?://[^\s"\']+\.(mp4|avi|mov|wmv|flv|mkv|webm|m3u8|ts|m4v|f4v)(?!\.js)(?!\.css)(?!\.html)(?!\.php)', re.IGNORECASE)
     
+    @property
+    def video_resources(self) -> List[Dict[str, Any]]:
+        """
+        已发现的视频资源（按发现顺序）
+        """
+        return self.resource_registry.to_list()
+    
+    @video_resources.setter
+    def video_resources(self, resources: List[Dict[str, Any]]) -> None:
+        self.resource_registry.clear()
+        self.resource_registry.add_all(resources)
+    
     def init_browser(self, headless: bool = True) -> None:
         """
         初始化浏览器模拟器
         """
         try:
-            chrome_options = Options()
-            if headless:
-                chrome_options.add_argument('--headless')
-            chrome_options.add_argument('--no-sandbox')
-            chrome_options.add_argument('--disable-dev-shm-usage')
-            chrome_options.add_argument('--disable-gpu')
-            chrome_options.add_argument('--window-size=1920,1080')
-            chrome_options.add_argument('--user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36')
-            
-            # 启用性能日志以捕获网络请求
-            chrome_options.set_capability('goog:loggingPrefs', {'performance': 'ALL'})
-            
-            self.driver = webdriver.Chrome(options=chrome_options)
-            print("浏览器初始化成功")
+            if self.driver:
+                return
+            start = time.monotonic()
+            if self.pool:
+                # 从浏览器池借用已启动的浏览器
+                self.driver = self.pool.acquire()
+                self.driver_tainted = False
+                cold_start = self.pool.is_fresh(self.driver)
+                print("已从浏览器池获取浏览器")
+            else:
+                self.driver = create_chrome_driver(headless, self.profile_template, self.disable_images)
+                cold_start = True
+                print("浏览器初始化成功")
+            self._apply_request_blocking()
+            self.timings = {'driver_start': time.monotonic() - start, 'cold_start': cold_start}
         except Exception as e:
             print(f"浏览器初始化失败: {e}")
             raise
     
-    def load_page(self, url: str, timeout: int = 60) -> bool:
+    def set_request_blocking(self, enabled: bool, resource_types: Optional[List[str]] = None,
+                             url_patterns: Optional[List[str]] = None) -> None:
+        """
+        设置请求屏蔽
+        
+        Args:
+            enabled: 是否启用请求屏蔽
+            resource_types: 屏蔽的资源类型（image、font、stylesheet、media），None表示保持不变
+            url_patterns: 屏蔽的URL通配符模式，None表示保持不变
+        """
+        self.block_requests = enabled
+        if resource_types is not None:
+            self.blocked_resource_types = list(resource_types)
+        if url_patterns is not None:
+            self.blocked_url_patterns = list(url_patterns)
+        if self.driver:
+            self._apply_request_blocking()
+    
+    def _apply_request_blocking(self) -> None:
+        """
+        通过CDP把屏蔽列表下发给浏览器（池中复用的浏览器可能带有上一次的设置，禁用时同样需要清空）
+        """
+        patterns = []
+        if self.block_requests:
+            patterns = build_blocked_url_patterns(self.blocked_resource_types, self.blocked_url_patterns)
+        try:
+            self.driver.execute_cdp_cmd('Network.enable', {})
+            self.driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': patterns})
+            if patterns:
+                print(f"已启用请求屏蔽，共 {len(patterns)} 条规则")
+        except Exception as e:
+            print(f"设置请求屏蔽失败: {e}")
+    
+    def load_page(self, url: str, timeout: int = 60, early_exit: bool = False,
+                  grace_window: Optional[float] = None, deadline: Optional[float] = None) -> bool:
         """
         加载网页
+        
+        Args:
+            url: 页面URL
+            timeout: 页面加载超时时间（秒）
+            early_exit: 为True时边加载边处理网络事件，发现可用视频链接后不再等待页面加载完成
+            grace_window: 提前结束模式下发现可用视频链接后再等待的时间（秒），默认使用early_exit_grace
+            deadline: 提前结束模式下的最长等待时间（秒），默认使用early_exit_deadline
         """
         try:
             if not self.driver:
@@ -67,6 +325,15 @@ class BrowserSimulator:
             
             print(f"\n=== 开始加载页面 ===")
             print(f"URL: {url}")
+            self.timings['first_navigation'] = None
+            self.timings['capture'] = 0.0
+            
+            if early_exit:
+                if grace_window is None:
+                    grace_window = self.early_exit_grace
+                if deadline is None:
+                    deadline = min(self.early_exit_deadline, timeout)
+                return self._load_page_until_candidate(url, grace_window, deadline)
             
             # 使用线程加载页面，避免长时间阻塞
             import threading
@@ -86,6 +353,8 @@ class BrowserSimulator:
                             EC.presence_of_element_located((By.TAG_NAME, "body"))
                         )
                         print("页面主体加载完成")
+                        # 页面加载策略为none，需要自行等待页面加载完成
+                        WebDriverWait(self.driver, timeout).until(lambda d: self._is_document_complete())
                     except TimeoutException:
                         print("页面加载超时，继续处理")
                     
@@ -114,8 +383,11 @@ class BrowserSimulator:
             load_thread.daemon = True
             load_thread.start()
             
-            # 等待线程完成，最多等待timeout秒
-            load_thread.join(timeout=timeout)
+            # 等待线程完成，最多等待timeout秒，等待期间分批处理性能日志
+            wait_start = time.monotonic()
+            while load_thread.is_alive() and time.monotonic() - wait_start < timeout:
+                load_thread.join(timeout=self.log_drain_interval)
+                self._drain_performance_log()
             
             if not page_loaded:
                 if load_error:
@@ -123,6 +395,8 @@ class BrowserSimulator:
                     return False
                 else:
                     print("页面加载超时，强制继续")
+                    # 加载线程可能仍在使用浏览器，关闭时不再归还到池中
+                    self.driver_tainted = True
                     # 即使超时，也尝试获取页面内容
                     try:
                         self.page_content = self.driver.page_source
@@ -131,27 +405,11 @@ class BrowserSimulator:
                         print(f"超时后获取页面内容失败: {e}")
                         self.page_content = ""
             
-            # 捕获网络请求（添加超时处理）
-            try:
-                import threading
-                
-                # 创建一个线程来执行网络请求捕获
-                def capture_network_requests_thread():
-                    try:
-                        self._capture_network_requests()
-                    except Exception as e:
-                        print(f"捕获网络请求失败: {e}")
-                
-                # 启动线程
-                capture_thread = threading.Thread(target=capture_network_requests_thread)
-                capture_thread.daemon = True
-                capture_thread.start()
-                
-                # 等待线程完成，最多等待10秒
-                capture_thread.join(timeout=10)
-                
-            except Exception as e:
-                print(f"启动网络请求捕获线程失败: {e}")
+            if page_loaded:
+                self.timings['first_navigation'] = self._read_navigation_timing()
+            
+            # 处理剩余的网络请求（加载期间已分批处理，剩下的日志很少）
+            self._capture_network_requests()
             
             # 提取视频资源（添加超时处理）
             try:
@@ -181,87 +439,388 @@ class BrowserSimulator:
         except Exception as e:
             print(f"加载页面失败: {e}")
             # 确保浏览器不会因为异常而卡死
+            self.driver_tainted = True
             try:
-                if self.driver:
-                    self.driver.quit()
-                    self.driver = None
+                self.close()
             except:
                 pass
             return False
     
-    def _capture_network_requests(self) -> None:
+    def _read_navigation_timing(self) -> Optional[float]:
         """
-        捕获网络请求
+        读取当前页面从开始导航到收到第一个字节的时间（秒），无法获取时返回None
         """
         try:
-            print(f"\n=== 开始捕获网络请求 ===")
-            
-            # 获取性能日志
-            logs = self.driver.get_log('performance')
-            print(f"获取到 {len(logs)} 条性能日志")
-            
-            captured_requests = set()
-            # 使用集合跟踪已添加的视频URL，提高性能
-            video_urls_set = set(v['url'] for v in self.video_resources)
+            elapsed = self.driver.execute_script(
+                'var t = performance.timing;'
+                'return t.responseStart > 0 ? t.responseStart - t.navigationStart : null;'
+            )
+        except Exception:
+            return None
+        return elapsed / 1000 if isinstance(elapsed, (int, float)) else None
+    
+    def _is_document_complete(self) -> bool:
+        """
+        页面是否已加载完成（document.readyState为complete）
+        """
+        try:
+            return self.driver.execute_script('return document.readyState') == 'complete'
+        except Exception:
+            return False
+    
+    @staticmethod
+    def has_usable_candidate(videos: List[Dict[str, Any]]) -> bool:
+        """
+        判断视频资源是否可以直接下载：包含getmovie链接，或者只有唯一的m3u8文件
+        """
+        urls = [v.get('url', '').lower() for v in videos]
+        if any('getmovie' in u for u in urls):
+            return True
+        return len([u for u in urls if u.endswith('.m3u8')]) == 1
+    
+    def _load_page_until_candidate(self, url: str, grace_window: float, deadline: float) -> bool:
+        """
+        边加载页面边处理网络请求事件，发现可用的视频链接（getmovie或唯一的m3u8）并等待宽限时间后立即结束，
+        不必等待整个页面加载完成；页面加载完成但仍没有可用链接时同样再等待宽限时间，最长等待deadline秒
+        """
+        # 丢弃导航之前遗留的性能日志
+        self.driver.get_log('performance')
+        start = time.monotonic()
+        # 页面加载策略为none，导航后立即返回
+        self.driver.get(url)
+        
+        candidate_time = None
+        complete_time = None
+        self.candidate_latency = None
+        while True:
+            self._drain_performance_log()
+            now = time.monotonic()
             
-            # 计数器
-            video_count = 0
-            resource_count = 0
+            if candidate_time is None and self.has_usable_candidate(self.video_resources):
+                candidate_time = now
+                self.candidate_latency = now - start
+                print(f"发现可用视频链接，用时 {self.candidate_latency:.2f} 秒")
+            if candidate_time is None and complete_time is None and self._is_document_complete():
+                complete_time = now
+                print(f"页面加载完成，用时 {now - start:.2f} 秒")
             
-            for entry in logs:
-                try:
-                    message = entry.get('message', '{}')
-                    import json
-                    data = json.loads(message)
+            if candidate_time is not None and now - candidate_time >= grace_window:
+                break
+            if complete_time is not None and now - complete_time >= grace_window:
+                break
+            if now - start >= deadline:
+                print(f"超过最长等待时间 {deadline} 秒，停止等待")
+                break
+            time.sleep(self.log_poll_interval)
+        
+        self.timings['first_navigation'] = self._read_navigation_timing()
+        # 停止加载剩余资源
+        try:
+            self.driver.execute_script('window.stop();')
+        except Exception as e:
+            print(f"停止页面加载失败: {e}")
+        self._drain_performance_log()
+        
+        self.page_content = self.driver.page_source
+        print(f"页面内容大小: {len(self.page_content)} 字节")
+        self.network_requests.append({
+            'url': url,
+            'method': 'GET',
+            'headers': {'User-Agent': 'Selenium WebDriver'},
+            'timestamp': 0
+        })
+        
+        self._extract_video_resources(url)
+        print(f"=== 页面加载完成（用时 {time.monotonic() - start:.2f} 秒） ===")
+        return True
+    
+    @staticmethod
+    def _target_id(handle: str) -> str:
+        """
+        窗口句柄对应的标签页target id（性能日志中的webview字段）
+        """
+        return handle[len('CDwindow-'):] if handle.startswith('CDwindow-') else handle
+    
+    def _start_tab(self, slot: Dict[str, Any], url: str) -> None:
+        """
+        在标签页中开始加载URL（页面加载策略为none，导航后立即返回）
+        """
+        state = BrowserSimulator()
+        state.early_exit_grace = self.early_exit_grace
+        slot.update({
+            'url': url,
+            'state': state,
+            'start': time.monotonic(),
+            'candidate_time': None,
+            'complete_time': None
+        })
+        print(f"  [标签页] 开始加载: {url}")
+        self.driver.switch_to.window(slot['handle'])
+        self.driver.get(url)
+    
+    def _finish_tab(self, slot: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        结束标签页中的页面探测，获取页面内容并提取视频资源
+        """
+        url = slot['url']
+        state = slot['state']
+        result = {'videos': [], 'page_content': '', 'candidate_latency': state.candidate_latency, 'error': None}
+        try:
+            self.driver.switch_to.window(slot['handle'])
+            state.timings['first_navigation'] = self._read_navigation_timing()
+            try:
+                self.driver.execute_script('window.stop();')
+            except Exception as e:
+                print(f"  [标签页] 停止页面加载失败: {e}")
+            state.page_content = self.driver.page_source
+            state._extract_video_resources(url)
+            result['videos'] = list(state.video_resources)
+            result['page_content'] = state.page_content
+        except Exception as e:
+            result['error'] = f"获取页面内容失败: {e}"
+        result['timings'] = dict(state.timings)
+        print(f"  [标签页] 探测完成（{time.monotonic() - slot['start']:.2f} 秒，{len(result['videos'])} 个资源）: {url}")
+        slot['url'] = None
+        slot['state'] = None
+        return result
+    
+    def detect_in_tabs(self, urls, tabs: int = 4, grace_window: Optional[float] = None,
+                       deadline: Optional[float] = None, on_result=None, should_stop=None) -> Dict[str, Dict[str, Any]]:
+        """
+        在同一个浏览器的多个标签页中并行探测多个页面
+        所有标签页共享一份性能日志，按日志中的webview字段把网络事件分配给对应的标签页；
+        每个标签页发现可用视频链接（或页面加载完成）并等待宽限时间后，立即加载下一个URL
+        
+        Args:
+            urls: URL列表，或queue.Queue（放入None表示没有更多URL）
+            tabs: 同时使用的标签页数量
+            grace_window: 发现可用视频链接后再等待的时间（秒），默认使用early_exit_grace
+            deadline: 单个页面的最长等待时间（秒），默认使用early_exit_deadline
+            on_result: 单个页面探测完成时的回调 on_result(url, result)
+            should_stop: 可选的停止检查函数，返回True时放弃剩余的URL
+        
+        Returns:
+            {url: {'videos': 视频资源列表, 'page_content': 页面内容, 'candidate_latency': 发现时间, 'error': 失败原因}}
+        """
+        if grace_window is None:
+            grace_window = self.early_exit_grace
+        if deadline is None:
+            deadline = self.early_exit_deadline
+        if not self.driver:
+            self.init_browser()
+        
+        if isinstance(urls, queue.Queue):
+            source = urls
+        else:
+            source = queue.Queue()
+            for url in urls:
+                source.put(url)
+            source.put(None)
+        
+        main_handle = self.driver.current_window_handle
+        handles = [main_handle]
+        for _ in range(max(1, tabs) - 1):
+            self.driver.switch_to.new_window('tab')
+            handles.append(self.driver.current_window_handle)
+        slots = {self._target_id(handle): {'handle': handle, 'url': None, 'state': None} for handle in handles}
+        print(f"已打开 {len(handles)} 个标签页用于并行探测")
+        
+        # 丢弃之前遗留的性能日志
+        self.driver.get_log('performance')
+        log_processor = PerformanceLogProcessor(track_load_event=True)
+        results = {}
+        source_done = False
+        try:
+            while True:
+                if should_stop and should_stop():
+                    print("并行探测已停止")
+                    break
+                
+                # 给空闲的标签页分配URL
+                for slot in slots.values():
+                    if slot['url'] is not None or source_done:
+                        continue
+                    try:
+                        url = source.get_nowait()
+                    except queue.Empty:
+                        break
+                    if url is None:
+                        source_done = True
+                        break
+                    try:
+                        self._start_tab(slot, url)
+                    except Exception as e:
+                        results[url] = {'videos': [], 'page_content': '', 'candidate_latency': None,
+                                        'error': f"页面加载失败: {e}"}
+                        slot['url'] = None
+                        if on_result:
+                            on_result(url, results[url])
+                
+                active = [slot for slot in slots.values() if slot['url'] is not None]
+                if not active:
+                    if source_done:
+                        break
+                    time.sleep(self.log_poll_interval)
+                    continue
+                
+                # 把网络事件分配给对应的标签页
+                now = time.monotonic()
+                for event in log_processor.drain(self.driver):
+                    slot = slots.get(event['webview'])
+                    if slot is None and len(active) == 1:
+                        slot = active[0]
+                    if slot is None or slot['url'] is None:
+                        continue
+                    if event['method'] == PerformanceLogProcessor.LOAD_EVENT_FIRED:
+                        if slot['complete_time'] is None:
+                            slot['complete_time'] = now
+                        continue
+                    slot['state']._process_network_event(event)
+                
+                # 检查各标签页是否可以结束
+                for slot in active:
+                    state = slot['state']
+                    if slot['candidate_time'] is None and self.has_usable_candidate(state.video_resources):
+                        slot['candidate_time'] = now
+                        state.candidate_latency = now - slot['start']
+                    
+                    finished = now - slot['start'] >= deadline
+                    if slot['candidate_time'] is not None:
+                        finished = finished or now - slot['candidate_time'] >= grace_window
+                    elif slot['complete_time'] is not None:
+                        finished = finished or now - slot['complete_time'] >= grace_window
                     
-                    # 检查网络请求
-                    if 'Network' in data.get('message', {}).get('method', ''):
-                        method = data['message']['method']
-                        
-                        # 捕获请求发送
-                        if method == 'Network.requestWillBeSent':
-                            request_data = data['message']['params']['request']
-                            request_url = request_data.get('url', '')
-                            
-                            if request_url and request_url not in captured_requests:
-                                captured_requests.add(request_url)
-                                resource_count += 1
-                                
-                                # 检查是否为视频资源
-                                if self._is_video_url(request_url):
-                                    video_count += 1
-                                    # 只打印视频请求，减少控制台输出
-                                    print(f"  发现视频请求: {request_url}")
-                                    
-                                    if request_url not in video_urls_set:
-                                        video_urls_set.add(request_url)
-                                        self.video_resources.append({
-                                            'url': request_url,
-                                            'type': 'network',
-                                            'source': 'network',
-                                            'content_type': 'video/mp4',
-                                            'status': 200,
-                                            'timestamp': 0
-                                        })
-                                
-                                # 记录网络请求
-                                self.network_requests.append({
-                                    'url': request_url,
-                                    'method': request_data.get('method', 'GET'),
-                                    'headers': request_data.get('headers', {}),
-                                    'timestamp': 0
-                                })
+                    if finished:
+                        url = slot['url']
+                        results[url] = self._finish_tab(slot)
+                        if on_result:
+                            on_result(url, results[url])
                 
+                time.sleep(self.log_poll_interval)
+        finally:
+            # 关闭多余的标签页，回到原来的标签页
+            for handle in handles[1:]:
+                try:
+                    self.driver.switch_to.window(handle)
+                    self.driver.close()
                 except Exception as e:
-                    continue
+                    print(f"关闭标签页失败: {e}")
+            try:
+                self.driver.switch_to.window(main_handle)
+            except Exception as e:
+                print(f"切换回原标签页失败: {e}")
+                self.driver_tainted = True
+        
+        return results
+    
+    def _capture_network_requests(self) -> None:
+        """
+        捕获网络请求（处理尚未读取的性能日志）
+        """
+        try:
+            print(f"\n=== 开始捕获网络请求 ===")
+            
+            self._drain_performance_log()
             
-            print(f"捕获到 {len(captured_requests)} 个唯一请求")
-            print(f"识别出 {video_count} 个视频资源")
+            stats = self.log_processor.get_stats()
+            print(f"共 {stats['total']} 条性能日志，解析了其中 {stats['parsed']} 条")
+            print(f"捕获到 {len(self.captured_requests)} 个唯一请求")
+            print(f"识别出 {len(self.video_resources)} 个视频资源")
             print(f"=== 网络请求捕获完成 ===")
             
         except Exception as e:
             print(f"捕获网络请求失败: {e}")
     
+    def _drain_performance_log(self) -> int:
+        """
+        读取并处理浏览器中尚未读取的性能日志
+        
+        Returns:
+            本批新识别出的视频资源数量
+        """
+        start = time.monotonic()
+        try:
+            return self._process_log_entries(self.driver.get_log('performance'))
+        except Exception as e:
+            print(f"读取性能日志失败: {e}")
+            return 0
+        finally:
+            self.timings['capture'] = self.timings.get('capture', 0.0) + time.monotonic() - start
+    
+    def _process_log_entries(self, logs: List[Dict[str, Any]]) -> int:
+        """
+        处理一批性能日志，记录网络请求并识别视频资源
+        
+        Returns:
+            本批新识别出的视频资源数量
+        """
+        video_count = 0
+        for event in self.log_processor.process(logs):
+            video_count += self._process_network_event(event)
+        return video_count
+    
+    def _process_network_event(self, event: Dict[str, Any]) -> int:
+        """
+        处理单个网络事件（PerformanceLogProcessor精简后的requestWillBeSent / responseReceived事件）
+        
+        Args:
+            event: 精简后的网络事件
+        
+        Returns:
+            新识别出的视频资源数量（0或1）
+        """
+        method = event['method']
+        
+        # 捕获请求发送
+        if method == PerformanceLogProcessor.REQUEST_WILL_BE_SENT:
+            request_url = event['url']
+            if not request_url or request_url in self.captured_requests:
+                return 0
+            self.captured_requests.add(request_url)
+            
+            # 记录网络请求（只保留请求头以外的必要字段）
+            request_record = {
+                'url': request_url,
+                'method': event['http_method'],
+                'type': event['resource_type'],
+                'timestamp': 0
+            }
+            self.network_requests.append(request_record)
+            
+            # 检查是否为视频资源
+            if self._is_video_url(request_url):
+                # 视频请求保留请求头，下载时可能需要Referer等信息
+                request_record['headers'] = event['headers']
+                # 只打印视频请求，减少控制台输出
+                print(f"  发现视频请求: {request_url}")
+                
+                if self.resource_registry.add({
+                    'url': request_url,
+                    'type': 'network',
+                    'source': 'network',
+                    'content_type': 'video/mp4',
+                    'status': 200,
+                    'timestamp': 0
+                }):
+                    return 1
+        
+        # 捕获响应：URL中没有m3u8关键词但返回HLS播放列表的请求
+        elif method == PerformanceLogProcessor.RESPONSE_RECEIVED:
+            response_url = event['url']
+            if 'mpegurl' in event['mime_type'] and response_url and response_url not in self.resource_registry:
+                print(f"  发现HLS播放列表响应: {response_url}")
+                self.resource_registry.add({
+                    'url': response_url,
+                    'type': 'network',
+                    'source': 'network',
+                    'content_type': 'application/x-mpegURL',
+                    'status': event['status'],
+                    'timestamp': 0
+                })
+                return 1
+        
+        return 0
+    
     def _is_video_url(self, url: str) -> bool:
         """
         检查URL是否为视频资源（检查m3u8、key和getmovie关键词）
@@ -282,210 +841,81 @@ class BrowserSimulator:
         
         return False
     
+    # 扫描结果类型对应的资源字段
+    SCAN_RESOURCE_FIELDS = {
+        'video_tag': ('video_tag', 'html', 'video/mp4', '从video标签提取'),
+        'source_tag': ('source_tag', 'html', 'video/mp4', '从source标签提取'),
+        'iframe': ('iframe', 'html', 'text/html', '从iframe标签提取'),
+        'json': ('json', 'html', 'application/x-mpegURL', '从JSON提取M3U8链接')
+    }
+    
+    # 页面中URL的关键词对应的内容类型
+    KEYWORD_CONTENT_TYPES = {
+        'm3u8': ('application/x-mpegURL', '从JavaScript提取M3U8链接'),
+        'key': ('application/octet-stream', '从JavaScript提取key链接'),
+        'getmovie': ('application/json', '从JavaScript提取getmovie链接')
+    }
+    
     def _extract_video_resources(self, base_url: str) -> None:
         """
-        从页面内容中提取视频资源（只提取m3u8和key关键词）
+        从页面内容中提取视频资源（只提取m3u8、key和getmovie关键词）
+        使用共享的页面扫描器一次扫描标签、页面中的URL和getmovie JSON数据
         """
+        start = time.monotonic()
         try:
-            soup = BeautifulSoup(self.page_content, 'html.parser')
-            
-            # 提取video标签（只保留包含m3u8、key或getmovie的链接）
-            for video_tag in soup.find_all('video'):
-                if video_tag.get('src'):
-                    video_url = video_tag['src']
-                    if not video_url.startswith('http'):
-                        from urllib.parse import urljoin
-                        video_url = urljoin(base_url, video_url)
-                    
-                    # 只保留包含m3u8、key或getmovie的链接
-                    if 'm3u8' in video_url.lower() or 'key' in video_url.lower() or 'getmovie' in video_url.lower():
-                        if not any(v['url'] == video_url for v in self.video_resources):
-                            self.video_resources.append({
-                                'url': video_url,
-                                'type': 'video_tag',
-                                'source': 'html',
-                                'content_type': 'video/mp4',
-                                'status': 200,
-                                'timestamp': 0
-                            })
-                            print(f"  从video标签提取: {video_url}")
-                
-                # 提取source标签（只保留包含m3u8、key或getmovie的链接）
-                for source_tag in video_tag.find_all('source'):
-                    if source_tag.get('src'):
-                        video_url = source_tag['src']
-                        if not video_url.startswith('http'):
-                            from urllib.parse import urljoin
-                            video_url = urljoin(base_url, video_url)
-                        
-                        # 只保留包含m3u8、key或getmovie的链接
-                        if 'm3u8' in video_url.lower() or 'key' in video_url.lower() or 'getmovie' in video_url.lower():
-                            if not any(v['url'] == video_url for v in self.video_resources):
-                                self.video_resources.append({
-                                    'url': video_url,
-                                    'type': 'source_tag',
-                                    'source': 'html',
-                                    'content_type': source_tag.get('type', 'video/mp4'),
-                                    'status': 200,
-                                    'timestamp': 0
-                                })
-                                print(f"  从source标签提取: {video_url}")
-            
-            # 提取iframe标签（只保留包含m3u8、key或getmovie的链接）
-            for iframe_tag in soup.find_all('iframe'):
-                if iframe_tag.get('src'):
-                    iframe_url = iframe_tag['src']
-                    if not iframe_url.startswith('http'):
-                        from urllib.parse import urljoin
-                        iframe_url = urljoin(base_url, iframe_url)
-                    
+            for item in content_scanner.scan(self.page_content, base_url):
+                kind = item['kind']
+                if kind == 'url':
+                    resource_type, source = 'regex', 'html'
+                    content_type, label = self.KEYWORD_CONTENT_TYPES[item['keyword']]
+                else:
+                    resource_type, source, content_type, label = self.SCAN_RESOURCE_FIELDS[kind]
                     # 过滤掉明显不是视频的iframe（如脚本文件）
-                    if any(ext in iframe_url.lower() for ext in ['.js', '.css', '.html', '.php']):
+                    if kind == 'iframe' and any(ext in item['url'].lower() for ext in ['.js', '.css', '.html', '.php']):
                         continue
-                    
-                    # 只保留包含m3u8、key或getmovie的iframe
-                    if 'm3u8' in iframe_url.lower() or 'key' in iframe_url.lower() or 'getmovie' in iframe_url.lower():
-                        if not any(v['url'] == iframe_url for v in self.video_resources):
-                            self.video_resources.append({
-                                'url': iframe_url,
-                                'type': 'iframe',
-                                'source': 'html',
-                                'content_type': 'text/html',
-                                'status': 200,
-                                'timestamp': 0
-                            })
-                            print(f"  从iframe标签提取: {iframe_url}")
-            
-            # 从JavaScript中提取视频链接
-            self._extract_video_from_js(base_url)
+                
+                resource = {
+                    'url': item['url'],
+                    'type': resource_type,
+                    'source': source,
+                    'content_type': content_type,
+                    'status': 200,
+                    'timestamp': 0
+                }
+                if kind == 'json':
+                    resource['getmovie_data'] = item['data']
+                if self.resource_registry.add(resource):
+                    print(f"  {label}: {item['url']}")
             
-            # 过滤非视频资源
+            # 过滤非视频资源（登记表添加时已按规范化URL去重）
             self._filter_non_video_resources()
             
-            # 去重视频资源
-            self._deduplicate_video_resources()
-            
         except Exception as e:
             print(f"提取视频资源失败: {e}")
-    
-    def _extract_video_from_js(self, base_url: str) -> None:
-        """
-        从JavaScript代码中提取视频链接（提取m3u8、key和getmovie关键词）
-        """
-        try:
-            # 提取可能的M3U8播放列表
-            m3u8_pattern = re.compile(r'https?://[^\s"\']+[\w\-./?%&=]*m3u8[\w\-./?%&=]*', re.IGNORECASE)
-            for match in m3u8_pattern.finditer(self.page_content):
-                m3u8_url = match.group(0)
-                if not any(v['url'] == m3u8_url for v in self.video_resources):
-                    self.video_resources.append({
-                        'url': m3u8_url,
-                        'type': 'regex',
-                        'source': 'html',
-                        'content_type': 'application/x-mpegURL',
-                        'status': 200,
-                        'timestamp': 0
-                    })
-                    print(f"  从JavaScript提取M3U8链接: {m3u8_url}")
-            
-            # 提取可能的key文件
-            key_pattern = re.compile(r'https?://[^\s"\']+[\w\-./?%&=]*key[\w\-./?%&=]*', re.IGNORECASE)
-            for match in key_pattern.finditer(self.page_content):
-                key_url = match.group(0)
-                if not any(v['url'] == key_url for v in self.video_resources):
-                    self.video_resources.append({
-                        'url': key_url,
-                        'type': 'regex',
-                        'source': 'html',
-                        'content_type': 'application/octet-stream',
-                        'status': 200,
-                        'timestamp': 0
-                    })
-                    print(f"  从JavaScript提取key链接: {key_url}")
-            
-            # 提取可能的getmovie链接
-            getmovie_pattern = re.compile(r'https?://[^\s"\']+[\w\-./?%&=]*getmovie[\w\-./?%&=]*', re.IGNORECASE)
-            for match in getmovie_pattern.finditer(self.page_content):
-                getmovie_url = match.group(0)
-                if not any(v['url'] == getmovie_url for v in self.video_resources):
-                    self.video_resources.append({
-                        'url': getmovie_url,
-                        'type': 'regex',
-                        'source': 'html',
-                        'content_type': 'application/json',
-                        'status': 200,
-                        'timestamp': 0
-                    })
-                    print(f"  从JavaScript提取getmovie链接: {getmovie_url}")
-            
-            # 提取可能的JSON格式的getmovie数据
-            json_pattern = re.compile(r'\{[^\}]*getmovie[^\}]*\}', re.IGNORECASE)
-            for match in json_pattern.finditer(self.page_content):
-                try:
-                    json_str = match.group(0)
-                    import json
-                    json_data = json.loads(json_str)
-                    if 'm3u8' in json_data:
-                        m3u8_path = json_data['m3u8']
-                        if not m3u8_path.startswith('http'):
-                            m3u8_url = urljoin(base_url, m3u8_path)
-                        else:
-                            m3u8_url = m3u8_path
-                        if not any(v['url'] == m3u8_url for v in self.video_resources):
-                            self.video_resources.append({
-                                'url': m3u8_url,
-                                'type': 'json',
-                                'source': 'html',
-                                'content_type': 'application/x-mpegURL',
-                                'status': 200,
-                                'timestamp': 0,
-                                'getmovie_data': json_data
-                            })
-                            print(f"  从JSON提取M3U8链接: {m3u8_url}")
-                except Exception as e:
-                    print(f"  解析JSON失败: {e}")
-                    
-        except Exception as e:
-            print(f"从JavaScript提取视频链接失败: {e}")
+        finally:
+            self.timings['capture'] = self.timings.get('capture', 0.0) + time.monotonic() - start
     
     def _filter_non_video_resources(self) -> None:
         """
         过滤非视频资源
         """
-        filtered_resources = []
-        
-        for resource in self.video_resources:
-            url = resource.get('url', '')
+        def is_video_resource(resource):
+            url_lower = resource.get('url', '').lower()
             
             # 过滤掉明显不是视频的资源
-            if any(ext in url.lower() for ext in ['.js', '.css', '.html', '.php', '.png', '.jpg', '.jpeg', '.gif', '.ico']):
-                continue
+            if any(ext in url_lower for ext in ['.js', '.css', '.html', '.php', '.png', '.jpg', '.jpeg', '.gif', '.ico']):
+                return False
             
             # 过滤掉常见的非视频域名
-            if any(domain in url.lower() for domain in ['cloudflareinsights.com', 'bdimg.com', 'google-analytics.com', 'googletagmanager.com']):
-                continue
+            if any(domain in url_lower for domain in ['cloudflareinsights.com', 'bdimg.com', 'google-analytics.com', 'googletagmanager.com']):
+                return False
             
-            # 只保留包含m3u8、key和getmovie关键词的文件
-            url_lower = url.lower()
+            # 只保留包含m3u8、key和getmovie关键词的文件，以及响应类型为HLS播放列表的请求
             if 'm3u8' in url_lower or 'key' in url_lower or 'getmovie' in url_lower:
-                filtered_resources.append(resource)
-        
-        self.video_resources = filtered_resources
-    
-    def _deduplicate_video_resources(self) -> None:
-        """
-        去重视频资源
-        """
-        seen_urls = set()
-        unique_resources = []
-        
-        for resource in self.video_resources:
-            url = resource.get('url', '')
-            if url and url not in seen_urls:
-                seen_urls.add(url)
-                unique_resources.append(resource)
+                return True
+            return resource.get('content_type') == 'application/x-mpegURL'
         
-        self.video_resources = unique_resources
+        self.resource_registry.keep_if(is_video_resource)
     
     def get_page_content(self) -> str:
         """
@@ -516,11 +946,16 @@ class BrowserSimulator:
     def close(self) -> None:
         """
         关闭浏览器模拟器
+        使用浏览器池时把浏览器归还到池中（异常的浏览器直接丢弃）
         """
         if self.driver:
             try:
-                self.driver.quit()
-                print("浏览器已关闭")
+                if self.pool:
+                    self.pool.release(self.driver, discard=self.driver_tainted)
+                    print("浏览器已归还到浏览器池")
+                else:
+                    quit_chrome_driver(self.driver)
+                    print("浏览器已关闭")
             except Exception as e:
                 print(f"关闭浏览器失败: {e}")
             finally:
@@ -530,9 +965,9 @@ class BrowserSimulator:
         """
         析构函数，确保浏览器进程被正确关闭
         """
-        if self.driver:
+        if getattr(self, 'driver', None):
             try:
-                self.driver.quit()
+                self.close()
                 print("浏览器已在析构时关闭")
             except Exception as e:
                 print(f"析构时关闭浏览器失败: {e}")
@@ -568,14 +1003,19 @@ class SyncBrowserSimulator:
     """
     同步版本的浏览器模拟器
     """
-    def __init__(self):
-        self.simulator = BrowserSimulator()
+    def __init__(self, pool=None):
+        self.simulator = BrowserSimulator(pool=pool)
     
     def init_browser(self, headless: bool = True) -> None:
         return self.simulator.init_browser(headless)
     
-    def load_page(self, url: str, timeout: int = 60) -> bool:
-        return self.simulator.load_page(url, timeout)
+    def load_page(self, url: str, timeout: int = 60, early_exit: bool = False,
+                  grace_window: Optional[float] = None, deadline: Optional[float] = None) -> bool:
+        return self.simulator.load_page(url, timeout, early_exit, grace_window, deadline)
+    
+    def detect_in_tabs(self, urls, tabs: int = 4, grace_window: Optional[float] = None,
+                       deadline: Optional[float] = None, on_result=None, should_stop=None) -> Dict[str, Dict[str, Any]]:
+        return self.simulator.detect_in_tabs(urls, tabs, grace_window, deadline, on_result, should_stop)
     
     def get_page_content(self) -> str:
         return self.simulator.get_page_content()
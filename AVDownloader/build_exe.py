@@ -45,10 +45,26 @@ def build_exe():
         "--add-data=video_downloader.py;.",  # 添加依赖模块
         "--add-data=video_detector.py;.",
         "--add-data=ts_merger.py;.",
+        "--add-data=download_pipeline.py;.",
+        "--add-data=history_store.py;.",
         "--add-data=browser_simulator.py;.",
         "--add-data=utils.py;.",
+        "--add-data=async_logger.py;.",
+        "--add-data=log_console.py;.",
+        "--add-data=event_bus.py;.",
+        "--add-data=control_api.py;.",
         "--add-data=decrypt_existing.py;.",
         "--add-data=download_state_manager.py;.",
+        "--add-data=segment_bitmap.py;.",
+        "--add-data=ad_segment_filter.py;.",
+        "--add-data=rate_limiter.py;.",
+        "--add-data=url_validator.py;.",
+        "--add-data=browser_pool.py;.",
+        "--add-data=tiered_detector.py;.",
+        "--add-data=perf_log_processor.py;.",
+        "--add-data=resource_registry.py;.",
+        "--add-data=content_scanner.py;.",
+        "--add-data=detection_cache.py;.",
 
         "--hidden-import=PyQt5",
         "--hidden-import=PyQt5.QtCore",
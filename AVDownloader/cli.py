@@ -0,0 +1,341 @@
+import os
+import sys
+import json
+import time
+import signal
+import hashlib
+import argparse
+import tempfile
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from utils import utils
+from download_state_manager import DownloadStateManager
+from history_store import HistoryStore
+
+# 全局变量
+ROOT_DIR = os.path.dirname(os.path.abspath(sys.argv[0]))
+RESOURCES_DIR = os.path.join(ROOT_DIR, "Resources")
+
+# 默认保存路径和临时目录（与界面版相同，非Windows系统使用当前目录和系统临时目录）
+DEFAULT_OUTPUT_DIR = r"C:\index" if os.name == 'nt' else os.path.join(os.getcwd(), "downloads")
+DEFAULT_TEMP_DIR = r"C:\index\temp" if os.name == 'nt' else os.path.join(tempfile.gettempdir(), "avdownloader")
+# 下载历史文件（与界面版共用）
+HISTORY_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "download_history.jsonl")
+
+
+class EventWriter:
+    """
+    以JSON Lines格式输出机器可读的事件（每行一个JSON对象，包含event和time字段）
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.lock = threading.Lock()
+
+    def emit(self, event: str, **fields) -> None:
+        record = {'event': event, 'time': round(time.time(), 3)}
+        record.update(fields)
+        line = json.dumps(record, ensure_ascii=False)
+        with self.lock:
+            self.stream.write(line + '\n')
+            self.stream.flush()
+
+
+def parse_shard(value: str) -> Tuple[int, int]:
+    """
+    解析分片参数 "i/n"（i从0开始），多台机器分别处理URL列表中的一部分
+    """
+    try:
+        index, count = (int(part) for part in value.split('/'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"分片格式应为 i/n: {value}")
+    if count < 1 or not 0 <= index < count:
+        raise argparse.ArgumentTypeError(f"分片序号超出范围: {value}")
+    return index, count
+
+
+def parse_workers(value: str) -> Dict[str, int]:
+    """
+    解析各阶段工作线程数 "detect=1,resolve=2,download=2,merge=1"
+    """
+    workers = {}
+    for part in value.split(','):
+        stage, _, count = part.partition('=')
+        stage = stage.strip()
+        if stage not in ('detect', 'resolve', 'download', 'merge') or not count.strip().isdigit():
+            raise argparse.ArgumentTypeError(f"无效的线程数设置: {part}")
+        workers[stage] = max(1, int(count))
+    return workers
+
+
+def in_shard(url: str, shard: Optional[Tuple[int, int]]) -> bool:
+    """
+    按规范化URL的哈希值判断URL是否属于当前分片（同一个URL在每台机器上的结果相同）
+    """
+    if shard is None:
+        return True
+    index, count = shard
+    digest = hashlib.md5(utils.canonicalize_url(url).encode('utf-8')).hexdigest()
+    return int(digest, 16) % count == index
+
+
+def read_urls(source: Optional[str]) -> List[str]:
+    """
+    读取URL列表（每行一个，忽略空行和#开头的注释），source为 - 时从标准输入读取
+    """
+    if source == '-':
+        lines = sys.stdin.read().splitlines()
+    else:
+        with open(source, 'r', encoding='utf-8') as f:
+            lines = f.read().splitlines()
+    return [line.strip() for line in lines if line.strip() and not line.strip().startswith('#')]
+
+
+def enqueue_urls(state_manager: DownloadStateManager, urls: List[str], shard, events: EventWriter, log) -> int:
+    """
+    把URL加入持久化的任务队列（状态为pending的任务）
+    已在队列中的URL不重复添加，之前失败的URL重新设为待处理
+
+    Returns:
+        新加入或重新加入队列的URL数量
+    """
+    accepted = []
+    for url in dict.fromkeys(urls):
+        if not utils.is_valid_url(url):
+            log(f"[无效URL] 跳过无效链接: {url}", "ERROR")
+            events.emit('invalid', url=url)
+        elif in_shard(url, shard):
+            accepted.append(url)
+    queued = state_manager.enqueue_urls(accepted)
+    for url, task_id in queued:
+        events.emit('queued', url=url, task_id=task_id)
+    return len(queued)
+
+
+def claim_jobs(state_manager: DownloadStateManager, stop_event: threading.Event, shard, stale_after: float,
+               daemon: bool, poll_interval: float, claimed: Dict[str, str], wakeup: Optional[threading.Event] = None):
+    """
+    从任务队列中逐个领取任务（生成器）
+    流水线的探测队列有空位时才领取下一个，多个进程共用同一个数据库时不会重复领取。
+    队列为空时：守护模式下等待新任务（wakeup被设置时立即检查），否则结束
+    """
+    while not stop_event.is_set():
+        job = None
+        for task in state_manager.get_pending_tasks():
+            task_id = task['id']
+            if task_id in claimed or not task.get('url') or not in_shard(task['url'], shard):
+                continue
+            if state_manager.claim_task(task_id, stale_after=stale_after):
+                claimed[task_id] = task['url']
+                job = {'url': task['url'], 'task_id': task_id}
+                break
+        if job is not None:
+            yield job
+        elif daemon:
+            if wakeup is not None:
+                wakeup.wait(poll_interval)
+                wakeup.clear()
+            else:
+                stop_event.wait(poll_interval)
+        else:
+            return
+
+
+def create_detector(args):
+    """
+    创建分级探测器（浏览器只在HTTP静态检测找不到视频时才启动）
+    """
+    from browser_pool import BrowserPool
+    from video_detector import VideoDetector
+    from tiered_detector import TieredDetector
+    from detection_cache import DetectionCache
+
+    browser_pool = BrowserPool(size=args.browsers, headless=True,
+                               profile_template=os.path.join(RESOURCES_DIR, "chrome_profile"))
+    detector = TieredDetector(
+        browser_pool=browser_pool,
+        detector=VideoDetector(),
+        memory_file=os.path.join(RESOURCES_DIR, "detection_tiers.json"),
+        cache=DetectionCache(os.path.join(RESOURCES_DIR, "detection_cache.json"))
+    )
+    return detector, browser_pool
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="AVDownloader 命令行版本：不依赖PyQt，从URL文件或标准输入读取网址，"
+                    "在标准输出以JSON Lines格式输出进度事件，日志输出到标准错误"
+    )
+    parser.add_argument('urls', nargs='?',
+                        help="URL列表文件（每行一个），- 表示从标准输入读取；省略时只处理队列中未完成的任务")
+    parser.add_argument('-o', '--output', default=DEFAULT_OUTPUT_DIR, help="视频保存路径")
+    parser.add_argument('--temp-dir', default=DEFAULT_TEMP_DIR, help="TS分片临时目录")
+    parser.add_argument('--state-db', default=None,
+                        help="任务队列数据库（默认与界面版共用Resources/download_state.db）")
+    parser.add_argument('--history', default=HISTORY_FILE,
+                        help="下载历史文件（默认与界面版共用），已下载过的网页和视频流直接跳过")
+    parser.add_argument('--ignore-history', action='store_true',
+                        help="不跳过下载历史中的网页和视频流（强制重新下载），下载成功后仍然记录到历史")
+    parser.add_argument('--events', default=None, help="事件输出文件（追加写入），默认输出到标准输出")
+    parser.add_argument('--shard', type=parse_shard, default=None,
+                        help="只处理属于第i个分片的URL（i/n，i从0开始），用于多台机器分担同一个URL列表")
+    parser.add_argument('--workers', type=parse_workers, default={},
+                        help="各阶段工作线程数，如 detect=1,resolve=2,download=1,merge=1")
+    parser.add_argument('--browsers', type=int, default=1, help="浏览器池中浏览器的最大数量")
+    parser.add_argument('--start', type=float, default=None, help="截取开始时间（秒）")
+    parser.add_argument('--end', type=float, default=None, help="截取结束时间（秒）")
+    parser.add_argument('--accurate-trim', dest='accurate_trim', action='store_true', default=True,
+                        help="指定--start时重新编码以从该帧精确开始（默认）")
+    parser.add_argument('--no-accurate-trim', dest='accurate_trim', action='store_false',
+                        help="只做无损重封装，从--start之前最近的关键帧开始，速度快")
+    parser.add_argument('--enqueue-only', action='store_true', help="只把URL加入任务队列，不下载")
+    parser.add_argument('--daemon', action='store_true', help="守护模式：队列为空时等待新任务，直到收到停止信号")
+    parser.add_argument('--poll-interval', type=float, default=5, help="守护模式下检查新任务的间隔（秒）")
+    parser.add_argument('--stale-after', type=float, default=300,
+                        help="状态为下载中但超过该秒数没有更新的任务视为无人处理，可以重新领取")
+    parser.add_argument('--api-port', type=int, default=None,
+                        help="在本机该端口启动HTTP控制接口（加入、查看、取消任务和推送进度事件），建议与--daemon一起使用")
+    parser.add_argument('--api-token', default=None,
+                        help="控制接口的访问令牌（请求头 Authorization: Bearer <令牌>），省略时自动生成并输出到日志和api事件")
+    parser.add_argument('-v', '--verbose', action='store_true', help="输出调试日志")
+    return parser
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+
+    # 事件使用标准输出，各模块的print调试输出改为标准错误，保证标准输出只有JSON事件
+    events = EventWriter(open(args.events, 'a', encoding='utf-8') if args.events else sys.stdout)
+    sys.stdout = sys.stderr
+
+    def log(message, level="INFO"):
+        if level != "DEBUG" or args.verbose:
+            print(f"[{level}] {message}")
+
+    state_manager = DownloadStateManager(db_file=args.state_db)
+    try:
+        if args.urls is not None:
+            urls = read_urls(args.urls)
+            queued = enqueue_urls(state_manager, urls, args.shard, events, log)
+            log(f"[任务队列] 读取 {len(urls)} 个URL，加入队列 {queued} 个", "INFO")
+        if args.enqueue_only:
+            return 0
+        return run_queue(args, state_manager, events, log)
+    finally:
+        state_manager.close()
+
+
+def run_queue(args, state_manager: DownloadStateManager, events: EventWriter, log) -> int:
+    """
+    领取并处理任务队列中的任务，返回退出码（有失败的任务时为1）
+    """
+    from ts_merger import TSMerger
+    from download_pipeline import DownloadPipeline
+    from event_bus import EventBus
+    from control_api import ControlServer
+
+    detector, browser_pool = create_detector(args)
+    claimed = {}
+    last_progress = {}
+    url_tasks = {}
+    bus = EventBus()
+    # 控制接口加入新任务时唤醒等待中的领取
+    wakeup = threading.Event()
+
+    def task_of(url):
+        return url_tasks.get(url)
+
+    def on_status(url, status):
+        events.emit('status', url=url, task_id=task_of(url), status=status)
+
+    def on_progress(url, percentage, downloaded, total):
+        # 只在整数百分比变化时输出，避免事件过多
+        if last_progress.get(url) != int(percentage):
+            last_progress[url] = int(percentage)
+            events.emit('progress', url=url, task_id=task_of(url), percentage=round(percentage, 1),
+                        downloaded=downloaded, total=total)
+
+    def on_videos(url, videos):
+        # 命令行版本没有用户选择，记录候选资源并标记为需要手动处理
+        state_manager.update_task_status(task_of(url), 'manual')
+        events.emit('manual', url=url, task_id=task_of(url), videos=[video['url'] for video in videos])
+
+    def on_success(url, result):
+        events.emit('done', url=url, task_id=task_of(url), file=result.get('file_path'))
+
+    pipeline = DownloadPipeline(
+        detector,
+        lambda: TSMerger(log_callback=log, state_manager=state_manager, temp_dir=args.temp_dir,
+                         accurate_trim=args.accurate_trim),
+        state_manager=state_manager,
+        history=HistoryStore(
+            args.history,
+            legacy_file=os.path.join(os.path.dirname(os.path.abspath(args.history)), "download_history.txt")
+        ),
+        ignore_history=args.ignore_history,
+        workers=args.workers,
+        download_path=args.output,
+        time_range=(args.start, args.end),
+        log_callback=log,
+        on_status=on_status,
+        on_progress=on_progress,
+        on_videos=on_videos,
+        on_success=on_success,
+        events=bus
+    )
+
+    def handle_signal(signum, frame):
+        log("[停止] 收到停止信号，正在停止下载...", "WARNING")
+        pipeline.stop()
+        wakeup.set()
+
+    signal.signal(signal.SIGINT, handle_signal)
+    signal.signal(signal.SIGTERM, handle_signal)
+
+    def jobs():
+        for job in claim_jobs(state_manager, pipeline.stop_event, args.shard, args.stale_after,
+                              args.daemon, args.poll_interval, claimed, wakeup):
+            url_tasks[job['url']] = job['task_id']
+            yield job
+
+    # 定期刷新本进程领取的任务的更新时间，排队或合并时间超过--stale-after的任务不会被其他进程重新领取
+    heartbeat_stop = threading.Event()
+
+    def heartbeat():
+        while not heartbeat_stop.wait(max(1.0, args.stale_after / 3)):
+            try:
+                state_manager.touch_tasks(list(claimed))
+            except Exception as e:
+                log(f"[任务队列] 刷新任务更新时间失败: {e}", "WARNING")
+
+    threading.Thread(target=heartbeat, name="task-heartbeat", daemon=True).start()
+
+    server = None
+    if args.api_port is not None:
+        server = ControlServer(state_manager, bus, port=args.api_port, token=args.api_token,
+                               get_pipeline=lambda: pipeline, on_enqueue=lambda queued: wakeup.set(),
+                               log_callback=log)
+        server.start()
+        events.emit('api', address=server.address, token=server.token)
+
+    try:
+        result = pipeline.run(jobs())
+    finally:
+        heartbeat_stop.set()
+        if server:
+            server.stop()
+        # 未完成的任务标记为暂停，下次运行时继续
+        for task_id in claimed:
+            task = state_manager.get_task(task_id)
+            if task and task.get('status') == 'downloading':
+                state_manager.update_task_status(task_id, 'paused')
+        browser_pool.close()
+
+    events.emit('summary', success=len(result['success_urls']), failed=len(result['failed_urls']),
+                manual=len(result['manual_urls']), skipped=len(result['skipped_urls']), stopped=result['stopped'])
+    return 1 if result['failed_urls'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,126 @@
+import re
+import json
+from urllib.parse import urljoin
+from typing import List, Dict, Any, Optional, Tuple
+
+try:
+    import ahocorasick
+    AHOCORASICK_AVAILABLE = True
+except ImportError:
+    AHOCORASICK_AVAILABLE = False
+
+
+class ContentScanner:
+    """
+    页面内容扫描器
+    用一个预编译的正则表达式一次扫描页面内容，同时找出video/source/iframe标签的src和页面中的绝对URL，
+    再按关键词（m3u8、key、getmovie）分类；只有页面包含getmovie时才额外查找getmovie的JSON数据。
+    替代原来对同一页面分别进行的多次正则扫描和HTML解析
+    """
+
+    KEYWORDS = ('m3u8', 'key', 'getmovie')
+
+    # 标签src或绝对URL（支持JavaScript中转义的 https:\/\/ 形式）
+    TOKEN_PATTERN = re.compile(
+        r'<(?P<tag>video|source|iframe)\b[^>]*?\ssrc\s*=\s*["\']?(?P<src>[^"\'\s>]+)'
+        r'|(?P<url>https?:(?:\\?/){2}[^\s"\'<>]+)',
+        re.IGNORECASE
+    )
+
+    # 包含getmovie的JSON对象
+    GETMOVIE_JSON_PATTERN = re.compile(r'\{[^{}]*getmovie[^{}]*\}', re.IGNORECASE)
+
+    # 标签对应的结果类型
+    TAG_KINDS = {'video': 'video_tag', 'source': 'source_tag', 'iframe': 'iframe'}
+
+    # URL末尾不属于URL的字符（如JavaScript中的 ); 或反斜杠）
+    URL_TRAILING_CHARS = ');,\\`'
+
+    def __init__(self, keywords: Tuple[str, ...] = KEYWORDS):
+        """
+        初始化扫描器
+
+        Args:
+            keywords: 需要识别的关键词，按优先级排列（一个URL包含多个关键词时归为第一个）
+        """
+        self.keywords = tuple(keywords)
+        self.automaton = None
+        if AHOCORASICK_AVAILABLE:
+            self.automaton = ahocorasick.Automaton()
+            for keyword in self.keywords:
+                self.automaton.add_word(keyword, keyword)
+            self.automaton.make_automaton()
+
+    def _present_keywords(self, lower_content: str) -> List[str]:
+        """
+        预过滤：找出页面中出现过的关键词（安装了pyahocorasick时一次扫描完成）
+        """
+        if self.automaton is not None:
+            found = set()
+            for _, keyword in self.automaton.iter(lower_content):
+                found.add(keyword)
+                if len(found) == len(self.keywords):
+                    break
+            return [k for k in self.keywords if k in found]
+        return [k for k in self.keywords if k in lower_content]
+
+    def _classify(self, url: str, keywords: List[str]) -> Optional[str]:
+        """
+        返回URL包含的第一个关键词
+        """
+        url_lower = url.lower()
+        for keyword in keywords:
+            if keyword in url_lower:
+                return keyword
+        return None
+
+    def scan(self, content: str, base_url: str = '') -> List[Dict[str, Any]]:
+        """
+        扫描页面内容
+
+        Args:
+            content: 页面HTML或JavaScript内容
+            base_url: 页面URL，用于把标签中的相对地址转为绝对地址
+
+        Returns:
+            匹配结果列表（按页面中出现的顺序），每项包含：
+            url、keyword（匹配的关键词）、kind（video_tag、source_tag、iframe、url、json），
+            kind为json时还包含data（解析后的getmovie数据）
+        """
+        if not content:
+            return []
+        keywords = self._present_keywords(content.lower())
+        if not keywords:
+            return []
+
+        results = []
+        for match in self.TOKEN_PATTERN.finditer(content):
+            tag = match.group('tag')
+            if tag:
+                url = match.group('src')
+                if not url.lower().startswith(('http://', 'https://')):
+                    url = urljoin(base_url, url) if base_url else url
+                kind = self.TAG_KINDS[tag.lower()]
+            else:
+                url = match.group('url').replace('\\/', '/').rstrip(self.URL_TRAILING_CHARS)
+                kind = 'url'
+            keyword = self._classify(url, keywords)
+            if keyword:
+                results.append({'url': url, 'keyword': keyword, 'kind': kind})
+
+        if 'getmovie' in keywords:
+            for match in self.GETMOVIE_JSON_PATTERN.finditer(content):
+                try:
+                    data = json.loads(match.group(0))
+                except ValueError:
+                    continue
+                if isinstance(data, dict) and data.get('m3u8'):
+                    m3u8_path = data['m3u8']
+                    url = m3u8_path if m3u8_path.startswith('http') else urljoin(base_url, m3u8_path)
+                    results.append({'url': url, 'keyword': 'm3u8', 'kind': 'json', 'data': data})
+
+        return results
+
+
+# 全局扫描器实例（预编译的模式在各模块之间共享）
+content_scanner = ContentScanner()
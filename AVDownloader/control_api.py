@@ -0,0 +1,319 @@
+import hmac
+import json
+import queue
+import secrets
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Optional
+from urllib.parse import urlparse, parse_qs
+
+from utils import utils
+
+# 请求体大小上限（字节）
+MAX_BODY_SIZE = 1024 * 1024
+# SSE连接没有事件时发送心跳的间隔（秒）
+KEEPALIVE_INTERVAL = 15
+# 只接受这些Host请求头，防止网页通过DNS重绑定访问本地接口
+LOCAL_HOSTS = ('127.0.0.1', 'localhost', '[::1]')
+# POST请求必须使用的Content-Type：浏览器跨站发送这种请求前需要预检，普通网页无法直接提交
+JSON_CONTENT_TYPE = 'application/json'
+
+
+class ControlServer:
+    """
+    本地HTTP控制接口
+    在后台线程中运行（每个请求一个线程），只监听本机地址，与下载引擎在同一进程中，不阻塞界面和下载：
+        GET  /tasks                    任务列表和实时进度（可用 ?status=pending,downloading 过滤）
+        GET  /tasks/<id>               单个任务
+        POST /tasks                    批量加入任务队列 {"urls": [...], "prioritize": false}
+        POST /tasks/<id>/cancel        取消任务
+        POST /tasks/<id>/prioritize    任务移到队列最前面
+        GET  /events                   以Server-Sent Events推送任务事件（status、progress、done等）
+    请求需要带 Authorization: Bearer <token> 请求头（没有指定token时启动时自动生成）；
+    带有非本机Origin请求头的请求（网页发起的跨站请求）一律拒绝，POST请求体必须是application/json
+    """
+
+    def __init__(self,
+                 state_manager,
+                 events,
+                 port: int = 8765,
+                 host: str = '127.0.0.1',
+                 token: Optional[str] = None,
+                 get_pipeline: Optional[Callable] = None,
+                 on_enqueue: Optional[Callable] = None,
+                 log_callback: Optional[Callable] = None):
+        """
+        初始化控制接口
+
+        Args:
+            state_manager: 下载状态管理器（任务队列）
+            events: 事件总线（EventBus），下载流水线发布的事件通过 /events 推送
+            port: 监听端口，0表示自动选择
+            host: 监听地址（默认只监听本机）
+            token: 访问令牌，None表示启动时自动生成，空字符串表示不检查
+            get_pipeline: 返回当前运行的下载流水线（没有时返回None）的函数，用于取消和调整正在处理的任务
+            on_enqueue: 新任务加入队列后的回调 on_enqueue([(url, task_id), ...])（在请求线程中调用）
+            log_callback: 日志回调函数 log(message, level)
+        """
+        self.state_manager = state_manager
+        self.events = events
+        self.host = host
+        self.port = port
+        self.token = token
+        self.get_pipeline = get_pipeline
+        self.on_enqueue = on_enqueue
+        self.log_callback = log_callback
+        self.httpd = None
+        self.thread = None
+        # 正在连接的SSE订阅（停止时逐个结束）
+        self.lock = threading.Lock()
+        self.subscribers = set()
+
+    def log(self, message, level="INFO"):
+        if self.log_callback:
+            self.log_callback(message, level)
+        else:
+            print(f"[{level}] {message}")
+
+    @property
+    def address(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def start(self) -> None:
+        """
+        开始监听（端口被占用等错误直接抛出OSError）
+        """
+        if self.token is None:
+            self.token = secrets.token_urlsafe(24)
+            self.log(f"[控制接口] 已生成访问令牌: {self.token}", "INFO")
+        handler = type('ControlRequestHandler', (_RequestHandler,), {'control': self})
+        self.httpd = ThreadingHTTPServer((self.host, self.port), handler)
+        self.httpd.daemon_threads = True
+        self.port = self.httpd.server_address[1]
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="control-api", daemon=True)
+        self.thread.start()
+        self.log(f"[控制接口] 已启动: {self.address}", "INFO")
+
+    def stop(self) -> None:
+        """
+        停止监听并结束所有SSE连接
+        """
+        if self.httpd is None:
+            return
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        self.httpd = None
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for subscriber in subscribers:
+            self.events.end(subscriber)
+        self.log("[控制接口] 已停止", "INFO")
+
+    def _pipeline(self):
+        return self.get_pipeline() if self.get_pipeline else None
+
+    def list_tasks(self, statuses=None):
+        tasks = self.state_manager.get_all_tasks()
+        if statuses:
+            tasks = [task for task in tasks if task.get('status') in statuses]
+        return 200, {'tasks': tasks}
+
+    def get_task(self, task_id: str):
+        task = self.state_manager.get_task(task_id)
+        if task is None:
+            return 404, {'error': f"任务不存在: {task_id}"}
+        return 200, dict(task, id=task_id)
+
+    def enqueue(self, body: dict):
+        urls = body.get('urls')
+        if urls is None and body.get('url'):
+            urls = [body['url']]
+        if not isinstance(urls, list) or not all(isinstance(url, str) for url in urls):
+            return 400, {'error': "请求体应为 {\"urls\": [\"...\"]}"}
+        urls = [url.strip() for url in urls if url.strip()]
+        invalid = [url for url in urls if not utils.is_valid_url(url)]
+        valid = [url for url in urls if url not in invalid]
+        queued = self.state_manager.enqueue_urls(valid)
+        if body.get('prioritize'):
+            # 按提交顺序放到队列最前面
+            for url, task_id in reversed(queued):
+                self.state_manager.prioritize_task(task_id)
+        for url, task_id in queued:
+            self.events.publish('queued', url=url, task_id=task_id)
+        if queued:
+            self.log(f"[控制接口] 加入任务队列 {len(queued)} 个URL", "INFO")
+            if self.on_enqueue:
+                self.on_enqueue(queued)
+        queued_urls = {url for url, _ in queued}
+        return 200, {
+            'queued': [{'url': url, 'task_id': task_id} for url, task_id in queued],
+            'duplicate': [url for url in dict.fromkeys(valid) if url not in queued_urls],
+            'invalid': invalid
+        }
+
+    def cancel(self, task_id: str):
+        task = self.state_manager.get_task(task_id)
+        if task is None:
+            return 404, {'error': f"任务不存在: {task_id}"}
+        if not self.state_manager.cancel_task(task_id):
+            return 409, {'error': "任务已结束，无法取消", 'status': task.get('status')}
+        pipeline = self._pipeline()
+        if pipeline:
+            pipeline.cancel(task_id)
+        self.events.publish('cancelled', url=task.get('url'), task_id=task_id)
+        self.log(f"[控制接口] 已取消任务: {task_id}", "INFO")
+        return 200, {'id': task_id, 'status': 'cancelled'}
+
+    def prioritize(self, task_id: str):
+        task = self.state_manager.get_task(task_id)
+        if task is None:
+            return 404, {'error': f"任务不存在: {task_id}"}
+        queued = self.state_manager.prioritize_task(task_id)
+        pipeline = self._pipeline()
+        waiting = pipeline.prioritize(task_id) if pipeline else False
+        if not queued and not waiting:
+            return 409, {'error': "任务已结束，无法调整顺序", 'status': task.get('status')}
+        self.events.publish('prioritized', url=task.get('url'), task_id=task_id)
+        return 200, {'id': task_id, 'status': task.get('status')}
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    """
+    控制接口的请求处理（control由ControlServer.start设置）
+    """
+
+    control: ControlServer = None
+    server_version = "AVDownloader"
+
+    def log_message(self, format, *args):
+        self.control.log(f"[控制接口] {self.address_string()} {format % args}", "DEBUG")
+
+    def _send_json(self, status: int, data) -> None:
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    @staticmethod
+    def _strip_port(host: str) -> str:
+        """
+        去掉端口号（IPv6地址带方括号）
+        """
+        return host[:host.find(']') + 1] if host.startswith('[') else host.rsplit(':', 1)[0]
+
+    def _authorized(self) -> bool:
+        host = self._strip_port(self.headers.get('Host') or '')
+        if host not in LOCAL_HOSTS:
+            self._send_json(403, {'error': "只接受本机访问"})
+            return False
+        # 浏览器发起的请求都带Origin，只允许本机页面访问（"null"等无法识别的来源也拒绝）
+        origin = self.headers.get('Origin')
+        if origin is not None:
+            parsed = urlparse(origin)
+            if parsed.scheme not in ('http', 'https') or self._strip_port(parsed.netloc) not in LOCAL_HOSTS:
+                self._send_json(403, {'error': "不接受跨站请求"})
+                return False
+        token = self.control.token
+        if token:
+            expected = f"Bearer {token}".encode('utf-8')
+            provided = (self.headers.get('Authorization') or '').encode('utf-8')
+            if not hmac.compare_digest(provided, expected):
+                self._send_json(401, {'error': "访问令牌无效"})
+                return False
+        return True
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if length > MAX_BODY_SIZE:
+            raise ValueError("请求体过大")
+        if not length:
+            return {}
+        body = json.loads(self.rfile.read(length).decode('utf-8'))
+        if not isinstance(body, dict):
+            raise ValueError("请求体应为JSON对象")
+        return body
+
+    def _route(self):
+        """
+        返回 (路径各部分, 查询参数)
+        """
+        parsed = urlparse(self.path)
+        parts = [part for part in parsed.path.split('/') if part]
+        return parts, parse_qs(parsed.query)
+
+    def do_GET(self):
+        if not self._authorized():
+            return
+        parts, query = self._route()
+        if parts == ['events']:
+            self._stream_events()
+        elif parts == ['tasks']:
+            statuses = {status for value in query.get('status', []) for status in value.split(',') if status}
+            self._send_json(*self.control.list_tasks(statuses))
+        elif len(parts) == 2 and parts[0] == 'tasks':
+            self._send_json(*self.control.get_task(parts[1]))
+        else:
+            self._send_json(404, {'error': "未知的接口"})
+
+    def do_POST(self):
+        if not self._authorized():
+            return
+        content_type = (self.headers.get('Content-Type') or '').split(';', 1)[0].strip().lower()
+        if content_type != JSON_CONTENT_TYPE:
+            self._send_json(415, {'error': f"请求体类型应为 {JSON_CONTENT_TYPE}"})
+            return
+        try:
+            body = self._read_body()
+        except (ValueError, UnicodeDecodeError) as e:
+            self._send_json(400, {'error': f"请求体无效: {e}"})
+            return
+        parts, _ = self._route()
+        try:
+            if parts == ['tasks']:
+                self._send_json(*self.control.enqueue(body))
+            elif len(parts) == 3 and parts[0] == 'tasks' and parts[2] == 'cancel':
+                self._send_json(*self.control.cancel(parts[1]))
+            elif len(parts) == 3 and parts[0] == 'tasks' and parts[2] == 'prioritize':
+                self._send_json(*self.control.prioritize(parts[1]))
+            else:
+                self._send_json(404, {'error': "未知的接口"})
+        except Exception as e:
+            self.control.log(f"[控制接口] 处理请求失败: {e}", "ERROR")
+            self._send_json(500, {'error': str(e)})
+
+    def _stream_events(self):
+        """
+        以Server-Sent Events推送事件，直到客户端断开或接口停止
+        """
+        control = self.control
+        subscriber = control.events.subscribe()
+        with control.lock:
+            control.subscribers.add(subscriber)
+        try:
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream; charset=utf-8')
+            self.send_header('Cache-Control', 'no-cache')
+            self.end_headers()
+            self.wfile.write(b': connected\n\n')
+            self.wfile.flush()
+            while True:
+                try:
+                    record = subscriber.get(timeout=KEEPALIVE_INTERVAL)
+                except queue.Empty:
+                    self.wfile.write(b': keepalive\n\n')
+                    self.wfile.flush()
+                    continue
+                if record is None:
+                    break
+                data = json.dumps(record, ensure_ascii=False)
+                self.wfile.write(f"event: {record['event']}\ndata: {data}\n\n".encode('utf-8'))
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError, ConnectionAbortedError):
+            # 客户端已断开
+            pass
+        finally:
+            control.events.unsubscribe(subscriber)
+            with control.lock:
+                control.subscribers.discard(subscriber)
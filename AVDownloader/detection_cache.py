@@ -0,0 +1,147 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional
+import requests
+from utils import utils
+
+
+class DetectionCache:
+    """
+    页面探测结果缓存
+    以页面URL为键保存探测到的候选视频链接（getmovie/m3u8）及其类型和探测时间，
+    失败重试或重启后恢复任务时直接使用，不必重新启动浏览器探测。
+    缓存有过期时间和数量上限（按最近使用淘汰），使用前先快速检查候选链接是否仍然可用
+    """
+
+    def __init__(self, cache_file: Optional[str] = None, ttl: float = 6 * 3600, max_entries: int = 500,
+                 probe_timeout: float = 5):
+        """
+        初始化探测结果缓存
+
+        Args:
+            cache_file: 缓存文件（JSON），None表示只在内存中缓存
+            ttl: 缓存有效期（秒）
+            max_entries: 最多缓存的页面数，超过时淘汰最久未使用的
+            probe_timeout: 检查候选链接是否可用的超时时间（秒）
+        """
+        self.cache_file = cache_file
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.probe_timeout = probe_timeout
+        # {规范化页面URL: {'url': 页面URL, 'videos': 候选视频列表, 'timestamp': 探测时间}}
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.session = requests.Session()
+        self.session.headers.update({
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+        })
+        self._load()
+
+    def _load(self) -> None:
+        """
+        从缓存文件加载未过期的记录
+        """
+        if not self.cache_file or not os.path.exists(self.cache_file):
+            return
+        data = utils.read_json(self.cache_file)
+        if not isinstance(data, list):
+            return
+        now = time.time()
+        for entry in data:
+            if isinstance(entry, dict) and now - entry.get('timestamp', 0) < self.ttl and entry.get('videos'):
+                self.entries[utils.canonicalize_url(entry['url'])] = entry
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def _save(self) -> None:
+        """
+        写入缓存文件（调用方需持有锁）
+        """
+        if self.cache_file:
+            utils.write_json(self.cache_file, list(self.entries.values()))
+
+    @staticmethod
+    def _slim_video(video: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        只保留候选视频中后续下载需要的字段
+        """
+        fields = ('url', 'type', 'source', 'sources', 'content_type', 'getmovie_data')
+        return {field: video[field] for field in fields if field in video}
+
+    def get(self, url: str) -> Optional[Dict[str, Any]]:
+        """
+        获取页面的缓存记录（过期的记录会被删除）
+        """
+        key = utils.canonicalize_url(url)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if time.time() - entry['timestamp'] >= self.ttl:
+                del self.entries[key]
+                self._save()
+                return None
+            self.entries.move_to_end(key)
+            return entry
+
+    def put(self, url: str, videos: List[Dict[str, Any]]) -> None:
+        """
+        保存页面的探测结果
+        """
+        if not videos:
+            return
+        key = utils.canonicalize_url(url)
+        with self.lock:
+            self.entries[key] = {
+                'url': url,
+                'videos': [self._slim_video(v) for v in videos],
+                'timestamp': time.time()
+            }
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+            self._save()
+
+    def invalidate(self, url: str) -> None:
+        """
+        删除页面的缓存记录
+        """
+        with self.lock:
+            if self.entries.pop(utils.canonicalize_url(url), None) is not None:
+                self._save()
+
+    def _probe(self, url: str) -> bool:
+        """
+        快速检查链接是否可用（只读取响应头）
+        """
+        try:
+            response = self.session.get(url, timeout=self.probe_timeout, stream=True, allow_redirects=True)
+            response.close()
+            return response.status_code < 400
+        except requests.RequestException:
+            return False
+
+    def validate(self, entry: Dict[str, Any]) -> bool:
+        """
+        检查缓存记录中的候选链接（getmovie链接和m3u8文件）是否仍然可用
+        """
+        candidates = [v['url'] for v in entry['videos']
+                      if 'getmovie' in v['url'].lower() or v['url'].lower().endswith('.m3u8')]
+        if not candidates:
+            return False
+        return all(self._probe(url) for url in candidates[:3])
+
+    def lookup(self, url: str) -> Optional[List[Dict[str, Any]]]:
+        """
+        查找页面可用的缓存探测结果：记录存在、未过期且候选链接仍然可用时返回候选视频列表，
+        候选链接失效时删除记录并返回None
+        """
+        entry = self.get(url)
+        if entry is None:
+            return None
+        if not self.validate(entry):
+            self.invalidate(url)
+            return None
+        return [dict(v) for v in entry['videos']]
@@ -0,0 +1,648 @@
+import hashlib
+import queue
+import random
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Any, Callable, Dict, Iterable, Optional
+from urllib.parse import urljoin
+
+import requests
+
+from tiered_detector import TieredDetector
+from utils import utils
+
+
+class DownloadPipeline:
+    """
+    分阶段并行下载流水线
+    把单个URL的处理拆成探测、解析、下载、合并四个阶段，阶段之间用有界队列连接，
+    每个阶段有独立的工作线程数：下载当前视频时下一个URL已经在探测，合并时下一个视频已经在下载。
+    每个URL的状态通过回调通知界面，任务进度写入DownloadStateManager。
+    运行中可以追加任务（submit）、调整尚未开始的任务顺序（prioritize）和取消任务（cancel）
+    """
+
+    STAGES = ('detect', 'resolve', 'download', 'merge')
+    DEFAULT_WORKERS = {'detect': 1, 'resolve': 2, 'download': 1, 'merge': 1}
+
+    # 通过on_status回调通知的URL状态
+    STATUS_DOWNLOADING = 'downloading'
+    STATUS_SUCCESS = 'success'
+    STATUS_FAILED = 'failed'
+    STATUS_MANUAL = 'manual'  # 没有可自动下载的资源，需要用户选择
+    STATUS_SKIPPED = 'skipped'  # 网页或解析出的视频流已下载过
+    STATUS_CANCELLED = 'cancelled'  # 被取消
+
+    # 队列结束标记
+    _STOP = object()
+
+    def __init__(self,
+                 detector,
+                 merger_factory: Callable[[], Any],
+                 state_manager=None,
+                 history=None,
+                 ignore_history: bool = False,
+                 workers: Optional[Dict[str, int]] = None,
+                 queue_size: int = 2,
+                 download_path: Optional[str] = None,
+                 time_range: tuple = (None, None),
+                 max_retries: int = 3,
+                 retry_delay: float = 0.5,
+                 log_callback: Optional[Callable] = None,
+                 on_status: Optional[Callable] = None,
+                 on_progress: Optional[Callable] = None,
+                 on_videos: Optional[Callable] = None,
+                 on_success: Optional[Callable] = None,
+                 events=None):
+        """
+        初始化下载流水线
+
+        Args:
+            detector: 视频探测器（TieredDetector），detect(url, log=...)返回探测结果
+            merger_factory: 创建TSMerger的函数，每个解析/下载/合并线程使用独立的实例
+            state_manager: 下载状态管理器
+            history: 下载历史记录（HistoryStore），已下载过的网页和视频流直接跳过，None表示不检查
+            ignore_history: 不跳过已下载过的网页和视频流（强制重新下载），下载成功后仍然记录到历史
+            workers: 各阶段的工作线程数，未指定的阶段使用DEFAULT_WORKERS
+            queue_size: 阶段之间队列的容量（探测结果最多领先下载几个URL）
+            download_path: 视频保存路径
+            time_range: 截取时间段（开始秒数, 结束秒数）
+            max_retries: getmovie链接下载失败时重新获取资源的最大次数
+            retry_delay: 重试间隔时间（秒）
+            log_callback: 日志回调函数 log(message, level)
+            on_status: URL状态回调 on_status(url, status)
+            on_progress: 下载进度回调 on_progress(url, percentage, downloaded, total)
+            on_videos: 需要手动选择时的回调 on_videos(url, videos)
+            on_success: 下载成功回调 on_success(url, result)
+            events: 事件总线（EventBus），发布任务的status、progress和done事件，None表示不发布
+        """
+        self.detector = detector
+        self.merger_factory = merger_factory
+        self.state_manager = state_manager
+        self.history = history
+        self.ignore_history = ignore_history
+        self.workers = dict(self.DEFAULT_WORKERS)
+        self.workers.update(workers or {})
+        self.queue_size = queue_size
+        self.download_path = download_path
+        self.time_range = time_range
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.log_callback = log_callback
+        self.on_status = on_status
+        self.on_progress = on_progress
+        self.on_videos = on_videos
+        self.on_success = on_success
+        self.events = events
+
+        self.stop_event = threading.Event()
+        self.lock = threading.Lock()
+        # 等待追加任务或正在处理的任务结束
+        self.condition = threading.Condition(self.lock)
+        # 已进入探测队列、尚未结束的任务数
+        self.in_flight = 0
+        # 正在使用的TS合并器（停止时逐个停止）
+        self.mergers = []
+        # 等待进入探测队列的任务（run传入的任务列表和运行中追加的任务）
+        self.backlog = deque()
+        # 是否还在接收追加的任务
+        self.accepting = False
+        # 任务总数（jobs为生成器时为None）
+        self.total = None
+        # 已取消的任务ID
+        self.cancelled = set()
+        # 正在处理的任务 {task_id: 处理它的TS合并器}（取消时停止对应的合并器）
+        self.active = {}
+        # 各阶段的工作线程
+        self.threads = []
+        self.success_urls = []
+        self.failed_urls = []
+        self.manual_urls = []
+        self.skipped_urls = []
+        self.cancelled_urls = []
+
+    def log(self, message, level="INFO"):
+        if self.log_callback:
+            self.log_callback(message, level)
+        else:
+            print(f"[{level}] {message}")
+
+    def stop(self):
+        """
+        停止流水线：不再处理新的URL，并中断正在进行的下载和合并
+        """
+        self.stop_event.set()
+        with self.lock:
+            mergers = list(self.mergers)
+        for merger in mergers:
+            try:
+                merger.stop()
+            except Exception as e:
+                print(f"[流水线] 停止TS合并器失败: {e}")
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """
+        等待所有阶段线程结束（通常在stop()之后调用）
+
+        Returns:
+            所有线程都已结束时返回True，超时返回False
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        for thread in list(self.threads):
+            thread.join(None if deadline is None else max(0, deadline - time.time()))
+        return not any(thread.is_alive() for thread in self.threads)
+
+    def submit(self, job: Dict[str, Any]) -> bool:
+        """
+        运行中追加一个任务（排在尚未开始的任务之后）
+
+        Returns:
+            流水线未运行、已停止或已不再接收任务时返回False
+        """
+        with self.lock:
+            if not self.accepting or self.stop_event.is_set():
+                return False
+            self.backlog.append(dict(job))
+            if self.total is not None:
+                self.total += 1
+            self.condition.notify_all()
+            return True
+
+    def prioritize(self, task_id: str) -> bool:
+        """
+        把尚未开始的任务移到最前面，下一个开始处理
+
+        Returns:
+            任务在等待中并已移动时返回True
+        """
+        with self.lock:
+            for job in self.backlog:
+                if job.get('task_id') == task_id:
+                    self.backlog.remove(job)
+                    self.backlog.appendleft(job)
+                    return True
+        return False
+
+    def cancel(self, task_id: str) -> None:
+        """
+        取消任务：尚未开始的任务直接移除，正在处理的任务停止对应的TS合并器，
+        已在阶段队列中的任务在下一个阶段开始前结束
+        """
+        with self.lock:
+            self.cancelled.add(task_id)
+            waiting = [job for job in self.backlog if job.get('task_id') == task_id]
+            for job in waiting:
+                self.backlog.remove(job)
+            merger = self.active.get(task_id)
+        for job in waiting:
+            self._cancel(job)
+        if merger is not None:
+            try:
+                merger.stop()
+            except Exception as e:
+                print(f"[流水线] 停止TS合并器失败: {e}")
+
+    def _next_job(self, source) -> Optional[Dict[str, Any]]:
+        """
+        取下一个要探测的任务：先取等待中的任务，再从生成器领取；
+        都没有时等待正在处理的任务结束（期间仍可追加任务），之后不再接收追加的任务
+        """
+        with self.lock:
+            if self.backlog:
+                return self.backlog.popleft()
+        job = next(source, None)
+        if job is not None:
+            return dict(job)
+        with self.condition:
+            while not self.backlog and self.in_flight and not self.stop_event.is_set():
+                self.condition.wait(0.5)
+            if self.backlog:
+                return self.backlog.popleft()
+            self.accepting = False
+            return None
+
+    def _job_done(self) -> None:
+        with self.condition:
+            self.in_flight -= 1
+            self.condition.notify_all()
+
+    def run(self, jobs: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        处理一批URL，全部完成（或停止）后返回
+
+        Args:
+            jobs: URL任务列表，每项包含url，恢复的任务还包含task_id。
+                也可以是生成器，探测队列有空位时才取下一个任务（用于从任务队列中逐个领取）
+
+        Returns:
+            {'success_urls': [...], 'failed_urls': [...], 'manual_urls': [...], 'skipped_urls': [...],
+             'cancelled_urls': [...], 'stopped': bool}
+        """
+        queues = {stage: queue.Queue(maxsize=max(1, self.queue_size)) for stage in self.STAGES}
+        counts = {stage: max(1, self.workers.get(stage, 1)) for stage in self.STAGES}
+        remaining = dict(counts)
+        threads = self.threads
+
+        for stage_index, stage in enumerate(self.STAGES):
+            next_stage = self.STAGES[stage_index + 1] if stage_index + 1 < len(self.STAGES) else None
+            for worker_index in range(counts[stage]):
+                thread = threading.Thread(
+                    target=self._worker,
+                    args=(stage, next_stage, queues, counts, remaining),
+                    name=f"pipeline-{stage}-{worker_index}",
+                    daemon=True
+                )
+                thread.start()
+                threads.append(thread)
+
+        self.log(f"[流水线] 启动，各阶段线程数: " +
+                 "，".join(f"{stage}={counts[stage]}" for stage in self.STAGES), "DEBUG")
+
+        with self.lock:
+            self.accepting = True
+            if hasattr(jobs, '__len__'):
+                # 任务列表全部放入等待队列，开始前可以调整顺序
+                self.total = len(jobs)
+                self.backlog.extend(dict(job) for job in jobs)
+                source = iter(())
+            else:
+                source = iter(jobs)
+        index = 0
+        try:
+            while not self.stop_event.is_set():
+                job = self._next_job(source)
+                if job is None:
+                    break
+                if job.get('task_id') in self.cancelled:
+                    self._cancel(job)
+                    continue
+                job['index'] = index
+                job['total'] = self.total
+                index += 1
+                with self.lock:
+                    self.in_flight += 1
+                queues['detect'].put(job)
+        finally:
+            with self.lock:
+                self.accepting = False
+                self.backlog.clear()
+            for _ in range(counts['detect']):
+                queues['detect'].put(self._STOP)
+
+        for thread in threads:
+            thread.join()
+
+        return {
+            'success_urls': list(self.success_urls),
+            'failed_urls': list(self.failed_urls),
+            'manual_urls': list(self.manual_urls),
+            'skipped_urls': list(self.skipped_urls),
+            'cancelled_urls': list(self.cancelled_urls),
+            'stopped': self.stop_event.is_set()
+        }
+
+    def _worker(self, stage: str, next_stage: Optional[str], queues: Dict[str, queue.Queue],
+                counts: Dict[str, int], remaining: Dict[str, int]) -> None:
+        """
+        阶段工作线程：从本阶段队列取任务处理，结果放入下一阶段队列；
+        本阶段最后一个线程退出时向下一阶段发送结束标记
+        """
+        merger = None
+        if stage != 'detect':
+            merger = self.merger_factory()
+            with self.lock:
+                self.mergers.append(merger)
+        handler = getattr(self, f'_{stage}')
+        try:
+            while True:
+                job = queues[stage].get()
+                if job is self._STOP:
+                    break
+                if self.stop_event.is_set():
+                    self._job_done()
+                    continue
+                task_id = job.get('task_id')
+                if task_id in self.cancelled:
+                    self._cancel(job, merger)
+                    self._job_done()
+                    continue
+                if task_id:
+                    with self.lock:
+                        self.active[task_id] = merger
+                try:
+                    job = handler(job, merger)
+                except Exception as e:
+                    self.log(f"[错误] 处理URL时发生错误: {str(e)}", "ERROR")
+                    self.log(f"[错误详情] {traceback.format_exc()}", "ERROR")
+                    job = self._fail(job, str(e), merger)
+                finally:
+                    if task_id:
+                        with self.lock:
+                            self.active.pop(task_id, None)
+                if job is not None and job.get('task_id') in self.cancelled:
+                    # 处理过程中被取消（如下载被中断），不再进入下一阶段
+                    job = self._cancel(job, merger)
+                if job is not None and next_stage:
+                    queues[next_stage].put(job)
+                else:
+                    self._job_done()
+        finally:
+            if merger is not None:
+                with self.lock:
+                    self.mergers.remove(merger)
+            with self.lock:
+                remaining[stage] -= 1
+                last_worker = remaining[stage] == 0
+            if last_worker and next_stage:
+                for _ in range(counts[next_stage]):
+                    queues[next_stage].put(self._STOP)
+
+    def _publish(self, event: str, job: Dict[str, Any], **fields) -> None:
+        if self.events:
+            self.events.publish(event, url=job['url'], task_id=job.get('task_id'), **fields)
+
+    def _set_status(self, job: Dict[str, Any], status: str) -> None:
+        if self.on_status:
+            self.on_status(job['url'], status)
+        self._publish('status', job, status=status)
+
+    def _fail(self, job: Dict[str, Any], error: str, merger=None) -> None:
+        """
+        标记任务失败，删除未完成的临时目录
+        """
+        if self.stop_event.is_set():
+            # 停止时保留任务状态和临时目录，供下次断点续传
+            return None
+        if job.get('task_id') in self.cancelled:
+            # 取消导致的下载中断不算失败
+            return self._cancel(job, merger)
+        prepared = job.get('prepared') or {}
+        if merger is not None and prepared.get('temp_subdir'):
+            self._delete_temp_subdir(merger, prepared['temp_subdir'])
+        self.log(f"[失败] {job['url']}: {error}", "ERROR")
+        task_id = job.get('task_id')
+        if self.state_manager and task_id:
+            self.state_manager.update_task_status(task_id, 'failed')
+            self.log(f"[任务] 任务 {task_id} 已失败", "DEBUG")
+        with self.lock:
+            self.failed_urls.append(job['url'])
+        self._set_status(job, self.STATUS_FAILED)
+        return None
+
+    def _check_history(self) -> bool:
+        """
+        是否需要跳过已下载过的网页和视频流
+        """
+        return self.history is not None and not self.ignore_history
+
+    def _skip(self, job: Dict[str, Any], reason: str) -> None:
+        """
+        跳过已下载过的网页，删除对应的任务记录
+        """
+        self.log(f"[下载历史] {reason}，跳过: {job['url']}", "INFO")
+        task_id = job.get('task_id')
+        if self.state_manager and task_id:
+            self.state_manager.remove_task(task_id)
+        with self.lock:
+            self.skipped_urls.append(job['url'])
+        self._set_status(job, self.STATUS_SKIPPED)
+        return None
+
+    def _cancel(self, job: Dict[str, Any], merger=None) -> None:
+        """
+        结束被取消的任务，删除未完成的临时目录
+        """
+        prepared = job.get('prepared') or {}
+        if merger is not None and prepared.get('temp_subdir'):
+            self._delete_temp_subdir(merger, prepared['temp_subdir'])
+        self.log(f"[取消] 任务已取消: {job['url']}", "WARNING")
+        task_id = job.get('task_id')
+        if self.state_manager and task_id:
+            self.state_manager.update_task_status(task_id, 'cancelled')
+        with self.lock:
+            self.cancelled_urls.append(job['url'])
+        self._set_status(job, self.STATUS_CANCELLED)
+        return None
+
+    def _delete_temp_subdir(self, merger, temp_subdir: str) -> None:
+        try:
+            merger.delete_temp_subdir(temp_subdir)
+            self.log(f"[清理] 已删除临时目录: {temp_subdir}", "INFO")
+        except Exception as e:
+            self.log(f"[清理] 删除临时目录失败: {e}", "ERROR")
+
+    def _create_task(self, job: Dict[str, Any]) -> None:
+        """
+        创建任务记录，恢复的任务继续使用原来的task_id（断点续传）
+        """
+        url = job['url']
+        if job.get('task_id'):
+            print(f"[断点续传] 使用已存在的任务ID: {job['task_id']}")
+            if self.state_manager:
+                self.state_manager.update_task_status(job['task_id'], 'downloading')
+            self.log(f"[任务] 恢复任务: {job['task_id']}", "DEBUG")
+            return
+
+        # 创建新的任务ID（使用时间戳和URL的哈希值）
+        job['task_id'] = f"task_{int(time.time())}_{hashlib.md5(url.encode()).hexdigest()[:8]}"
+        if self.state_manager:
+            self.state_manager.save_task(job['task_id'], {
+                'url': url,
+                'status': 'downloading',
+                'progress': 0,
+                'downloaded': 0,
+                'total': 0,
+                'download_path': self.download_path,
+                'created_time': utils.get_datetime(),
+                'temp_dir': None  # 临时目录，在开始下载时设置
+            })
+        self.log(f"[任务] 已创建任务: {job['task_id']}", "DEBUG")
+
+    def _detect(self, job: Dict[str, Any], merger=None) -> Optional[Dict[str, Any]]:
+        """
+        探测阶段：创建任务，探测视频资源并选择自动下载的链接（getmovie优先，其次唯一的m3u8）
+        """
+        url = job['url']
+        self.log("======================================", "INFO")
+        position = f"{job['index'] + 1}/{job['total']}" if job['total'] else f"{job['index'] + 1}"
+        self.log(f"处理URL {position}: {url}", "INFO")
+        if self._check_history() and self.history.contains(url):
+            return self._skip(job, "网页已下载过")
+        self._create_task(job)
+        self._set_status(job, self.STATUS_DOWNLOADING)
+
+        self.log("[步骤1/2] 正在探测视频资源...", "INFO")
+        detection = self.detector.detect(url, log=self.log)
+        if detection['error']:
+            return self._fail(job, detection['error'])
+
+        videos = detection['videos']
+        tier_name = {
+            TieredDetector.TIER_HTTP: "HTTP静态检测",
+            TieredDetector.TIER_BROWSER: "浏览器",
+            TieredDetector.TIER_CACHE: "缓存"
+        }.get(detection['tier'], detection['tier'])
+        self.log(f"[步骤1/2] 视频资源探测完成（{tier_name}，耗时 {detection['elapsed']:.1f} 秒），"
+                 f"找到 {len(videos)} 个资源", "INFO")
+
+        # 验证视频资源
+        valid_videos = []
+        for i, video in enumerate(videos):
+            video_url = video.get('url', '')
+            if not video_url:
+                self.log(f"[资源检查] 视频 {i+1} 没有URL，跳过", "WARNING")
+            elif not utils.is_valid_url(video_url):
+                self.log(f"[资源检查] 视频 {i+1} URL格式无效: {video_url}", "WARNING")
+            else:
+                valid_videos.append(video)
+        if len(valid_videos) != len(videos):
+            self.log(f"[资源检查] 过滤后有效视频: {len(valid_videos)}/{len(videos)}", "INFO")
+        if not valid_videos:
+            return self._fail(job, "未找到任何有效的视频资源")
+
+        getmovie_urls = [v['url'] for v in valid_videos if 'getmovie' in v['url'].lower()]
+        m3u8_urls = [v['url'] for v in valid_videos if v['url'].lower().endswith('.m3u8')]
+        if getmovie_urls:
+            self.log("[模式] 检测到getmovie链接，自动开始下载", "INFO")
+            self.log(f"[链接] 视频URL: {getmovie_urls[0]}", "DEBUG")
+            job['getmovie_url'] = getmovie_urls[0]
+        elif len(m3u8_urls) == 1:
+            self.log("[模式] 未检测到getmovie链接，但找到唯一的m3u8文件，自动开始下载", "INFO")
+            job['m3u8_url'] = m3u8_urls[0]
+        else:
+            # 没有可以自动下载的资源，交给用户选择
+            self.log("[模式] 未检测到getmovie链接，且没有唯一的m3u8文件，标记为需要手动下载", "WARNING")
+            with self.lock:
+                self.manual_urls.append(url)
+            self._set_status(job, self.STATUS_MANUAL)
+            if self.on_videos:
+                self.on_videos(url, valid_videos)
+            return None
+        target = job.get('getmovie_url') or job.get('m3u8_url')
+        if self._check_history() and self.history.contains_target(target):
+            return self._skip(job, "视频流已下载过")
+        job['attempt'] = 1
+        return job
+
+    def _resolve_getmovie(self, getmovie_url: str) -> str:
+        """
+        获取getmovie JSON数据并构造完整的M3U8 URL（每次重试都重新获取最新的动态资源）
+        """
+        self.log(f"[请求] 正在获取getmovie数据: {getmovie_url}", "INFO")
+        response = requests.get(getmovie_url, timeout=30)
+        response.raise_for_status()
+        json_data = response.json()
+        if 'm3u8' not in json_data:
+            raise ValueError("getmovie JSON中没有找到m3u8字段")
+        m3u8_url = urljoin(getmovie_url, json_data['m3u8'])
+        self.log(f"[解析] 从getmovie JSON中提取到M3U8路径: {json_data['m3u8']}", "INFO")
+        self.log(f"[构造] 完整的M3U8 URL: {m3u8_url}", "INFO")
+        return m3u8_url
+
+    def _resolve(self, job: Dict[str, Any], merger) -> Optional[Dict[str, Any]]:
+        """
+        解析阶段：getmovie链接换成M3U8链接，解析播放列表并选取要下载的分片
+        """
+        try:
+            if job.get('getmovie_url'):
+                job['m3u8_url'] = self._resolve_getmovie(job['getmovie_url'])
+                # 不同网页可能指向同一个视频流，在下载分片前检查
+                if self._check_history() and self.history.contains_target(job['m3u8_url']):
+                    return self._skip(job, "视频流已下载过")
+            merger.should_stop = False
+            merger.current_task_id = job['task_id']
+            prepared = merger.prepare_download(
+                job['m3u8_url'],
+                self.download_path,
+                start_time=self.time_range[0],
+                end_time=self.time_range[1]
+            )
+        except Exception as e:
+            return self._retry_or_fail(job, str(e), merger)
+        job['prepared'] = prepared
+        if not prepared['success']:
+            return self._retry_or_fail(job, prepared.get('error', '未知错误'), merger)
+        return job
+
+    def _retry_or_fail(self, job: Dict[str, Any], error: str, merger) -> Optional[Dict[str, Any]]:
+        """
+        getmovie链接失败后重新获取资源（在当前线程内重新解析，避免向上游队列回填造成死锁）
+        """
+        if not job.get('getmovie_url') or job['attempt'] >= self.max_retries or self.stop_event.is_set() \
+                or job.get('task_id') in self.cancelled:
+            if job.get('getmovie_url'):
+                self.log(f"[失败] 已达到最大重试次数 ({self.max_retries})，下载失败", "ERROR")
+            return self._fail(job, error, merger)
+
+        self.log(f"[失败] 视频下载失败（第 {job['attempt']}/{self.max_retries} 次尝试）: {error}", "ERROR")
+        prepared = job.get('prepared') or {}
+        if prepared.get('temp_subdir'):
+            self._delete_temp_subdir(merger, prepared['temp_subdir'])
+        # 使用随机间隔时间，避免与其他请求同时重试
+        wait_time = self.retry_delay + random.uniform(0, 0.5)
+        self.log(f"[重试] 等待 {wait_time:.2f} 秒后重新获取资源...", "INFO")
+        time.sleep(wait_time)
+        job['attempt'] += 1
+        job['prepared'] = None
+        return self._resolve(job, merger)
+
+    def _download(self, job: Dict[str, Any], merger) -> Optional[Dict[str, Any]]:
+        """
+        下载阶段：下载选取的TS分片，getmovie链接失败时重新获取资源后重试
+        """
+        url = job['url']
+        task_id = job['task_id']
+        self.log("[步骤2/2] 正在下载视频...", "INFO")
+        self.log(f"[准备] 目标URL: {job['m3u8_url']}", "INFO")
+
+        last_percentage = [None]
+
+        def progress_callback(percentage, downloaded, total):
+            if self.state_manager:
+                self.state_manager.update_task_progress(task_id, percentage, downloaded, total)
+            if self.on_progress:
+                self.on_progress(url, percentage, downloaded, total)
+            # 只在整数百分比变化时发布进度事件
+            if last_percentage[0] != int(percentage):
+                last_percentage[0] = int(percentage)
+                self._publish('progress', job, percentage=round(percentage, 1), downloaded=downloaded, total=total)
+
+        while True:
+            merger.should_stop = False
+            merger.current_task_id = task_id
+            result = merger.download_prepared(job['prepared'], progress_callback)
+            if result['success']:
+                job['prepared'] = result
+                return job
+            job = self._retry_or_fail(job, result.get('error', '未知错误'), merger)
+            if job is None:
+                return None
+
+    def _merge(self, job: Dict[str, Any], merger) -> None:
+        """
+        合并阶段：合并分片为MP4文件，成功后清理任务记录
+        """
+        merger.should_stop = False
+        result = merger.merge_prepared(job['prepared'])
+        if not result.get('success'):
+            return self._fail(job, result.get('error', '未知错误'), merger)
+
+        task_id = job['task_id']
+        if self.state_manager:
+            # 更新任务状态为成功，清除已下载分片记录和任务记录
+            self.state_manager.update_task_status(task_id, 'success')
+            self.state_manager.clear_downloaded_segments(task_id)
+            self.state_manager.remove_task(task_id)
+        self.log(f"[任务] 任务 {task_id} 已完成并清理", "DEBUG")
+        if self.history:
+            # 记录网页和解析出的视频流，之后指向同一视频流的网页也会跳过
+            self.history.add(job['url'], targets=[job.get('getmovie_url'), job.get('m3u8_url')])
+        self.log(f"[成功] 视频下载完成: {result['file_path']}", "INFO")
+        with self.lock:
+            self.success_urls.append(job['url'])
+        if self.on_success:
+            self.on_success(job['url'], result)
+        self._publish('done', job, file=result.get('file_path'))
+        self._set_status(job, self.STATUS_SUCCESS)
+        return None
@@ -1,383 +1,777 @@
 import os
+import json
+import time
+import hashlib
+import sqlite3
+import threading
 import configparser
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Iterable
 from datetime import datetime
+from segment_bitmap import SegmentBitmap
+
+# 未完成的任务状态
+PENDING_STATUSES = ('pending', 'downloading', 'paused')
 
 class DownloadStateManager:
     """
     下载状态管理器
     用于保存和读取下载任务的状态
+    使用SQLite数据库（WAL模式）保存任务和已下载分片，更新进度和添加分片都是按主键的单行写入，
+    不再每次读取和重写整个文件；首次使用时自动迁移旧的download_state.ini。
+    已下载分片在内存中以位图保存，新完成的分片只追加到日志表，日志累积到一定数量后合并为位图快照。
+    进度和已下载分片的更新先缓存在内存中，按时间间隔或数量批量写入，任务状态变化和关闭时立即写入。
+    所有操作由一个可重入锁保护，可以在多个下载线程中同时使用；读取任务时使用内存中的任务表，
+    只有数据库被其他连接（如另一个进程）修改后才重新读取
     """
-    
-    def __init__(self, config_file: str = None):
+
+    # 单独保存为列的任务字段（频繁更新），其余字段以JSON保存在info列中
+    COLUMN_FIELDS = ('status', 'progress', 'downloaded', 'total', 'last_update')
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS tasks (
+            task_id TEXT PRIMARY KEY,
+            seq INTEGER NOT NULL,
+            status TEXT,
+            progress REAL,
+            downloaded INTEGER,
+            total INTEGER,
+            last_update TEXT,
+            info TEXT NOT NULL DEFAULT '{}'
+        );
+        CREATE INDEX IF NOT EXISTS idx_tasks_status ON tasks(status);
+        CREATE TABLE IF NOT EXISTS segment_snapshots (
+            task_id TEXT PRIMARY KEY,
+            bitmap BLOB NOT NULL,
+            segment_count INTEGER NOT NULL,
+            updated TEXT
+        );
+        CREATE TABLE IF NOT EXISTS segment_journal (
+            id INTEGER PRIMARY KEY,
+            task_id TEXT NOT NULL,
+            segment_index INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_segment_journal_task ON segment_journal(task_id);
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        );
+    """
+
+    def __init__(self, db_file: str = None, legacy_config_file: str = None,
+                 flush_interval: float = 2.0, flush_count: int = 64):
         """
         初始化状态管理器
-        
+
         Args:
-            config_file: 配置文件路径，如果为None则使用默认路径
+            db_file: 数据库文件路径，如果为None则使用默认路径
+            legacy_config_file: 需要迁移的旧INI状态文件，如果为None则使用数据库同目录下的download_state.ini
+            flush_interval: 缓存的进度和分片更新写入数据库的最长间隔（秒），为0时每次更新立即写入。
+                程序异常退出时最多丢失这段时间内的更新（丢失的分片恢复下载时会重新下载）
+            flush_count: 缓存的更新达到该数量时立即写入
         """
-        if config_file is None:
+        if db_file is None:
             # 获取程序根目录
             import sys
             root_dir = os.path.dirname(os.path.abspath(sys.argv[0]))
             # 确保Resources目录存在
             resources_dir = os.path.join(root_dir, "Resources")
             os.makedirs(resources_dir, exist_ok=True)
-            # 配置文件路径
-            config_file = os.path.join(resources_dir, "download_state.ini")
-        
-        self.config_file = config_file
-        self.config = configparser.ConfigParser()
-        
-        print(f"[状态管理器] 配置文件路径: {self.config_file}")
-        
-        # 如果配置文件不存在，创建一个空的
-        if not os.path.exists(config_file):
-            print(f"[状态管理器] 配置文件不存在，创建新文件")
-            self._create_empty_config()
+            # 数据库文件路径
+            db_file = os.path.join(resources_dir, "download_state.db")
+        if legacy_config_file is None:
+            legacy_config_file = os.path.join(os.path.dirname(os.path.abspath(db_file)), "download_state.ini")
+
+        self.db_file = db_file
+        self.legacy_config_file = legacy_config_file
+        # 保护数据库连接和所有内存状态（同一线程内可以重入）
+        self.lock = threading.RLock()
+        self.conn = None
+        # 内存中的任务表 {task_id: 任务信息}（按添加顺序），None表示尚未加载
+        self.tasks = None
+        # 加载任务表时数据库的data_version，其他连接提交修改后会变化
+        self.data_version = None
+        # 已下载分片位图 {task_id: SegmentBitmap}（首次使用时从快照和日志加载）
+        self.bitmaps = {}
+        # 各任务上次合并快照后追加的日志条数
+        self.journal_counts = {}
+        # 日志条数达到该值时合并为快照
+        self.compact_threshold = 512
+        # 写缓冲：{task_id: (progress, downloaded, total, last_update)} 和 {task_id: [分片索引]}
+        self.flush_interval = flush_interval
+        self.flush_count = flush_count
+        self.pending_progress = {}
+        self.pending_segments = {}
+        self.pending_count = 0
+        self.flush_stop = threading.Event()
+        self.flush_thread = None
+
+        print(f"[状态管理器] 数据库文件路径: {self.db_file}")
+
+        with self.lock:
+            conn = self._get_connection()
+            with conn:
+                conn.executescript(self.SCHEMA)
+                conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('version', '2.0')")
+                conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('created_time', ?)", (self._now(),))
+            self._migrate_segments_table()
+            self._migrate_legacy_config()
+
+        if self.flush_interval > 0:
+            self.flush_thread = threading.Thread(target=self._flush_loop, daemon=True)
+            self.flush_thread.start()
+
+    def _get_connection(self) -> sqlite3.Connection:
+        """
+        获取数据库连接（调用方需持有锁）
+        """
+        if self.conn is None:
+            self.conn = sqlite3.connect(self.db_file, timeout=30, check_same_thread=False)
+            self.conn.row_factory = sqlite3.Row
+            self.conn.execute('PRAGMA journal_mode=WAL')
+            # WAL模式下synchronous=NORMAL不会损坏数据库，断电时最多丢失最后几次提交
+            self.conn.execute('PRAGMA synchronous=NORMAL')
+            self.tasks = None
+        return self.conn
+
+    @staticmethod
+    def _now() -> str:
+        return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+    def _split_fields(self, task_info: Dict[str, Any]):
+        """
+        把任务信息拆分为列字段和其余字段
+        """
+        columns = {key: task_info[key] for key in self.COLUMN_FIELDS if key in task_info}
+        info = {key: value for key, value in task_info.items() if key not in self.COLUMN_FIELDS and key != 'id'}
+        return columns, info
+
+    def _row_to_task(self, row: sqlite3.Row) -> Dict[str, Any]:
+        """
+        把数据库中的一行转换为任务信息字典
+        """
+        try:
+            task_info = json.loads(row['info'])
+        except ValueError:
+            task_info = {}
+        for key in self.COLUMN_FIELDS:
+            if row[key] is not None:
+                task_info[key] = row[key]
+        return task_info
+
+    def _load_tasks(self) -> Dict[str, Dict[str, Any]]:
+        """
+        获取内存中的任务表（调用方需持有锁）
+        首次调用或数据库被其他连接修改后重新读取整个任务表，否则直接返回
+        """
+        conn = self._get_connection()
+        data_version = conn.execute('PRAGMA data_version').fetchone()[0]
+        if self.tasks is None or data_version != self.data_version:
+            self.tasks = {row['task_id']: self._row_to_task(row)
+                          for row in conn.execute("SELECT * FROM tasks ORDER BY seq")}
+            # 尚未写入数据库的进度
+            for task_id, values in self.pending_progress.items():
+                if task_id in self.tasks:
+                    self.tasks[task_id].update(zip(('progress', 'downloaded', 'total', 'last_update'), values))
+            self.data_version = data_version
+        return self.tasks
+
+    def _reload_task(self, conn: sqlite3.Connection, task_id: str):
+        """
+        写入后更新内存中的单个任务（任务表尚未加载时不需要更新）
+        """
+        if self.tasks is None:
+            return
+        row = conn.execute("SELECT * FROM tasks WHERE task_id = ?", (task_id,)).fetchone()
+        if row is None:
+            self.tasks.pop(task_id, None)
         else:
-            print(f"[状态管理器] 配置文件已存在，加载配置")
-            self._load_config()
-    
-    def _create_empty_config(self):
+            self.tasks[task_id] = self._row_to_task(row)
+
+    def _migrate_legacy_config(self):
+        """
+        把旧的INI状态文件迁移到数据库（只执行一次，迁移后旧文件改名为 .bak）
+        """
+        if not os.path.exists(self.legacy_config_file):
+            return
+        conn = self._get_connection()
+        if conn.execute("SELECT 1 FROM meta WHERE key = 'migrated_from_ini'").fetchone():
+            return
+
+        print(f"[状态管理器] 迁移旧状态文件: {self.legacy_config_file}")
+        config = configparser.ConfigParser()
+        try:
+            config.read(self.legacy_config_file, encoding='utf-8')
+        except configparser.Error as e:
+            print(f"[状态管理器] 读取旧状态文件失败，跳过迁移: {e}")
+            return
+
+        task_ids = []
+        if 'Tasks' in config and 'list' in config['Tasks']:
+            task_ids = [task_id for task_id in config['Tasks']['list'].split(',') if task_id]
+
+        migrated = 0
+        with conn:
+            for task_id in task_ids:
+                task_section = f'Task_{task_id}'
+                if task_section not in config:
+                    continue
+                task_info = {}
+                segments = []
+                for key, value in config[task_section].items():
+                    if key == 'downloaded_segments':
+                        segments = [int(seg) for seg in value.split(',') if seg.strip()]
+                        continue
+                    if value == 'None':
+                        # 旧文件把None保存为字符串
+                        task_info[key] = None
+                        continue
+                    try:
+                        task_info[key] = json.loads(value)
+                    except ValueError:
+                        task_info[key] = value
+                self._insert_task(conn, task_id, task_info)
+                if segments:
+                    bitmap = SegmentBitmap()
+                    for index in segments:
+                        bitmap.add(index)
+                    self._write_snapshot(conn, task_id, bitmap.to_bytes(), len(bitmap))
+                migrated += 1
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('migrated_from_ini', ?)", (self._now(),))
+
+        try:
+            os.replace(self.legacy_config_file, self.legacy_config_file + '.bak')
+        except OSError as e:
+            print(f"[状态管理器] 旧状态文件改名失败: {e}")
+        print(f"[状态管理器] 已迁移 {migrated} 个任务")
+
+    def _migrate_segments_table(self):
+        """
+        把逐行保存分片的旧segments表转换为位图快照
+        """
+        conn = self._get_connection()
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'segments'").fetchone() is None:
+            return
+        bitmaps = {}
+        for row in conn.execute("SELECT task_id, segment_index FROM segments"):
+            bitmaps.setdefault(row['task_id'], SegmentBitmap()).add(row['segment_index'])
+        with conn:
+            for task_id, bitmap in bitmaps.items():
+                self._write_snapshot(conn, task_id, bitmap.to_bytes(), len(bitmap))
+            conn.execute("DROP TABLE segments")
+        print(f"[状态管理器] 已把 {len(bitmaps)} 个任务的分片记录转换为位图")
+
+    def _write_snapshot(self, conn: sqlite3.Connection, task_id: str, data: bytes, count: int):
         """
-        创建空的配置文件
+        保存任务的分片位图快照
         """
-        self.config['General'] = {
-            'version': '1.0',
-            'created_time': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        }
-        self.config['Tasks'] = {}
-        self._save_config()
-    
-    def _save_config(self):
+        conn.execute(
+            "INSERT OR REPLACE INTO segment_snapshots (task_id, bitmap, segment_count, updated) VALUES (?, ?, ?, ?)",
+            (task_id, data, count, self._now())
+        )
+
+    def _compact_segments(self, conn: sqlite3.Connection, task_id: str):
+        """
+        把任务的分片日志合并为位图快照（调用方需持有锁并在事务中调用）
+        分片总是先写入内存位图再追加日志，所以内存位图包含所有已写入的日志
+        """
+        bitmap = self.bitmaps.get(task_id)
+        if bitmap is None:
+            return
+        self._write_snapshot(conn, task_id, bitmap.to_bytes(), len(bitmap))
+        conn.execute("DELETE FROM segment_journal WHERE task_id = ?", (task_id,))
+        self.journal_counts[task_id] = 0
+
+    def _get_bitmap(self, task_id: str) -> Optional[SegmentBitmap]:
         """
-        保存配置到文件
+        获取任务的分片位图，首次使用时从快照和日志加载；任务不存在时返回None（调用方需持有锁）
         """
-        with open(self.config_file, 'w', encoding='utf-8') as f:
-            self.config.write(f)
-    
-    def _load_config(self):
+        bitmap = self.bitmaps.get(task_id)
+        if bitmap is not None:
+            return bitmap
+        if task_id not in self._load_tasks():
+            return None
+
+        conn = self._get_connection()
+        row = conn.execute("SELECT bitmap FROM segment_snapshots WHERE task_id = ?", (task_id,)).fetchone()
+        bitmap = SegmentBitmap(row['bitmap'] if row else b'')
+        journal = conn.execute("SELECT segment_index FROM segment_journal WHERE task_id = ?", (task_id,)).fetchall()
+        for entry in journal:
+            bitmap.add(entry['segment_index'])
+        self.bitmaps[task_id] = bitmap
+        self.journal_counts[task_id] = len(journal)
+        if len(journal) >= self.compact_threshold:
+            with conn:
+                self._compact_segments(conn, task_id)
+        return bitmap
+
+    def _forget_task_state(self, task_id: Optional[str] = None):
         """
-        从文件加载配置
+        丢弃内存中的分片位图和尚未写入的更新（task_id为None时丢弃全部，调用方需持有锁）
         """
-        self.config.read(self.config_file, encoding='utf-8')
-    
+        if task_id is None:
+            self.bitmaps.clear()
+            self.journal_counts.clear()
+            self.pending_progress.clear()
+            self.pending_segments.clear()
+        else:
+            self.bitmaps.pop(task_id, None)
+            self.journal_counts.pop(task_id, None)
+            self.pending_progress.pop(task_id, None)
+            self.pending_segments.pop(task_id, None)
+
+    def _insert_task(self, conn: sqlite3.Connection, task_id: str, task_info: Dict[str, Any]):
+        """
+        插入或替换任务（保留原有任务的顺序）
+        """
+        columns, info = self._split_fields(task_info)
+        conn.execute("""
+            INSERT INTO tasks (task_id, seq, status, progress, downloaded, total, last_update, info)
+            VALUES (?, (SELECT COALESCE(MAX(seq), 0) + 1 FROM tasks), ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(task_id) DO UPDATE SET
+                status = excluded.status, progress = excluded.progress, downloaded = excluded.downloaded,
+                total = excluded.total, last_update = excluded.last_update, info = excluded.info
+        """, (
+            task_id, columns.get('status'), columns.get('progress'), columns.get('downloaded'),
+            columns.get('total'), columns.get('last_update') or self._now(),
+            json.dumps(info, ensure_ascii=False)
+        ))
+
     def save_task(self, task_id: str, task_info: Dict[str, Any]):
         """
         保存任务信息
-        
+
         Args:
             task_id: 任务ID
             task_info: 任务信息字典
         """
         print(f"[状态管理器] 开始保存任务: {task_id}")
-        self._load_config()
-        
-        if 'Tasks' not in self.config:
-            self.config['Tasks'] = {}
-        
-        # 将任务信息转换为字符串
-        task_section = f'Task_{task_id}'
-        self.config[task_section] = {}
-        
-        for key, value in task_info.items():
-            if isinstance(value, (list, dict)):
-                import json
-                self.config[task_section][key] = json.dumps(value, ensure_ascii=False)
-            else:
-                self.config[task_section][key] = str(value)
-        
-        # 更新任务列表
-        if 'Tasks' not in self.config:
-            self.config['Tasks'] = {}
-        
-        tasks = self.config['Tasks'].get('list', '') if 'list' in self.config['Tasks'] else ''
-        task_list = tasks.split(',') if tasks else []
-        if task_id not in task_list:
-            task_list.append(task_id)
-            self.config['Tasks']['list'] = ','.join(task_list)
-        
-        # 更新最后更新时间
-        self.config['General']['last_update'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        
-        print(f"[状态管理器] 准备保存配置到文件")
-        self._save_config()
+        with self.lock:
+            self.flush()
+            conn = self._get_connection()
+            with conn:
+                self._insert_task(conn, task_id, task_info)
+            self._reload_task(conn, task_id)
         print(f"[状态管理器] 任务 {task_id} 保存成功")
-    
+
     def get_task(self, task_id: str) -> Optional[Dict[str, Any]]:
         """
         获取任务信息
-        
+
         Args:
             task_id: 任务ID
-            
+
         Returns:
             任务信息字典，如果不存在则返回None
         """
-        self._load_config()
-        
-        task_section = f'Task_{task_id}'
-        if task_section not in self.config:
-            return None
-        
-        task_info = {}
-        for key, value in self.config[task_section].items():
-            try:
-                import json
-                task_info[key] = json.loads(value)
-            except:
-                task_info[key] = value
-        
-        return task_info
-    
+        with self.lock:
+            task = self._load_tasks().get(task_id)
+            return dict(task) if task is not None else None
+
     def get_all_tasks(self) -> List[Dict[str, Any]]:
         """
         获取所有任务
-        
+
         Returns:
             任务信息列表
         """
-        self._load_config()
-        
-        tasks = []
-        
-        # 获取任务列表
-        if 'Tasks' in self.config and 'list' in self.config['Tasks']:
-            tasks_list = self.config['Tasks']['list'].split(',')
-        else:
-            tasks_list = []
-        
-        for task_id in tasks_list:
-            if task_id:
-                task = self.get_task(task_id)
-                if task:
-                    task['id'] = task_id
-                    tasks.append(task)
-        
-        return tasks
-    
+        with self.lock:
+            return [dict(task, id=task_id) for task_id, task in self._load_tasks().items()]
+
     def delete_task(self, task_id: str):
         """
         删除任务
-        
+
         Args:
             task_id: 任务ID
         """
-        self._load_config()
-        
-        task_section = f'Task_{task_id}'
-        if task_section in self.config:
-            del self.config[task_section]
-        
-        # 更新任务列表
-        if 'Tasks' in self.config and 'list' in self.config['Tasks']:
-            tasks = self.config['Tasks']['list'].split(',')
-            if task_id in tasks:
-                tasks.remove(task_id)
-                self.config['Tasks']['list'] = ','.join(tasks)
-        
-        self._save_config()
-    
+        with self.lock:
+            self._forget_task_state(task_id)
+            conn = self._get_connection()
+            with conn:
+                conn.execute("DELETE FROM tasks WHERE task_id = ?", (task_id,))
+                conn.execute("DELETE FROM segment_snapshots WHERE task_id = ?", (task_id,))
+                conn.execute("DELETE FROM segment_journal WHERE task_id = ?", (task_id,))
+            if self.tasks is not None:
+                self.tasks.pop(task_id, None)
+
     def clear_all_tasks(self):
         """
         清除所有任务
         """
-        self._load_config()
-        
-        # 删除所有任务section
-        if 'Tasks' in self.config and 'list' in self.config['Tasks']:
-            tasks_list = self.config['Tasks']['list'].split(',')
-            for task_id in tasks_list:
-                task_section = f'Task_{task_id}'
-                if task_section in self.config:
-                    del self.config[task_section]
-        
-        # 清空任务列表
-        self.config['Tasks'] = {}
-        
-        self._save_config()
-    
+        with self.lock:
+            self._forget_task_state()
+            conn = self._get_connection()
+            with conn:
+                conn.execute("DELETE FROM tasks")
+                conn.execute("DELETE FROM segment_snapshots")
+                conn.execute("DELETE FROM segment_journal")
+            if self.tasks is not None:
+                self.tasks.clear()
+
     def has_pending_tasks(self) -> bool:
         """
         检查是否有未完成的任务
-        
+
         Returns:
             如果有未完成的任务返回True，否则返回False
         """
-        tasks = self.get_all_tasks()
-        for task in tasks:
-            if task.get('status') in ['pending', 'downloading', 'paused']:
-                return True
-        return False
-    
+        with self.lock:
+            return any(task.get('status') in PENDING_STATUSES for task in self._load_tasks().values())
+
     def get_pending_tasks(self) -> List[Dict[str, Any]]:
         """
         获取所有未完成的任务
-        
+
         Returns:
             未完成任务列表
         """
-        tasks = self.get_all_tasks()
-        pending_tasks = []
-        
-        for task in tasks:
-            if task.get('status') in ['pending', 'downloading', 'paused']:
-                pending_tasks.append(task)
-        
-        return pending_tasks
-    
+        with self.lock:
+            return [dict(task, id=task_id) for task_id, task in self._load_tasks().items()
+                    if task.get('status') in PENDING_STATUSES]
+
     def update_task_status(self, task_id: str, status: str):
         """
         更新任务状态
-        
+
         Args:
             task_id: 任务ID
             status: 新状态
         """
-        self._load_config()
-        
-        task_section = f'Task_{task_id}'
-        if task_section in self.config:
-            self.config[task_section]['status'] = status
-            self.config[task_section]['last_update'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            self._save_config()
-    
+        with self.lock:
+            # 状态变化前先写入缓存的进度和分片
+            self.flush()
+            now = self._now()
+            conn = self._get_connection()
+            with conn:
+                conn.execute("UPDATE tasks SET status = ?, last_update = ? WHERE task_id = ?", (status, now, task_id))
+            if self.tasks is not None and task_id in self.tasks:
+                self.tasks[task_id].update(status=status, last_update=now)
+
+    def claim_task(self, task_id: str, stale_after: Optional[float] = None) -> bool:
+        """
+        领取任务：把待处理或已暂停的任务改为downloading，多个进程共用同一个数据库时只有一个能领取成功
+
+        Args:
+            task_id: 任务ID
+            stale_after: 同时领取状态为downloading、但超过该秒数没有更新的任务（领取它的进程已经退出），
+                None表示不领取downloading的任务
+
+        Returns:
+            领取成功返回True
+        """
+        with self.lock:
+            self.flush()
+            now = self._now()
+            stale_before = now
+            if stale_after is not None:
+                stale_before = datetime.fromtimestamp(datetime.now().timestamp() - stale_after).strftime('%Y-%m-%d %H:%M:%S')
+            conn = self._get_connection()
+            with conn:
+                # 单条UPDATE是原子的，根据影响的行数判断是否领取成功
+                cursor = conn.execute("""
+                    UPDATE tasks SET status = 'downloading', last_update = ?
+                    WHERE task_id = ? AND (status IN ('pending', 'paused')
+                        OR (? AND status = 'downloading' AND last_update < ?))
+                """, (now, task_id, stale_after is not None, stale_before))
+            claimed = cursor.rowcount == 1
+            if claimed and self.tasks is not None and task_id in self.tasks:
+                self.tasks[task_id].update(status='downloading', last_update=now)
+            return claimed
+
+    def touch_tasks(self, task_ids: Iterable[str]) -> None:
+        """
+        刷新正在下载的任务的更新时间（领取任务的进程定期调用，等待下一阶段或合并中的任务不会被其他进程视为无人处理）
+
+        Args:
+            task_ids: 任务ID列表
+        """
+        task_ids = list(task_ids)
+        if not task_ids:
+            return
+        with self.lock:
+            now = self._now()
+            conn = self._get_connection()
+            with conn:
+                conn.executemany(
+                    "UPDATE tasks SET last_update = ? WHERE task_id = ? AND status = 'downloading'",
+                    [(now, task_id) for task_id in task_ids]
+                )
+            if self.tasks is not None:
+                for task_id in task_ids:
+                    task = self.tasks.get(task_id)
+                    if task is not None and task.get('status') == 'downloading':
+                        task['last_update'] = now
+
+    def enqueue_urls(self, urls: Iterable[str]) -> List[tuple]:
+        """
+        把URL加入任务队列（状态为pending的任务）
+        已在队列中的URL不重复添加，已结束（失败、取消等）的任务重新设为待处理
+
+        Args:
+            urls: URL列表
+
+        Returns:
+            新加入或重新加入队列的 (url, task_id) 列表
+        """
+        queued = []
+        with self.lock:
+            existing = {task.get('url'): task_id for task_id, task in self._load_tasks().items() if task.get('url')}
+            for url in dict.fromkeys(urls):
+                task_id = existing.get(url)
+                if task_id is not None:
+                    if self.tasks[task_id].get('status') in PENDING_STATUSES:
+                        continue
+                    self.update_task_status(task_id, 'pending')
+                else:
+                    task_id = f"task_{int(time.time())}_{hashlib.md5(url.encode()).hexdigest()[:8]}"
+                    self.save_task(task_id, {
+                        'url': url,
+                        'status': 'pending',
+                        'progress': 0,
+                        'downloaded': 0,
+                        'total': 0,
+                        'created_time': self._now(),
+                        'temp_dir': None
+                    })
+                queued.append((url, task_id))
+        return queued
+
+    def cancel_task(self, task_id: str) -> bool:
+        """
+        取消未完成的任务（状态改为cancelled，之后不会再被领取）
+
+        Returns:
+            任务存在且未完成时返回True
+        """
+        with self.lock:
+            self.flush()
+            now = self._now()
+            conn = self._get_connection()
+            with conn:
+                cursor = conn.execute(
+                    f"UPDATE tasks SET status = 'cancelled', last_update = ? "
+                    f"WHERE task_id = ? AND status IN ({', '.join('?' * len(PENDING_STATUSES))})",
+                    (now, task_id, *PENDING_STATUSES)
+                )
+            cancelled = cursor.rowcount == 1
+            if cancelled and self.tasks is not None and task_id in self.tasks:
+                self.tasks[task_id].update(status='cancelled', last_update=now)
+            return cancelled
+
+    def prioritize_task(self, task_id: str) -> bool:
+        """
+        把未完成的任务移到队列最前面（get_pending_tasks和领取任务按队列顺序）
+
+        Returns:
+            任务存在且未完成时返回True
+        """
+        with self.lock:
+            conn = self._get_connection()
+            with conn:
+                cursor = conn.execute(
+                    f"UPDATE tasks SET seq = (SELECT MIN(seq) FROM tasks) - 1 "
+                    f"WHERE task_id = ? AND status IN ({', '.join('?' * len(PENDING_STATUSES))})",
+                    (task_id, *PENDING_STATUSES)
+                )
+            if cursor.rowcount != 1:
+                return False
+            # 任务顺序变化，下次读取时重新加载任务表
+            self.tasks = None
+            return True
+
     def update_task_info(self, task_id: str, info: Dict[str, Any]):
         """
         更新任务信息
-        
+
         Args:
             task_id: 任务ID
             info: 要更新的信息字典
         """
-        self._load_config()
-        
-        task_section = f'Task_{task_id}'
-        if task_section in self.config:
-            for key, value in info.items():
-                if isinstance(value, (list, dict)):
-                    import json
-                    self.config[task_section][key] = json.dumps(value, ensure_ascii=False)
-                else:
-                    self.config[task_section][key] = str(value)
-            self.config[task_section]['last_update'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            self._save_config()
-            print(f"[状态管理器] 任务 {task_id} 信息已更新: {info}")
-    
+        with self.lock:
+            self.flush()
+            conn = self._get_connection()
+            with conn:
+                row = conn.execute("SELECT * FROM tasks WHERE task_id = ?", (task_id,)).fetchone()
+                if row is None:
+                    return
+                task_info = self._row_to_task(row)
+                task_info.update(info)
+                task_info['last_update'] = self._now()
+                self._insert_task(conn, task_id, task_info)
+            self._reload_task(conn, task_id)
+        print(f"[状态管理器] 任务 {task_id} 信息已更新: {info}")
+
     def update_task_progress(self, task_id: str, progress: float, downloaded: int, total: int):
         """
         更新任务进度
-        
+
         Args:
             task_id: 任务ID
             progress: 进度百分比 (0-100)
             downloaded: 已下载数量
             total: 总数量
         """
-        self._load_config()
-        
-        task_section = f'Task_{task_id}'
-        if task_section in self.config:
-            self.config[task_section]['progress'] = str(progress)
-            self.config[task_section]['downloaded'] = str(downloaded)
-            self.config[task_section]['total'] = str(total)
-            self.config[task_section]['last_update'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            self._save_config()
-    
+        with self.lock:
+            values = (progress, downloaded, total, self._now())
+            self.pending_progress[task_id] = values
+            self.pending_count += 1
+            if self.tasks is not None and task_id in self.tasks:
+                self.tasks[task_id].update(zip(('progress', 'downloaded', 'total', 'last_update'), values))
+            self._after_buffered_update()
+
     def add_downloaded_segment(self, task_id: str, segment_index: int):
         """
         添加已下载的ts分片
-        
+
         Args:
             task_id: 任务ID
             segment_index: 分片索引
         """
-        self._load_config()
-        
-        task_section = f'Task_{task_id}'
-        if task_section not in self.config:
-            print(f"[状态管理器] 任务 {task_id} 不存在，无法添加分片记录")
-            return
-        
-        # 获取已下载的分片列表
-        downloaded_segments = self.config[task_section].get('downloaded_segments', '')
-        segments_list = downloaded_segments.split(',') if downloaded_segments else []
-        
-        # 添加新的分片索引
-        if str(segment_index) not in segments_list:
-            segments_list.append(str(segment_index))
-            segments_list.sort(key=int)  # 按索引排序
-            self.config[task_section]['downloaded_segments'] = ','.join(segments_list)
-            self.config[task_section]['last_update'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            self._save_config()
-            print(f"[状态管理器] 任务 {task_id} 添加已下载分片: {segment_index}")
-    
+        self.add_downloaded_segments(task_id, [segment_index])
+
+    def add_downloaded_segments(self, task_id: str, segment_indices: Iterable[int]):
+        """
+        批量添加已下载的ts分片（立即更新内存位图，分片索引缓存后批量追加到日志表）
+
+        Args:
+            task_id: 任务ID
+            segment_indices: 分片索引列表
+        """
+        with self.lock:
+            bitmap = self._get_bitmap(task_id)
+            if bitmap is None:
+                print(f"[状态管理器] 任务 {task_id} 不存在，无法添加分片记录")
+                return
+            new_indices = [index for index in map(int, segment_indices) if bitmap.add(index)]
+            if not new_indices:
+                return
+            self.pending_segments.setdefault(task_id, []).extend(new_indices)
+            self.pending_count += len(new_indices)
+            self._after_buffered_update()
+
     def get_downloaded_segments(self, task_id: str) -> List[int]:
         """
         获取已下载的ts分片列表
-        
+
         Args:
             task_id: 任务ID
-            
+
         Returns:
             已下载分片索引列表
         """
-        self._load_config()
-        
-        task_section = f'Task_{task_id}'
-        if task_section not in self.config:
-            return []
-        
-        downloaded_segments = self.config[task_section].get('downloaded_segments', '')
-        segments_list = downloaded_segments.split(',') if downloaded_segments else []
-        
-        # 转换为整数列表
-        return [int(seg) for seg in segments_list if seg.strip()]
-    
+        with self.lock:
+            bitmap = self._get_bitmap(task_id)
+            return bitmap.indices() if bitmap is not None else []
+
+    def get_segment_bitmap(self, task_id: str) -> SegmentBitmap:
+        """
+        获取已下载分片位图的副本（用于O(1)判断分片是否已下载）
+
+        Args:
+            task_id: 任务ID
+        """
+        with self.lock:
+            bitmap = self._get_bitmap(task_id)
+            return bitmap.copy() if bitmap is not None else SegmentBitmap()
+
     def clear_downloaded_segments(self, task_id: str):
         """
         清除任务的已下载分片记录
-        
+
         Args:
             task_id: 任务ID
         """
-        self._load_config()
-        
-        task_section = f'Task_{task_id}'
-        if task_section in self.config:
-            self.config[task_section]['downloaded_segments'] = ''
-            self.config[task_section]['last_update'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            self._save_config()
-            print(f"[状态管理器] 任务 {task_id} 已清除分片记录")
-    
+        with self.lock:
+            self.pending_segments.pop(task_id, None)
+            self.bitmaps.pop(task_id, None)
+            self.journal_counts.pop(task_id, None)
+            now = self._now()
+            conn = self._get_connection()
+            with conn:
+                conn.execute("DELETE FROM segment_snapshots WHERE task_id = ?", (task_id,))
+                conn.execute("DELETE FROM segment_journal WHERE task_id = ?", (task_id,))
+                conn.execute("UPDATE tasks SET last_update = ? WHERE task_id = ?", (now, task_id))
+            if self.tasks is not None and task_id in self.tasks:
+                self.tasks[task_id]['last_update'] = now
+        print(f"[状态管理器] 任务 {task_id} 已清除分片记录")
+
     def remove_task(self, task_id: str):
         """
         移除指定任务
-        
+
         Args:
             task_id: 任务ID
         """
-        self._load_config()
-        
-        # 删除任务section
-        task_section = f'Task_{task_id}'
-        if task_section in self.config:
-            del self.config[task_section]
-            print(f"[状态管理器] 已删除任务section: {task_section}")
-        
-        # 更新任务列表
-        if 'Tasks' in self.config and 'list' in self.config['Tasks']:
-            tasks_list = self.config['Tasks']['list'].split(',')
-            if task_id in tasks_list:
-                tasks_list.remove(task_id)
-                if tasks_list:
-                    self.config['Tasks']['list'] = ','.join(tasks_list)
-                    print(f"[状态管理器] 已更新任务列表: {tasks_list}")
-                else:
-                    # 如果任务列表为空，删除Tasks section
-                    del self.config['Tasks']
-                    print(f"[状态管理器] 任务列表为空，已删除Tasks section")
-        
-        self._save_config()
+        self.delete_task(task_id)
         print(f"[状态管理器] 任务 {task_id} 已完全移除")
+
+    def _after_buffered_update(self):
+        """
+        缓存更新后检查是否需要立即写入（调用方需持有锁）
+        """
+        if self.flush_interval <= 0 or self.pending_count >= self.flush_count:
+            self.flush()
+
+    def _flush_loop(self):
+        """
+        后台线程：按时间间隔写入缓存的更新
+        """
+        while not self.flush_stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except sqlite3.Error as e:
+                print(f"[状态管理器] 写入缓存的更新失败: {e}")
+
+    def flush(self):
+        """
+        在一个事务中把缓存的进度和已下载分片写入数据库
+        """
+        with self.lock:
+            if not self.pending_progress and not self.pending_segments:
+                return
+            progress, segments = self.pending_progress, self.pending_segments
+            self.pending_progress, self.pending_segments, self.pending_count = {}, {}, 0
+
+            try:
+                conn = self._get_connection()
+                with conn:
+                    conn.executemany(
+                        "UPDATE tasks SET progress = ?, downloaded = ?, total = ?, last_update = ? WHERE task_id = ?",
+                        [(*values, task_id) for task_id, values in progress.items()]
+                    )
+                    conn.executemany(
+                        "INSERT INTO segment_journal (task_id, segment_index) VALUES (?, ?)",
+                        [(task_id, index) for task_id, indices in segments.items() for index in indices]
+                    )
+                    for task_id, indices in segments.items():
+                        self.journal_counts[task_id] = self.journal_counts.get(task_id, 0) + len(indices)
+                        if self.journal_counts[task_id] >= self.compact_threshold:
+                            self._compact_segments(conn, task_id)
+            except sqlite3.Error:
+                # 写入失败（事务已回滚）时放回缓存，下次写入时重试，避免丢失断点续传需要的分片记录
+                for task_id, values in progress.items():
+                    self.pending_progress.setdefault(task_id, values)
+                for task_id, indices in segments.items():
+                    self.pending_segments[task_id] = indices + self.pending_segments.get(task_id, [])
+                    self.journal_counts[task_id] = max(0, self.journal_counts.get(task_id, 0) - len(indices))
+                self.pending_count += len(progress) + sum(len(indices) for indices in segments.values())
+                raise
+
+    def close(self):
+        """
+        写入缓存的更新并关闭数据库连接
+        关闭后没有后台写入线程，之后仍有的更新（如未能及时停止的下载线程）改为立即写入
+        """
+        self.flush_stop.set()
+        if self.flush_thread:
+            self.flush_thread.join(timeout=5)
+            self.flush_thread = None
+        with self.lock:
+            self.flush_interval = 0
+            self.flush()
+            if self.conn is not None:
+                try:
+                    self.conn.close()
+                except sqlite3.Error:
+                    pass
+                self.conn = None
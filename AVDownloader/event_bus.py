@@ -0,0 +1,73 @@
+import time
+import queue
+import threading
+from typing import Set
+
+
+class EventBus:
+    """
+    进程内事件总线
+    下载流水线和控制接口发布任务事件，每个订阅者（如控制接口的SSE连接）有独立的有界队列；
+    发布只做非阻塞放入，订阅者处理不过来时丢弃它最早的事件，不会拖慢下载
+    """
+
+    def __init__(self, queue_size: int = 1000):
+        """
+        初始化事件总线
+
+        Args:
+            queue_size: 每个订阅者最多缓存的事件数
+        """
+        self.queue_size = queue_size
+        self.lock = threading.Lock()
+        self.subscribers: Set[queue.Queue] = set()
+
+    def subscribe(self) -> queue.Queue:
+        """
+        订阅事件，返回接收事件的队列（取到None表示订阅已结束）
+        """
+        subscriber = queue.Queue(maxsize=self.queue_size)
+        with self.lock:
+            self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: queue.Queue) -> None:
+        with self.lock:
+            self.subscribers.discard(subscriber)
+
+    def publish(self, event: str, **fields) -> None:
+        """
+        发布事件（可以在任意线程调用，立即返回）
+
+        Args:
+            event: 事件名称，如status、progress、done
+            fields: 事件内容
+        """
+        record = {'event': event, 'time': round(time.time(), 3)}
+        record.update(fields)
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for subscriber in subscribers:
+            self._offer(subscriber, record)
+
+    @staticmethod
+    def _offer(subscriber: queue.Queue, record) -> None:
+        """
+        放入订阅者的队列，队列满时丢弃最早的事件
+        """
+        while True:
+            try:
+                subscriber.put_nowait(record)
+                return
+            except queue.Full:
+                try:
+                    subscriber.get_nowait()
+                except queue.Empty:
+                    pass
+
+    def end(self, subscriber: queue.Queue) -> None:
+        """
+        结束一个订阅：取消订阅并放入None，等待事件的一方随即退出
+        """
+        self.unsubscribe(subscriber)
+        self._offer(subscriber, None)
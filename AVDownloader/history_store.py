@@ -0,0 +1,192 @@
+import os
+import json
+import threading
+from typing import Iterable, Optional
+from urllib.parse import urlparse, parse_qsl, urlencode
+from utils import utils
+
+# 广告和统计平台添加的跟踪参数，不影响页面内容
+# （只列出这些平台专用的参数名；from、ref等通用名称在部分网站上用来区分视频，不能去掉）
+TRACKING_PARAMS = {
+    'fbclid', 'gclid', 'dclid', 'msclkid', 'yclid', 'igshid', 'mc_cid', 'mc_eid'
+}
+# 以这些前缀开头的跟踪参数
+TRACKING_PREFIXES = ('utm_',)
+# 视频流链接中每次获取都会变化的签名和过期参数
+VOLATILE_PARAMS = {
+    'token', 'expires', 'expire', 'e', 'st', 'sign', 'signature', 'auth', 'auth_key',
+    'hdnts', 'policy', 'key-pair-id', 'wssecret', 'wstime', 'txsecret', 'txtime', '_'
+}
+
+
+class HistoryStore:
+    """
+    下载历史记录
+    每条记录追加一行JSON到历史文件，不再每次重写整个文件；内存中以规范化URL为键建立索引，
+    同一视频的网址只是查询参数顺序、统计参数或末尾斜杠不同时也能识别为已下载。
+    同时索引网页解析出的getmovie/m3u8链接，不同网页指向同一个视频流时在下载分片前即可跳过。
+    多个进程共用同一个历史文件时，查询前会读取其他进程追加的记录
+    """
+
+    def __init__(self, history_file: str, legacy_file: Optional[str] = None):
+        """
+        初始化下载历史记录
+
+        Args:
+            history_file: 历史文件路径（JSON Lines）
+            legacy_file: 需要迁移的旧历史文件（每行一个URL），迁移后改名为 .bak
+        """
+        self.history_file = history_file
+        self.legacy_file = legacy_file
+        self.lock = threading.Lock()
+        # 已下载网页和视频流的规范化URL
+        self.page_keys = set()
+        self.target_keys = set()
+        # 已读取到的文件位置
+        self.offset = 0
+
+        directory = os.path.dirname(history_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self.lock:
+            self._migrate_legacy_file()
+            self._refresh()
+
+    @staticmethod
+    def _route_fragment(url: str) -> str:
+        """
+        前端路由使用的片段（#/video/1、#!/video/1），不同片段对应不同页面；普通锚点返回空字符串
+        """
+        try:
+            fragment = urlparse(utils.unescape_url(url)).fragment
+        except ValueError:
+            return ''
+        return fragment if fragment.startswith(('/', '!')) else ''
+
+    @classmethod
+    def _normalize(cls, url: str, dropped_params, keep_route: bool = False) -> str:
+        canonical = utils.canonicalize_url(url.strip())
+        try:
+            parsed = urlparse(canonical)
+        except ValueError:
+            return canonical
+        path = parsed.path
+        if len(path) > 1:
+            path = path.rstrip('/')
+        query = sorted(
+            (name, value) for name, value in parse_qsl(parsed.query, keep_blank_values=True)
+            if not name.lower().startswith(TRACKING_PREFIXES) and name.lower() not in dropped_params
+        )
+        normalized = f"{parsed.scheme}://{parsed.netloc}{path}"
+        if query:
+            normalized += '?' + urlencode(query)
+        route = cls._route_fragment(url.strip()) if keep_route else ''
+        if route:
+            normalized += '#' + route
+        return normalized
+
+    @classmethod
+    def normalize_url(cls, url: str) -> str:
+        """
+        网页URL的规范形式：在canonicalize_url的基础上去掉统计参数和末尾斜杠，查询参数排序，
+        保留前端路由片段（#/video/1），普通锚点仍然去掉
+        """
+        return cls._normalize(url, TRACKING_PARAMS, keep_route=True)
+
+    @classmethod
+    def normalize_target(cls, url: str) -> str:
+        """
+        视频流链接（getmovie/m3u8）的规范形式：另外去掉每次获取都会变化的签名和过期参数
+        """
+        return cls._normalize(url, TRACKING_PARAMS | VOLATILE_PARAMS)
+
+    def _migrate_legacy_file(self) -> None:
+        """
+        把旧的download_history.txt迁移到历史文件（只执行一次，调用方需持有锁）
+        """
+        if not self.legacy_file or not os.path.exists(self.legacy_file) or os.path.exists(self.history_file):
+            return
+        try:
+            with open(self.legacy_file, 'r', encoding='utf-8') as f:
+                urls = list(dict.fromkeys(line.strip() for line in f if line.strip()))
+            with open(self.history_file, 'a', encoding='utf-8') as f:
+                for url in urls:
+                    f.write(json.dumps({'url': url, 'time': None}, ensure_ascii=False) + '\n')
+            os.replace(self.legacy_file, self.legacy_file + '.bak')
+            print(f"[下载历史] 已迁移 {len(urls)} 条旧的下载历史记录")
+        except OSError as e:
+            print(f"[下载历史] 迁移旧的下载历史记录失败: {e}")
+
+    def _index(self, record: dict) -> None:
+        if record.get('url'):
+            self.page_keys.add(self.normalize_url(record['url']))
+        for target in record.get('targets') or ():
+            self.target_keys.add(self.normalize_target(target))
+
+    def _refresh(self) -> None:
+        """
+        读取历史文件中尚未读取的记录（调用方需持有锁）
+        """
+        try:
+            if not os.path.exists(self.history_file) or os.path.getsize(self.history_file) <= self.offset:
+                return
+            with open(self.history_file, 'rb') as f:
+                f.seek(self.offset)
+                data = f.read()
+        except OSError as e:
+            print(f"[下载历史] 读取下载历史记录失败: {e}")
+            return
+        # 只处理完整的行，其他进程正在写入的最后一行留到下次读取
+        end = data.rfind(b'\n') + 1
+        for line in data[:end].splitlines():
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(record, dict):
+                self._index(record)
+        self.offset += end
+
+    def contains(self, url: str) -> bool:
+        """
+        检查网页是否已下载过
+        """
+        with self.lock:
+            self._refresh()
+            return self.normalize_url(url) in self.page_keys
+
+    def contains_target(self, url: str) -> bool:
+        """
+        检查视频流链接（getmovie/m3u8）是否已下载过
+        """
+        with self.lock:
+            self._refresh()
+            return self.normalize_target(url) in self.target_keys
+
+    def add(self, url: str, targets: Iterable[str] = ()) -> None:
+        """
+        添加下载记录（追加一行到历史文件）
+
+        Args:
+            url: 网页URL
+            targets: 网页解析出的getmovie/m3u8链接
+        """
+        targets = [target for target in targets if target]
+        record = {'url': url, 'time': utils.get_datetime()}
+        if targets:
+            record['targets'] = targets
+        with self.lock:
+            self._refresh()
+            if self.normalize_url(url) in self.page_keys and \
+                    all(self.normalize_target(target) in self.target_keys for target in targets):
+                return
+            try:
+                with open(self.history_file, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(record, ensure_ascii=False) + '\n')
+            except OSError as e:
+                print(f"[下载历史] 保存下载历史记录失败: {e}")
+            self._index(record)
+
+    def __len__(self) -> int:
+        with self.lock:
+            return len(self.page_keys)
@@ -0,0 +1,111 @@
+from collections import deque
+from PyQt5.QtCore import QObject, QTimer
+from PyQt5.QtGui import QColor, QTextCharFormat, QTextCursor
+from PyQt5.QtWidgets import QPlainTextEdit
+
+
+class LogConsole(QObject):
+    """
+    控制台日志模型
+    任意线程调用add()都只把日志记录放入缓冲队列，由界面线程按固定间隔（默认每秒10次）批量渲染；
+    控制台最多保留max_blocks行，超出时自动删除最早的行；
+    按级别过滤时只切换已有行的可见性，不重新渲染历史日志
+    """
+
+    LEVELS = ('DEBUG', 'INFO', 'WARNING', 'ERROR')
+    LEVEL_COLORS = {
+        "INFO": "#000000",  # 黑色
+        "WARNING": "#FF8C00",  # 橙色
+        "ERROR": "#FF0000",  # 红色
+        "DEBUG": "#006400"   # 深绿色
+    }
+
+    def __init__(self, view: QPlainTextEdit, max_blocks: int = 5000, interval_ms: int = 100):
+        """
+        初始化控制台日志模型
+
+        Args:
+            view: 显示日志的控制台控件
+            max_blocks: 控制台最多保留的日志行数
+            interval_ms: 批量渲染的间隔（毫秒）
+        """
+        super().__init__(view)
+        self.view = view
+        self.view.setMaximumBlockCount(max_blocks)
+        # 等待渲染的日志记录，超过max_blocks条时更早的记录渲染后也会被删除，因此直接丢弃
+        self.pending = deque(maxlen=max_blocks)
+        # 显示的最低日志级别（LEVELS中的序号）
+        self.min_level = 0
+        self.formats = {}
+        for level, color in self.LEVEL_COLORS.items():
+            text_format = QTextCharFormat()
+            text_format.setForeground(QColor(color))
+            self.formats[level] = text_format
+        self.timer = QTimer(self)
+        self.timer.setInterval(interval_ms)
+        self.timer.timeout.connect(self.render_pending)
+        self.timer.start()
+
+    def _level_index(self, level: str) -> int:
+        return self.LEVELS.index(level) if level in self.LEVELS else self.LEVELS.index("INFO")
+
+    def add(self, timestamp: str, level: str, message: str) -> None:
+        """
+        添加一条日志（可以在任意线程调用，下次定时渲染时显示）
+        """
+        self.pending.append((timestamp, level, message))
+
+    def render_pending(self) -> None:
+        """
+        在一次编辑中渲染缓冲的所有日志，原来在底部时保持滚动到最新日志
+        """
+        if not self.pending:
+            return
+        records = []
+        while self.pending:
+            try:
+                records.append(self.pending.popleft())
+            except IndexError:
+                break
+
+        scrollbar = self.view.verticalScrollBar()
+        at_bottom = scrollbar.value() >= scrollbar.maximum()
+        document = self.view.document()
+        cursor = QTextCursor(document)
+        cursor.movePosition(QTextCursor.End)
+        cursor.beginEditBlock()
+        for timestamp, level, message in records:
+            if not document.isEmpty():
+                cursor.insertBlock()
+            cursor.insertText(f"[{timestamp}] [{level}] {message}", self.formats.get(level, self.formats["INFO"]))
+            # 日志级别保存在行的userState中，过滤时不需要重新解析文本
+            block = cursor.block()
+            level_index = self._level_index(level)
+            block.setUserState(level_index)
+            block.setVisible(level_index >= self.min_level)
+        cursor.endEditBlock()
+        if at_bottom:
+            scrollbar.setValue(scrollbar.maximum())
+
+    def set_min_level(self, level: str) -> None:
+        """
+        设置显示的最低日志级别（只切换已有行的可见性）
+        """
+        self.min_level = self._level_index(level)
+        document = self.view.document()
+        block = document.begin()
+        while block.isValid():
+            block.setVisible(block.userState() < 0 or block.userState() >= self.min_level)
+            block = block.next()
+        # 可见性变化后重新布局
+        document.markContentsDirty(0, document.characterCount())
+        self.view.viewport().update()
+        scrollbar = self.view.verticalScrollBar()
+        scrollbar.setValue(scrollbar.maximum())
+
+    def clear(self) -> None:
+        """
+        清空控制台和未渲染的日志
+        """
+        self.pending.clear()
+        self.view.clear()
@@ -6,19 +6,29 @@ import threading
 from PyQt5.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, 
     QLabel, QLineEdit, QPushButton, QListWidget, QListWidgetItem, 
-    QTextEdit, QProgressBar, QFileDialog, QMessageBox, QSplitter,
-    QGroupBox, QFormLayout, QComboBox, QDialog, QInputDialog
+    QPlainTextEdit, QProgressBar, QFileDialog, QMessageBox, QSplitter,
+    QGroupBox, QFormLayout, QComboBox, QDialog, QInputDialog, QCheckBox, QAbstractItemView
 )
 from PyQt5.QtCore import Qt, QThread, pyqtSignal, QUrl
 from PyQt5.QtGui import QIcon, QFont
 
 # 导入自定义模块
 from browser_simulator import SyncBrowserSimulator
+from browser_pool import BrowserPool
 from video_detector import VideoDetector
 from video_downloader import VideoDownloader
 from ts_merger import TSMerger
+from download_pipeline import DownloadPipeline
 from utils import utils
 from download_state_manager import DownloadStateManager
+from url_validator import URLValidator
+from tiered_detector import TieredDetector
+from detection_cache import DetectionCache
+from async_logger import AsyncLogger
+from log_console import LogConsole
+from history_store import HistoryStore
+from event_bus import EventBus
+from control_api import ControlServer
 
 # 全局变量
 ROOT_DIR = os.path.dirname(os.path.abspath(sys.argv[0]))
@@ -27,6 +37,8 @@ RESOURCES_DIR = os.path.join(ROOT_DIR, "Resources")
 BATS_DIR = os.path.join(ROOT_DIR, "Bats")
 LOGS_DIR = os.path.join(RESOURCES_DIR, "logs")
 LOG_FILE = os.path.join(LOGS_DIR, "downloader.log")
+# 最近视频下载记录索引
+RECENT_VIDEOS_FILE = os.path.join(LOGS_DIR, "recent_videos.json")
 
 # 确保日志目录存在
 os.makedirs(LOGS_DIR, exist_ok=True)
@@ -216,6 +228,8 @@ class URLItem(QListWidgetItem):
     STATUS_DOWNLOADING = "下载中"
     STATUS_SUCCESS = "下载成功"
     STATUS_FAILED = "下载失败"
+    STATUS_SKIPPED = "已下载过"
+    STATUS_CANCELLED = "已取消"
     
     def __init__(self, url, task_id=None):
         super().__init__()
@@ -239,7 +253,9 @@ class URLItem(QListWidgetItem):
             self.STATUS_PENDING: "#000000",    # 黑色
             self.STATUS_DOWNLOADING: "#006400",  # 绿色
             self.STATUS_SUCCESS: "#008000",    # 深绿色
-            self.STATUS_FAILED: "#FF0000"      # 红色
+            self.STATUS_FAILED: "#FF0000",     # 红色
+            self.STATUS_SKIPPED: "#808080",    # 灰色
+            self.STATUS_CANCELLED: "#808080"   # 灰色
         }.get(self.status, "#000000")
         
         self.setText(f"{self.url} [{self.status}]")
@@ -485,6 +501,9 @@ class MainWindow(QMainWindow):
     """
     主窗口
     """
+    # 控制接口加入了新任务 [(url, task_id), ...]（从请求线程发出，在界面线程处理）
+    api_enqueued = pyqtSignal(list)
+    
     def __init__(self):
         super().__init__()
         self.setWindowTitle("VideoDownloadFromWebs_Tool")
@@ -496,16 +515,49 @@ class MainWindow(QMainWindow):
         font.setPointSize(10)
         self.setFont(font)
         
+        # 日志文件由后台线程写入，按大小和日期轮转
+        self.file_logger = AsyncLogger(LOG_FILE, index_file=RECENT_VIDEOS_FILE)
+        
         # 状态变量
         self.current_url = ""
         self.download_path = r"C:\index"
         self.video_items = []
         self.worker_thread = None
-        # 下载历史记录
-        self.download_history = set()
-        self.history_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), "download_history.txt")
-        # 加载下载历史记录
-        self.load_download_history()
+        # 预览使用独立的线程和TS合并器，可以与批量处理同时进行
+        self.preview_thread = None
+        self.preview_merger = None
+        # 截取时间段 (start_time, end_time)，单位为秒
+        self.time_range = (None, None)
+        # 指定开始时间时是否重新编码以精确截取
+        self.accurate_trim = True
+        # 是否忽略下载历史（强制重新下载已下载过的网页）
+        self.ignore_history = False
+        # 预览时长（秒）
+        self.preview_seconds = 30
+        # 批量处理时在同一个浏览器中并行探测的标签页数量（1表示逐个探测）
+        self.detection_tabs = 4
+        # 下载流水线各阶段的工作线程数（探测、解析、下载、合并）
+        self.pipeline_workers = {'detect': 1, 'resolve': 2, 'download': 1, 'merge': 1}
+        # 当前运行的下载流水线和它处理的URL项 {url: URLItem}
+        self.pipeline = None
+        self.pipeline_url_items = {}
+        # 进程内事件总线：下载流水线发布任务事件，由控制接口推送
+        self.events = EventBus()
+        # 本机HTTP控制接口的端口，None表示不启用（如设置为8765）
+        self.control_api_port = None
+        # 控制接口的访问令牌，None表示启动时自动生成（显示在日志中）
+        self.control_api_token = None
+        self.control_server = None
+        # 控制接口加入的、需要在当前工作结束后开始处理的URL项
+        self.api_pending_items = []
+        # 当前的批量处理是否由用户在界面上发起（控制接口发起的处理结束后不弹出对话框）
+        self.detection_interactive = True
+        # 下载历史记录（追加写入，按规范化URL索引；首次运行时迁移旧的download_history.txt）
+        history_dir = os.path.dirname(os.path.abspath(__file__))
+        self.history_store = HistoryStore(
+            os.path.join(history_dir, "download_history.jsonl"),
+            legacy_file=os.path.join(history_dir, "download_history.txt")
+        )
         
         # 下载状态管理器
         self.state_manager = DownloadStateManager()
@@ -517,19 +569,34 @@ class MainWindow(QMainWindow):
         
         # 初始化模块
         self.log("正在初始化浏览器模拟器...", "INFO")
-        self.browser = SyncBrowserSimulator()
+        # 浏览器池：在多个URL之间复用已启动的Chrome
+        # 浏览器启动时复制预先初始化好的用户数据目录模板，跳过首次运行的初始化
+        self.browser_pool = BrowserPool(size=2, profile_template=os.path.join(RESOURCES_DIR, "chrome_profile"))
+        self.browser = SyncBrowserSimulator(pool=self.browser_pool)
         self.log("浏览器模拟器初始化完成", "INFO")
         
         self.log("正在初始化视频检测器...", "INFO")
         self.detector = VideoDetector()
+        # 分级探测器：先HTTP静态检测，必要时才使用浏览器，按域名记录成功的探测级别
+        self.tiered_detector = TieredDetector(
+            browser_pool=self.browser_pool,
+            detector=self.detector,
+            memory_file=os.path.join(RESOURCES_DIR, "detection_tiers.json"),
+            # 探测结果缓存：失败重试或恢复任务时不必重新探测
+            cache=DetectionCache(os.path.join(RESOURCES_DIR, "detection_cache.json"))
+        )
         self.log("视频检测器初始化完成", "INFO")
         
         self.log("正在初始化视频下载器...", "INFO")
         self.downloader = VideoDownloader()
         self.log("视频下载器初始化完成", "INFO")
         
+        # URL预检查器（检查结果在本次会话中缓存）
+        self.url_validator = URLValidator()
+        
         self.log("正在初始化TS合并器...", "INFO")
-        self.ts_merger = TSMerger(log_callback=self.log, state_manager=self.state_manager)
+        self.ts_merger = TSMerger(log_callback=self.log, state_manager=self.state_manager,
+                                  accurate_trim=self.accurate_trim)
         self.log("TS合并器初始化完成", "INFO")
         
         self.log(f"默认下载路径: {self.download_path}", "DEBUG")
@@ -542,10 +609,84 @@ class MainWindow(QMainWindow):
         self.log("正在检测未完成的任务...", "INFO")
         self.check_pending_tasks()
         
+        # 本机控制接口
+        self.api_enqueued.connect(self.on_api_enqueued)
+        if self.control_api_port:
+            self.start_control_api()
+        
         # 日志
         self.log("程序初始化完成", "INFO")
         self.log("所有模块初始化成功，程序已准备就绪", "INFO")
     
+    def start_control_api(self):
+        """
+        启动本机HTTP控制接口（后台线程），其他程序可以通过它加入、查看、取消任务和接收进度事件
+        """
+        self.control_server = ControlServer(
+            self.state_manager,
+            self.events,
+            port=self.control_api_port,
+            token=self.control_api_token,
+            get_pipeline=lambda: self.pipeline,
+            on_enqueue=self.api_enqueued.emit,
+            log_callback=self.log
+        )
+        try:
+            self.control_server.start()
+        except OSError as e:
+            self.log(f"[控制接口] 启动失败: {e}", "ERROR")
+            self.control_server = None
+    
+    def stop_control_api(self):
+        """
+        停止本机HTTP控制接口
+        """
+        if self.control_server:
+            try:
+                self.control_server.stop()
+            except Exception as e:
+                print(f"[关闭] 停止控制接口失败: {e}")
+            self.control_server = None
+    
+    def on_api_enqueued(self, queued):
+        """
+        控制接口加入任务后添加到URL列表：正在批量处理时追加到下载流水线，否则开始处理
+        """
+        url_items = {}
+        for i in range(self.url_list.count()):
+            item = self.url_list.item(i)
+            if isinstance(item, URLItem):
+                url_items[item.url] = item
+        for url, task_id in queued:
+            item = url_items.get(url)
+            if item is None:
+                item = URLItem(url, task_id)
+                self.url_list.addItem(item)
+                self.log(f"[控制接口] 添加URL: {url}", "INFO")
+            else:
+                item.task_id = task_id
+                item.update_status(URLItem.STATUS_PENDING)
+            pipeline = self.pipeline
+            if pipeline:
+                self.pipeline_url_items[url] = item
+                if pipeline.submit({'url': url, 'task_id': task_id}):
+                    continue
+            if item not in self.api_pending_items:
+                self.api_pending_items.append(item)
+        self.start_pending_api_tasks()
+    
+    def start_pending_api_tasks(self):
+        """
+        没有正在进行的工作时开始处理控制接口加入、尚未处理的任务（只处理这些URL，不弹出对话框）
+        """
+        if not self.api_pending_items or (self.worker_thread and self.worker_thread.isRunning()):
+            return
+        url_items, self.api_pending_items = self.api_pending_items, []
+        # 列表中已被删除的URL项不再处理
+        url_items = [item for item in url_items if self.url_list.row(item) >= 0]
+        if url_items:
+            self.run_detection(url_items, interactive=False)
+    
     def check_temp_files(self):
         """
         检测临时目录中是否有剩余文件（当前版本不处理temp中的文件）
@@ -721,6 +862,11 @@ class MainWindow(QMainWindow):
         self.clear_temp_button.clicked.connect(self.clear_temp_files)
         other_controls.addWidget(self.clear_temp_button)
         
+        # 忽略下载历史：已下载过的网页和视频流也重新下载
+        self.ignore_history_checkbox = QCheckBox("忽略下载历史（强制重新下载）")
+        self.ignore_history_checkbox.toggled.connect(self.on_ignore_history_toggled)
+        other_controls.addWidget(self.ignore_history_checkbox)
+        
         # 保存路径选择
         path_label = QLabel("保存路径:")
         other_controls.addWidget(path_label)
@@ -736,6 +882,28 @@ class MainWindow(QMainWindow):
         
         control_layout.addLayout(other_controls)
         
+        # 时间段截取（只下载覆盖该时间段的分片）
+        time_range_controls = QHBoxLayout()
+        time_range_controls.addWidget(QLabel("截取时间段:"))
+        
+        self.start_time_input = QLineEdit()
+        self.start_time_input.setPlaceholderText("开始时间，如 00:10:00（留空从头开始）")
+        time_range_controls.addWidget(self.start_time_input)
+        
+        time_range_controls.addWidget(QLabel("至"))
+        
+        self.end_time_input = QLineEdit()
+        self.end_time_input.setPlaceholderText("结束时间，如 00:20:00（留空到结尾）")
+        time_range_controls.addWidget(self.end_time_input)
+        
+        # 精确截取：从开始时间所在的帧开始（需要重新编码，较慢），否则从之前最近的关键帧开始
+        self.accurate_trim_checkbox = QCheckBox("精确截取（重新编码）")
+        self.accurate_trim_checkbox.setChecked(True)
+        self.accurate_trim_checkbox.toggled.connect(self.on_accurate_trim_toggled)
+        time_range_controls.addWidget(self.accurate_trim_checkbox)
+        
+        control_layout.addLayout(time_range_controls)
+        
         control_group.setLayout(control_layout)
         main_layout.addWidget(control_group)
         
@@ -747,14 +915,22 @@ class MainWindow(QMainWindow):
         video_layout = QVBoxLayout()
         
         self.video_list = QListWidget()
+        # 可以按住Ctrl/Shift选中多个视频一起下载
+        self.video_list.setSelectionMode(QAbstractItemView.ExtendedSelection)
         
         # 下载按钮
         self.download_button = QPushButton("下载选中视频")
         self.download_button.clicked.connect(self.download_selected_video)
         self.download_button.setEnabled(False)
         
+        # 预览按钮（只下载开头几十秒，确认是否为目标视频）
+        self.preview_button = QPushButton("预览选中视频")
+        self.preview_button.clicked.connect(self.preview_selected_video)
+        self.preview_button.setEnabled(False)
+        
         video_layout.addWidget(self.video_list)
         video_layout.addWidget(self.download_button)
+        video_layout.addWidget(self.preview_button)
         video_group.setLayout(video_layout)
         
         # 右侧控制台
@@ -765,9 +941,24 @@ class MainWindow(QMainWindow):
         console_group = QGroupBox("控制台输出")
         console_layout = QVBoxLayout()
         
-        self.console = QTextEdit()
+        # 日志级别过滤（只切换已有日志行的显示，不重新渲染）
+        level_layout = QHBoxLayout()
+        level_layout.addWidget(QLabel("日志级别:"))
+        self.log_level_combo = QComboBox()
+        for text, level in (("全部", "DEBUG"), ("信息", "INFO"), ("警告", "WARNING"), ("错误", "ERROR")):
+            self.log_level_combo.addItem(text, level)
+        self.log_level_combo.currentIndexChanged.connect(
+            lambda index: self.console_model.set_min_level(self.log_level_combo.itemData(index))
+        )
+        level_layout.addWidget(self.log_level_combo)
+        level_layout.addStretch()
+        console_layout.addLayout(level_layout)
+        
+        self.console = QPlainTextEdit()
         self.console.setReadOnly(True)
         self.console.setFont(QFont("Consolas", 10))
+        # 日志先缓存，每100毫秒批量渲染一次，控制台最多保留5000行
+        self.console_model = LogConsole(self.console, max_blocks=5000, interval_ms=100)
         
         console_layout.addWidget(self.console)
         console_group.setLayout(console_layout)
@@ -889,7 +1080,7 @@ class MainWindow(QMainWindow):
         success_count = 0
         for i in range(self.url_list.count() - 1, -1, -1):
             item = self.url_list.item(i)
-            if isinstance(item, URLItem) and item.status == URLItem.STATUS_SUCCESS:
+            if isinstance(item, URLItem) and item.status in (URLItem.STATUS_SUCCESS, URLItem.STATUS_SKIPPED):
                 self.url_list.takeItem(i)
                 success_count += 1
         
@@ -898,51 +1089,18 @@ class MainWindow(QMainWindow):
         else:
             self.log("没有下载成功的URL可删除", "INFO")
     
-    def load_download_history(self):
-        """
-        加载下载历史记录
-        """
-        try:
-            import os
-            if os.path.exists(self.history_file):
-                with open(self.history_file, 'r', encoding='utf-8') as f:
-                    for line in f:
-                        url = line.strip()
-                        if url:
-                            self.download_history.add(url)
-                self.log(f"已加载 {len(self.download_history)} 条下载历史记录", "DEBUG")
-        except Exception as e:
-            self.log(f"加载下载历史记录失败: {str(e)}", "ERROR")
-    
-    def save_download_history(self):
-        """
-        保存下载历史记录
-        """
-        try:
-            import os
-            # 确保目录存在
-            os.makedirs(os.path.dirname(self.history_file), exist_ok=True)
-            with open(self.history_file, 'w', encoding='utf-8') as f:
-                for url in self.download_history:
-                    f.write(url + '\n')
-            self.log(f"已保存 {len(self.download_history)} 条下载历史记录", "DEBUG")
-        except Exception as e:
-            self.log(f"保存下载历史记录失败: {str(e)}", "ERROR")
-    
-    def add_to_history(self, url):
+    def add_to_history(self, url, targets=()):
         """
-        添加URL到下载历史记录
+        添加URL（以及解析出的getmovie/m3u8链接）到下载历史记录
         """
-        if url not in self.download_history:
-            self.download_history.add(url)
-            self.save_download_history()
-            self.log(f"已添加到下载历史: {url}", "DEBUG")
+        self.history_store.add(url, targets)
+        self.log(f"已添加到下载历史: {url}", "DEBUG")
     
     def is_in_history(self, url):
         """
-        检查URL是否在下载历史记录中
+        检查URL是否在下载历史记录中（忽略统计参数、参数顺序和末尾斜杠的差异）
         """
-        return url in self.download_history
+        return self.history_store.contains(url)
     
     def manual_download(self):
         """
@@ -998,6 +1156,7 @@ class MainWindow(QMainWindow):
                         
                         # 启用下载按钮
                         self.download_button.setEnabled(True)
+                        self.preview_button.setEnabled(True)
                         self.log(f"找到 {len(videos)} 个视频资源，请选择要下载的视频", "INFO")
                         item.update_status(URLItem.STATUS_PENDING)
                     except Exception as e:
@@ -1024,75 +1183,52 @@ class MainWindow(QMainWindow):
             level: 日志级别，可选值：INFO, WARNING, ERROR, DEBUG
         """
         timestamp = utils.get_datetime()
-        # 根据日志级别设置不同的颜色
-        level_colors = {
-            "INFO": "#000000",  # 黑色
-            "WARNING": "#FF8C00",  # 橙色
-            "ERROR": "#FF0000",  # 红色
-            "DEBUG": "#006400"   # 深绿色
-        }
-        color = level_colors.get(level, "#000000")
-        log_message = f"<font color='{color}'>[{timestamp}] [{level}] {message}</font>\n"
-        self.console.append(log_message)
-        self.console.verticalScrollBar().setValue(self.console.verticalScrollBar().maximum())
+        # 放入控制台缓冲，由界面线程定时批量渲染（可以在工作线程中调用）
+        self.console_model.add(timestamp, level, message)
         # 同时输出到控制台
         print(f"[{timestamp}] [{level}] {message}")
-        # 写入日志文件
-        try:
-            log_entry = f"[{timestamp}] [{level}] {message}\n"
-            with open(LOG_FILE, "a", encoding="utf-8") as f:
-                f.write(log_entry)
-            
-            # 清理日志文件，只保留最近的10条视频下载记录
-            self._cleanup_log_file()
-        except Exception as e:
-            # 避免日志写入失败影响主程序
-            print(f"日志文件写入失败: {e}")
+        # 写入日志文件（放入队列后立即返回，由后台线程写入）
+        self.file_logger.write(timestamp, level, message)
+    
+    def on_accurate_trim_toggled(self, checked):
+        """
+        切换精确截取（之后开始的下载生效）
+        """
+        self.accurate_trim = checked
+        if hasattr(self, 'ts_merger'):
+            self.ts_merger.accurate_trim = checked
     
-    def _cleanup_log_file(self):
+    def on_ignore_history_toggled(self, checked):
         """
-        清理日志文件，只保留最近的10条视频下载记录
+        切换是否忽略下载历史（正在运行的流水线中尚未探测的URL也生效）
+        """
+        self.ignore_history = checked
+        pipeline = self.pipeline
+        if pipeline:
+            pipeline.ignore_history = checked
+        self.log(f"忽略下载历史: {'开启' if checked else '关闭'}", "INFO")
+    
+    def read_time_range(self):
+        """
+        读取界面上的截取时间段
+        
+        Returns:
+            (start_time, end_time)，单位为秒，未填写的一端为None；格式无效时返回False
         """
         try:
-            if not os.path.exists(LOG_FILE):
-                return
-            
-            # 读取所有日志条目
-            with open(LOG_FILE, "r", encoding="utf-8") as f:
-                lines = f.readlines()
-            
-            # 过滤出视频下载记录和其他重要日志
-            video_logs = []
-            important_logs = []
-            
-            for line in lines:
-                # 识别视频下载相关的日志
-                if any(keyword in line for keyword in ["下载成功", "合并成功", "视频下载", "M3U8", "[成功]", "[错误]", "[警告]"]):
-                    video_logs.append(line)
-                # 保留其他重要日志（如初始化、清理等）
-                elif any(keyword in line for keyword in ["初始化", "清除垃圾", "程序准备就绪"]):
-                    important_logs.append(line)
-            
-            # 只保留最近的10条视频下载记录
-            if len(video_logs) > 10:
-                video_logs = video_logs[-10:]
-            
-            # 重新写入日志文件
-            with open(LOG_FILE, "w", encoding="utf-8") as f:
-                # 先写入重要日志
-                f.writelines(important_logs)
-                # 再写入保留的视频下载记录
-                f.writelines(video_logs)
-            
-            # 验证清理结果
-            with open(LOG_FILE, "r", encoding="utf-8") as f:
-                cleaned_lines = f.readlines()
-            
-            print(f"[日志清理] 已清理日志文件，保留 {len(cleaned_lines)} 行记录")
-                
-        except Exception as e:
-            # 避免清理失败影响主程序
-            print(f"清理日志文件失败: {e}")
+            start_time = utils.parse_time_string(self.start_time_input.text())
+            end_time = utils.parse_time_string(self.end_time_input.text())
+        except ValueError as e:
+            QMessageBox.warning(self, "警告", f"截取时间段格式无效: {e}")
+            return False
+        
+        if start_time is not None and end_time is not None and end_time <= start_time:
+            QMessageBox.warning(self, "警告", "结束时间必须大于开始时间")
+            return False
+        
+        if start_time is not None or end_time is not None:
+            self.log(f"截取时间段: {start_time or 0} 秒 - {end_time if end_time is not None else '结尾'}", "INFO")
+        return start_time, end_time
     
     def browse_path(self):
         """
@@ -1120,13 +1256,31 @@ class MainWindow(QMainWindow):
             QMessageBox.warning(self, "警告", "请添加有效的URL")
             return
         
+        # 读取截取时间段
+        time_range = self.read_time_range()
+        if time_range is False:
+            return
+        self.time_range = time_range
+        
         # 清空视频列表
         self.video_list.clear()
         self.video_items = []
         
         # 禁用按钮
-        self.start_button.setEnabled(False)
         self.download_button.setEnabled(False)
+        self.preview_button.setEnabled(False)
+        self.run_detection(url_items)
+    
+    def run_detection(self, url_items, interactive=True):
+        """
+        在工作线程中用下载流水线处理URL项
+        
+        Args:
+            url_items: 要处理的URL项
+            interactive: 是否由用户在界面上发起；控制接口发起的处理结束后不弹出对话框
+        """
+        self.detection_interactive = interactive
+        self.start_button.setEnabled(False)
         
         # 显示状态
         self.log("======================================", "INFO")
@@ -1140,7 +1294,7 @@ class MainWindow(QMainWindow):
         self.progress_bar.setValue(0)
         
         # 启动工作线程
-        def process_urls():
+        def process_urls(progress_callback=None):
             failed_urls = []
             success_count = 0
             invalid_urls = []  # 记录无效链接
@@ -1148,6 +1302,9 @@ class MainWindow(QMainWindow):
             # 不再清除所有旧任务，保留未完成的任务以支持断点续传
             # self.state_manager.clear_all_tasks()
             
+            # 后台预启动浏览器池，与URL检查并行
+            threading.Thread(target=self.browser_pool.warm_up, args=(1,), daemon=True).start()
+            
             try:
                 # 预处理：验证所有URL的有效性
                 self.log("[预处理] 正在验证所有URL的有效性...", "INFO")
@@ -1176,262 +1333,110 @@ class MainWindow(QMainWindow):
                 
                 self.log(f"[预处理] 验证完成，有效URL: {len(valid_url_items)}/{len(url_items)}", "INFO")
                 
-                # 处理每个有效的URL
-                for url_index, url_item in enumerate(valid_url_items):
-                    url = url_item.url
-                    self.log(f"======================================", "INFO")
-                    self.log(f"处理URL {url_index + 1}/{len(valid_url_items)}: {url}", "INFO")
-                    
-                    # 检查URL是否可访问（简单的网络检查）
-                    try:
-                        import requests
-                        self.log(f"[网络检查] 正在检查URL可访问性...", "DEBUG")
-                        head_response = requests.head(url, timeout=10, allow_redirects=True)
-                        if head_response.status_code >= 400:
-                            self.log(f"[网络检查] URL返回错误状态码: {head_response.status_code}", "WARNING")
-                        else:
-                            self.log(f"[网络检查] URL可访问，状态码: {head_response.status_code}", "DEBUG")
-                    except Exception as net_error:
-                        self.log(f"[网络检查] 无法访问URL: {net_error}", "WARNING")
-                        # 不终止，继续尝试
-                    
-                    # 检查是否是恢复的任务（URLItem中有task_id）
-                    if hasattr(url_item, 'task_id') and url_item.task_id:
-                        # 使用原来的task_id（断点续传）
-                        task_id = url_item.task_id
-                        print(f"[断点续传] 使用已存在的任务ID: {task_id}")
-                        
-                        # 更新任务状态为downloading
-                        self.state_manager.update_task_status(task_id, 'downloading')
-                        self.log(f"[任务] 恢复任务: {task_id}", "DEBUG")
+                # 并行检查所有URL的可访问性，跳过无法连接的URL，返回错误状态码的URL排到最后
+                self.log(f"[网络检查] 正在并行检查 {len(valid_url_items)} 个URL的可访问性...", "INFO")
+                # 之前失败的URL是重试，忽略缓存的检查结果重新检查
+                check_results = self.url_validator.validate_all(
+                    [item.url for item in valid_url_items],
+                    refresh=[item.url for item in valid_url_items if item.status == URLItem.STATUS_FAILED]
+                )
+                ordered_urls, unreachable_urls = self.url_validator.partition(
+                    [item.url for item in valid_url_items], check_results
+                )
+                for url_item in valid_url_items:
+                    check_result = check_results.get(url_item.url, {})
+                    if url_item.url in unreachable_urls:
+                        self.log(f"[网络检查] 无法访问URL，跳过: {url_item.url} ({check_result.get('error')})", "ERROR")
+                        url_item.update_status(URLItem.STATUS_FAILED)
+                        failed_urls.append(url_item.url)
+                    elif check_result.get('status') == self.url_validator.STATUS_HTTP_ERROR:
+                        self.log(f"[网络检查] URL返回错误状态码: {check_result.get('status_code')}，稍后尝试: {url_item.url}", "WARNING")
                     else:
-                        # 创建新的任务ID（使用时间戳和URL的哈希值）
-                        import hashlib
-                        import time
-                        task_id = f"task_{int(time.time())}_{hashlib.md5(url.encode()).hexdigest()[:8]}"
-                        
-                        # 保存任务信息
-                        task_info = {
-                            'url': url,
-                            'status': 'downloading',
-                            'progress': 0,
-                            'downloaded': 0,
-                            'total': 0,
-                            'download_path': self.download_path,
-                            'created_time': utils.get_datetime(),
-                            'temp_dir': None  # 临时目录，在开始下载时设置
-                        }
-                        self.state_manager.save_task(task_id, task_info)
-                        self.log(f"[任务] 已创建任务: {task_id}", "DEBUG")
+                        self.log(f"[网络检查] URL可访问，状态码: {check_result.get('status_code')}: {url_item.url}", "DEBUG")
+                
+                url_order = {url: index for index, url in enumerate(ordered_urls)}
+                valid_url_items = sorted(
+                    [item for item in valid_url_items if item.url in url_order],
+                    key=lambda item: url_order[item.url]
+                )
+                self.log(f"[网络检查] 检查完成，可处理URL: {len(valid_url_items)}，无法访问: {len(unreachable_urls)}", "INFO")
+                
+                # 多个URL时在后台用多个标签页并行探测，下载当前视频的同时探测后面的URL
+                if self.detection_tabs > 1 and len(valid_url_items) > 1:
+                    self.tiered_detector.prefetch(
+                        [item.url for item in valid_url_items],
+                        tabs=self.detection_tabs,
+                        log=self.log
+                    )
+                
+                # 分阶段流水线处理所有有效的URL：下载当前视频时同时探测和解析后面的URL
+                url_item_map = {item.url: item for item in valid_url_items}
+                # 控制接口追加到流水线的URL项也加入这里
+                self.pipeline_url_items = url_item_map
+                ui_status = {
+                    DownloadPipeline.STATUS_DOWNLOADING: URLItem.STATUS_DOWNLOADING,
+                    DownloadPipeline.STATUS_SUCCESS: URLItem.STATUS_SUCCESS,
+                    DownloadPipeline.STATUS_FAILED: URLItem.STATUS_FAILED,
+                    DownloadPipeline.STATUS_MANUAL: URLItem.STATUS_PENDING,
+                    DownloadPipeline.STATUS_SKIPPED: URLItem.STATUS_SKIPPED,
+                    DownloadPipeline.STATUS_CANCELLED: URLItem.STATUS_CANCELLED
+                }
+                
+                def on_status(url, status):
+                    url_item_map[url].update_status(ui_status[status])
+                    if status == DownloadPipeline.STATUS_FAILED:
+                        self.file_logger.record_video('failed', url)
+                
+                def on_progress(url, percentage, downloaded, total):
+                    if progress_callback:
+                        progress_callback(percentage, downloaded, total)
+                
+                def on_videos(url, videos):
+                    # 添加到视频列表供用户选择（被多个来源印证的资源排在前面）
+                    self.video_list.clear()
+                    self.video_items = []
+                    for video in self.detector.rank_videos(videos):
+                        video_item = VideoItem(video)
+                        self.video_list.addItem(video_item)
+                        self.video_items.append(video_item)
                     
-                    # 为每个URL创建一个新的浏览器实例（使用上下文管理器确保自动关闭）
-                    self.log("[步骤1/4] 正在初始化浏览器...", "INFO")
-                    self.log("正在创建浏览器实例...", "DEBUG")
-                    from browser_simulator import SyncBrowserSimulator
-                    try:
-                        with SyncBrowserSimulator() as current_browser:
-                            current_browser.init_browser()
-                            self.log("[步骤1/4] 浏览器初始化完成", "INFO")
-                            self.log("浏览器实例创建成功", "DEBUG")
-                            
-                            # 更新状态为下载中
-                            url_item.update_status(URLItem.STATUS_DOWNLOADING)
-                            
-                            # 加载页面
-                            self.log(f"[步骤2/4] 正在加载页面: {url}", "INFO")
-                            self.log(f"请求URL: {url}", "DEBUG")
-                            success = current_browser.load_page(url)
-                            if not success:
-                                self.log("[步骤2/4] 页面加载失败", "ERROR")
-                                self.log("页面可能无法访问或网络连接失败", "ERROR")
-                                url_item.update_status(URLItem.STATUS_FAILED)
-                                failed_urls.append(url)
-                                continue
-                            self.log("[步骤2/4] 页面加载完成", "INFO")
-                            self.log("页面加载成功", "DEBUG")
-                            
-                            # 获取页面内容
-                            self.log("[步骤3/4] 正在获取页面内容...", "INFO")
-                            html = current_browser.get_page_content()
-                            if not html:
-                                self.log("[步骤3/4] 无法获取页面内容", "ERROR")
-                                self.log("页面内容为空或获取失败", "ERROR")
-                                url_item.update_status(URLItem.STATUS_FAILED)
-                                failed_urls.append(url)
-                                continue
-                            self.log(f"[步骤3/4] 页面内容获取完成，大小: {len(html)} 字符", "INFO")
-                            self.log(f"页面内容长度: {len(html)} 字符", "DEBUG")
-                            
-                            # 探测视频资源（使用browser中的video_resources，已经过滤为只包含m3u8和key关键词）
-                            self.log("[步骤4/4] 正在探测视频资源...", "INFO")
-                            self.log("正在分析页面内容，提取视频链接...", "DEBUG")
-                            
-                            try:
-                                videos = current_browser.get_video_resources()
-                                self.log(f"[步骤4/4] 视频资源探测完成，找到 {len(videos)} 个资源", "INFO")
-                                self.log(f"找到 {len(videos)} 个视频资源", "DEBUG")
-                                
-                                # 验证视频资源
-                                valid_videos = []
-                                for i, video in enumerate(videos):
-                                    video_url = video.get('url', '')
-                                    if not video_url:
-                                        self.log(f"[资源检查] 视频 {i+1} 没有URL，跳过", "WARNING")
-                                        continue
-                                    
-                                    # 验证视频URL格式
-                                    if not utils.is_valid_url(video_url):
-                                        self.log(f"[资源检查] 视频 {i+1} URL格式无效: {video_url}", "WARNING")
-                                        continue
-                                    
-                                    valid_videos.append(video)
-                                    self.log(f"[资源检查] 视频 {i+1} URL有效: {video_url[:80]}...", "DEBUG")
-                                
-                                if len(valid_videos) != len(videos):
-                                    self.log(f"[资源检查] 过滤后有效视频: {len(valid_videos)}/{len(videos)}", "INFO")
-                                
-                                videos = valid_videos
-                                
-                            except Exception as video_error:
-                                self.log(f"[错误] 获取视频资源失败: {video_error}", "ERROR")
-                                url_item.update_status(URLItem.STATUS_FAILED)
-                                failed_urls.append(url)
-                                continue
-                            
-                            if not videos:
-                                self.log("[警告] 未找到任何有效的视频资源", "WARNING")
-                                url_item.update_status(URLItem.STATUS_FAILED)
-                                failed_urls.append(url)
-                                continue
-                            
-                            # 检查是否有getmovie链接
-                            getmovie_found = False
-                            for video in videos:
-                                video_url = video.get('url', '')
-                                if 'getmovie' in video_url.lower():
-                                    # 找到getmovie链接，自动下载
-                                    self.log("[模式] 检测到getmovie链接，自动开始下载", "INFO")
-                                    self.log(f"[链接] 视频URL: {video_url}", "DEBUG")
-                                    download_success = self.download_video_automatically(video_url, task_id)
-                                    if download_success:
-                                        url_item.update_status(URLItem.STATUS_SUCCESS)
-                                        success_count += 1
-                                        getmovie_found = True
-                                        # 添加到下载历史记录
-                                        self.add_to_history(url)
-                                        # 更新任务状态为成功
-                                        self.state_manager.update_task_status(task_id, 'success')
-                                        # 清除已下载分片记录
-                                        self.state_manager.clear_downloaded_segments(task_id)
-                                        self.log(f"[任务] 任务 {task_id} 已完成", "DEBUG")
-                                    else:
-                                        url_item.update_status(URLItem.STATUS_FAILED)
-                                        failed_urls.append(url)
-                                        # 更新任务状态为失败
-                                        self.state_manager.update_task_status(task_id, 'failed')
-                                        self.log(f"[任务] 任务 {task_id} 已失败", "DEBUG")
-                                    break
-                        
-                        # 如果没有getmovie链接，检查是否有唯一的m3u8文件
-                        if not getmovie_found:
-                            m3u8_videos = [v for v in videos if v.get('url', '').lower().endswith('.m3u8')]
-                            if len(m3u8_videos) == 1:
-                                # 找到唯一的m3u8文件，自动下载
-                                self.log("[模式] 未检测到getmovie链接，但找到唯一的m3u8文件，自动开始下载", "INFO")
-                                m3u8_url = m3u8_videos[0].get('url', '')
-                                # 使用TS合并器下载
-                                def progress_callback(percentage, downloaded, total):
-                                    from PyQt5.QtWidgets import QApplication
-                                    QApplication.processEvents()
-                                    self.progress_bar.setValue(int(percentage))
-                                    self.progress_label.setText(f"下载进度: {downloaded}/{total} ({percentage:.1f}%)")
-                                    # 更新任务进度
-                                    self.state_manager.update_task_progress(task_id, percentage, downloaded, total)
-                                
-                                # 确保TS合并器的stop标志已重置
-                                self.ts_merger.should_stop = False
-                                
-                                # 设置当前任务ID
-                                self.ts_merger.current_task_id = task_id
-                                
-                                try:
-                                    result = self.ts_merger.download_and_merge(
-                                        m3u8_url,
-                                        self.download_path,
-                                        progress_callback=progress_callback
-                                    )
-                                    
-                                    # 清理临时目录（如果有）
-                                    if not result.get('success') and 'temp_subdir' in result and result['temp_subdir']:
-                                        try:
-                                            self.ts_merger.delete_temp_subdir(result['temp_subdir'])
-                                            self.log(f"[清理] 已删除临时目录: {result['temp_subdir']}", "INFO")
-                                        except Exception as e:
-                                            self.log(f"[清理] 删除临时目录失败: {e}", "ERROR")
-                                    
-                                    if result.get('success'):
-                                        url_item.update_status(URLItem.STATUS_SUCCESS)
-                                        success_count += 1
-                                        # 添加到下载历史记录
-                                        self.add_to_history(url)
-                                        # 更新任务状态为成功
-                                        self.state_manager.update_task_status(task_id, 'success')
-                                        # 清除已下载分片记录
-                                        self.state_manager.clear_downloaded_segments(task_id)
-                                        # 清理任务记录
-                                        self.state_manager.remove_task(task_id)
-                                        self.log(f"[任务] 任务 {task_id} 已完成并清理", "DEBUG")
-                                    else:
-                                        url_item.update_status(URLItem.STATUS_FAILED)
-                                        failed_urls.append(url)
-                                        self.log(f"[错误] 下载失败: {result.get('error', '未知错误')}", "ERROR")
-                                        # 更新任务状态为失败
-                                        self.state_manager.update_task_status(task_id, 'failed')
-                                        self.log(f"[任务] 任务 {task_id} 已失败", "DEBUG")
-                                except Exception as e:
-                                    # 捕获所有异常，确保程序不会崩溃
-                                    self.log(f"[错误] 下载过程中发生异常: {str(e)}", "ERROR")
-                                    import traceback
-                                    error_detail = traceback.format_exc()
-                                    self.log(f"[错误详情] {error_detail}", "ERROR")
-                                    url_item.update_status(URLItem.STATUS_FAILED)
-                                    failed_urls.append(url)
-                                finally:
-                                    # 确保ffmpeg进程被终止
-                                    if hasattr(self.ts_merger, 'ffmpeg_process') and self.ts_merger.ffmpeg_process:
-                                        try:
-                                            self.ts_merger.ffmpeg_process.terminate()
-                                            self.ts_merger.ffmpeg_process.wait(timeout=5)
-                                            self.ts_merger.ffmpeg_process = None
-                                        except Exception as terminate_error:
-                                            self.log(f"[错误] 终止ffmpeg进程失败: {str(terminate_error)}", "ERROR")
-                                    # 重置停止标志
-                                    self.ts_merger.should_stop = False
-                            else:
-                                # 没有唯一的m3u8文件，标记为需要手动下载
-                                self.log("[模式] 未检测到getmovie链接，且没有唯一的m3u8文件，标记为需要手动下载", "WARNING")
-                                url_item.update_status(URLItem.STATUS_PENDING)
-                                # 添加到视频列表供用户选择
-                                self.video_list.clear()
-                                self.video_items = []
-                                for i, video in enumerate(videos):
-                                    video_item = VideoItem(video)
-                                    self.video_list.addItem(video_item)
-                                    self.video_items.append(video_item)
-                                
-                                # 启用下载按钮
-                                self.download_button.setEnabled(True)
-                                self.log(f"找到 {len(videos)} 个视频资源，请选择要下载的视频", "INFO")
-                                # 不要使用continue，否则会跳过后续URL
-                                # continue
-                    except Exception as e:
-                        # 出现错误，标记为失败并继续
-                        self.log(f"[错误] 处理URL时发生错误: {str(e)}", "ERROR")
-                        import traceback
-                        error_detail = traceback.format_exc()
-                        self.log(f"[错误详情] {error_detail}", "ERROR")
-                        url_item.update_status(URLItem.STATUS_FAILED)
-                        failed_urls.append(url)
+                    # 启用下载按钮
+                    self.download_button.setEnabled(True)
+                    self.preview_button.setEnabled(True)
+                    self.log(f"找到 {len(videos)} 个视频资源，请选择要下载的视频", "INFO")
+                
+                def on_success(url, result):
+                    # 下载历史记录由流水线添加（包括解析出的视频流链接）
+                    self.file_logger.record_video('success', url, file=result.get('file_path'))
+                
+                self.pipeline = DownloadPipeline(
+                    self.tiered_detector,
+                    lambda: TSMerger(log_callback=self.log, state_manager=self.state_manager,
+                                     accurate_trim=self.accurate_trim),
+                    state_manager=self.state_manager,
+                    history=self.history_store,
+                    ignore_history=self.ignore_history,
+                    workers=self.pipeline_workers,
+                    download_path=self.download_path,
+                    time_range=self.time_range,
+                    log_callback=self.log,
+                    on_status=on_status,
+                    on_progress=on_progress,
+                    on_videos=on_videos,
+                    on_success=on_success,
+                    events=self.events
+                )
+                try:
+                    pipeline_result = self.pipeline.run(
+                        [{'url': item.url, 'task_id': item.task_id} for item in valid_url_items]
+                    )
+                finally:
+                    self.pipeline = None
+                # 已下载过而跳过的URL计为成功
+                success_count = len(pipeline_result['success_urls']) + len(pipeline_result['skipped_urls'])
+                if pipeline_result['skipped_urls']:
+                    self.log(f"[下载历史] 跳过 {len(pipeline_result['skipped_urls'])} 个已下载过的URL", "INFO")
+                failed_urls.extend(pipeline_result['failed_urls'])
                 
                 # 准备结果
                 result = {
@@ -1471,145 +1476,18 @@ class MainWindow(QMainWindow):
         
         # 启动线程
         self.worker_thread = WorkerThread(process_urls)
+        self.worker_thread.progress_updated.connect(self.on_progress_updated)
         self.worker_thread.finished.connect(self.on_detection_finished)
         self.worker_thread.start()
     
-    def download_video_automatically(self, video_url, task_id, max_retries=3, retry_delay=0.5):
-        """
-        自动下载视频（用于getmovie链接）
-        支持重试机制，当下载失败时会自动重新获取动态资源
-        
-        Args:
-            video_url: 视频URL
-            task_id: 任务ID
-            max_retries: 最大重试次数，默认3次
-            retry_delay: 重试间隔时间（秒），默认0.5秒
-        """
-        import time
-        import random
-        
-        retry_count = 0
-        last_error = None
-        
-        while retry_count < max_retries:
-            try:
-                retry_info = f"第 {retry_count + 1}/{max_retries} 次尝试" if retry_count > 0 else "首次尝试"
-                self.log(f"[自动下载] {retry_info}", "INFO")
-                
-                # 检查是否为getmovie链接
-                if 'getmovie' not in video_url.lower():
-                    self.log("[错误] 不是getmovie链接", "ERROR")
-                    return False
-                
-                # 处理getmovie链接
-                self.log("[模式] 检测到getmovie链接，使用特殊处理模式", "INFO")
-                self.log("将获取JSON数据并提取M3U8链接", "DEBUG")
-                
-                # 获取getmovie JSON数据（每次重试都重新获取，获取最新的动态资源）
-                import requests
-                import json
-                self.log(f"[请求] 正在获取getmovie数据: {video_url}", "INFO")
-                response = requests.get(video_url, timeout=30)
-                response.raise_for_status()
-                json_data = response.json()
-                
-                if 'm3u8' not in json_data:
-                    self.log("[错误] getmovie JSON中没有找到m3u8字段", "ERROR")
-                    return False
-                
-                m3u8_path = json_data['m3u8']
-                # 构造完整的M3U8 URL
-                from urllib.parse import urljoin
-                m3u8_url = urljoin(video_url, m3u8_path)
-                
-                self.log(f"[解析] 从getmovie JSON中提取到M3U8路径: {m3u8_path}", "INFO")
-                self.log(f"[构造] 完整的M3U8 URL: {m3u8_url}", "INFO")
-                
-                # 使用TS合并器下载
-                self.log("[模式] 检测到M3U8播放列表，使用TS分片合并模式", "INFO")
-                self.log("将使用并行下载和自动合并功能", "DEBUG")
-                
-                # 定义进度回调函数，更新UI进度条
-                def progress_callback(percentage, downloaded, total):
-                    # 使用QApplication.processEvents()确保UI更新
-                    from PyQt5.QtWidgets import QApplication
-                    QApplication.processEvents()
-                    # 更新进度条
-                    self.progress_bar.setValue(int(percentage))
-                    self.progress_label.setText(f"下载进度: {downloaded}/{total} ({percentage:.1f}%)")
-                    # 更新任务进度到状态管理器
-                    self.state_manager.update_task_progress(task_id, percentage, downloaded, total)
-                
-                self.log(f"[准备] 目标URL: {m3u8_url}", "INFO")
-                self.log(f"[准备] 保存路径: {self.download_path}", "INFO")
-                self.log(f"M3U8 URL: {m3u8_url}", "DEBUG")
-                
-                # 设置当前任务ID
-                self.ts_merger.current_task_id = task_id
-                
-                result = self.ts_merger.download_and_merge(
-                    m3u8_url,
-                    self.download_path,
-                    progress_callback=progress_callback
-                )
-                
-                # 清理临时目录（如果有）
-                if not result.get('success') and 'temp_subdir' in result and result['temp_subdir']:
-                    try:
-                        self.ts_merger.delete_temp_subdir(result['temp_subdir'])
-                        self.log(f"[清理] 已删除临时目录: {result['temp_subdir']}", "INFO")
-                    except Exception as e:
-                        self.log(f"[清理] 删除临时目录失败: {e}", "ERROR")
-                
-                if result.get('success'):
-                    self.log(f"[成功] 视频下载完成（{retry_info}）", "INFO")
-                    return True
-                else:
-                    error_msg = result.get('error', '未知错误')
-                    last_error = error_msg
-                    self.log(f"[失败] 视频下载失败（{retry_info}）: {error_msg}", "ERROR")
-                    
-                    # 如果还有重试次数，等待后重试
-                    if retry_count < max_retries - 1:
-                        # 使用随机间隔时间（500ms-1000ms）
-                        wait_time = retry_delay + random.uniform(0, 0.5)
-                        self.log(f"[重试] 等待 {wait_time:.2f} 秒后重新获取资源...", "INFO")
-                        time.sleep(wait_time)
-                        retry_count += 1
-                        self.log(f"[重试] 开始第 {retry_count + 1} 次尝试", "INFO")
-                    else:
-                        self.log(f"[失败] 已达到最大重试次数 ({max_retries})，下载失败", "ERROR")
-                        return False
-                        
-            except Exception as e:
-                last_error = str(e)
-                self.log(f"[错误] 自动下载失败（{retry_info}）: {str(e)}", "ERROR")
-                import traceback
-                error_detail = traceback.format_exc()
-                self.log(f"[错误详情] {error_detail}", "ERROR")
-                
-                # 如果还有重试次数，等待后重试
-                if retry_count < max_retries - 1:
-                    # 使用随机间隔时间（500ms-1000ms）
-                    wait_time = retry_delay + random.uniform(0, 0.5)
-                    self.log(f"[重试] 等待 {wait_time:.2f} 秒后重新获取资源...", "INFO")
-                    time.sleep(wait_time)
-                    retry_count += 1
-                    self.log(f"[重试] 开始第 {retry_count + 1} 次尝试", "INFO")
-                else:
-                    self.log(f"[失败] 已达到最大重试次数 ({max_retries})，下载失败", "ERROR")
-                    return False
-        
-        # 所有重试都失败了
-        self.log(f"[失败] 自动下载最终失败，最后错误: {last_error}", "ERROR")
-        return False
-    
     def on_detection_finished(self, result):
         """
         探测完成回调
         """
         # 启用按钮
         self.start_button.setEnabled(True)
+        # 控制接口发起的处理只记录日志，不弹出对话框
+        interactive = self.detection_interactive
         
         if result.get('success'):
             failed_urls = result.get('failed_urls', [])
@@ -1625,71 +1503,84 @@ class MainWindow(QMainWindow):
                 failed_list = "\n".join(failed_urls)
                 self.log(f"失败的URL: {failed_list}", "ERROR")
                 self.progress_label.setText(f"处理完成，{success_count} 个成功，{len(failed_urls)} 个失败")
-                QMessageBox.warning(
-                    self, 
-                    "部分失败", 
-                    f"处理完成，但有 {len(failed_urls)} 个URL下载失败:\n\n{failed_list}"
-                )
+                if interactive:
+                    QMessageBox.warning(
+                        self, 
+                        "部分失败", 
+                        f"处理完成，但有 {len(failed_urls)} 个URL下载失败:\n\n{failed_list}"
+                    )
             else:
                 # 所有网址都下载成功
                 self.log("所有URL下载成功", "INFO")
                 self.progress_label.setText(f"所有 {total_count} 个URL下载成功")
-                QMessageBox.information(
-                    self, 
-                    "全部成功", 
-                    f"所有 {total_count} 个URL下载成功！"
-                )
+                if interactive:
+                    QMessageBox.information(
+                        self, 
+                        "全部成功", 
+                        f"所有 {total_count} 个URL下载成功！"
+                    )
         else:
             error = result.get('error', '未知错误')
             failed_urls = result.get('failed_urls', [])
             self.log(f"探测失败: {error}", "ERROR")
             self.progress_label.setText("探测失败")
             
-            if failed_urls:
+            if interactive and failed_urls:
                 failed_list = "\n".join(failed_urls)
                 QMessageBox.critical(
                     self, 
                     "错误", 
                     f"探测失败: {error}\n\n失败的URL:\n{failed_list}"
                 )
-            else:
+            elif interactive:
                 QMessageBox.critical(self, "错误", f"探测失败: {error}")
         
         self.progress_bar.setValue(100)
         self.log("探测任务完成", "INFO")
+        self.start_pending_api_tasks()
     
     def download_selected_video(self):
         """
         下载选中的视频
         """
-        # 获取选中项
-        selected_items = self.video_list.selectedItems()
+        # 获取选中项（可以多选）
+        selected_items = [item for item in self.video_list.selectedItems() if isinstance(item, VideoItem)]
         if not selected_items:
             QMessageBox.warning(self, "警告", "请选择要下载的视频")
             return
         
-        selected_item = selected_items[0]
-        if not isinstance(selected_item, VideoItem):
-            return
+        video_urls = [item.video_info.get('url', '') for item in selected_items]
         
-        video_info = selected_item.video_info
-        video_url = video_info.get('url', '')
+        # 读取截取时间段
+        time_range = self.read_time_range()
+        if time_range is False:
+            return
+        self.time_range = time_range
         
         # 禁用按钮
         self.download_button.setEnabled(False)
+        self.preview_button.setEnabled(False)
         self.start_button.setEnabled(False)
         
         # 显示状态
         self.log("======================================", "INFO")
-        self.log(f"开始下载视频: {video_url}", "INFO")
-        self.log(f"视频URL: {video_url}", "DEBUG")
+        if len(video_urls) == 1:
+            self.log(f"开始下载视频: {video_urls[0]}", "INFO")
+        else:
+            self.log(f"开始下载选中的 {len(video_urls)} 个视频", "INFO")
+        for video_url in video_urls:
+            self.log(f"视频URL: {video_url}", "DEBUG")
         self.log(f"保存路径: {self.download_path}", "DEBUG")
         self.log("======================================", "INFO")
         self.progress_label.setText("正在准备下载...")
         self.progress_bar.setValue(0)
         
+        def progress_callback(percentage, downloaded, total):
+            # 发射进度更新信号
+            self.worker_thread.progress_updated.emit(percentage, downloaded, total)
+        
         # 启动工作线程
-        def download_video():
+        def download_video(video_url):
             try:
                 # 检查是否为getmovie链接
                 if 'getmovie' in video_url.lower():
@@ -1717,22 +1608,19 @@ class MainWindow(QMainWindow):
                         self.log("[模式] 检测到M3U8播放列表，使用TS分片合并模式", "INFO")
                         self.log("将使用并行下载和自动合并功能", "DEBUG")
                         
-                        # 定义进度回调函数
-                        def progress_callback(percentage, downloaded, total):
-                            # 发射进度更新信号
-                            self.worker_thread.progress_updated.emit(percentage, downloaded, total)
-                        
                         self.log(f"[准备] 目标URL: {m3u8_url}", "INFO")
                         self.log(f"[准备] 保存路径: {self.download_path}", "INFO")
                         self.log(f"M3U8 URL: {m3u8_url}", "DEBUG")
                         
-                        # 设置当前任务ID
-                        self.ts_merger.current_task_id = task_id
+                        # 手动下载不关联任务，避免沿用上一次自动下载的任务ID
+                        self.ts_merger.current_task_id = None
                         
                         result = self.ts_merger.download_and_merge(
                             m3u8_url,
                             self.download_path,
-                            progress_callback=progress_callback
+                            progress_callback=progress_callback,
+                            start_time=self.time_range[0],
+                            end_time=self.time_range[1]
                         )
                     else:
                         self.log("[错误] getmovie JSON中没有找到m3u8字段", "ERROR")
@@ -1743,30 +1631,25 @@ class MainWindow(QMainWindow):
                     self.log("[模式] 检测到M3U8播放列表，使用TS分片合并模式", "INFO")
                     self.log("将使用并行下载和自动合并功能", "DEBUG")
                     
-                    # 定义进度回调函数
-                    def progress_callback(percentage, downloaded, total):
-                        # 发射进度更新信号
-                        self.worker_thread.progress_updated.emit(percentage, downloaded, total)
-                    
                     self.log(f"[准备] 目标URL: {video_url}", "INFO")
                     self.log(f"[准备] 保存路径: {self.download_path}", "INFO")
                     self.log(f"M3U8 URL: {video_url}", "DEBUG")
                     
+                    # 手动下载不关联任务，避免沿用上一次自动下载的任务ID
+                    self.ts_merger.current_task_id = None
+                    
                     result = self.ts_merger.download_and_merge(
                         video_url,
                         self.download_path,
-                        progress_callback=progress_callback
+                        progress_callback=progress_callback,
+                        start_time=self.time_range[0],
+                        end_time=self.time_range[1]
                     )
                 else:
                     # 使用普通下载器
                     self.log("[模式] 使用普通视频下载模式", "INFO")
                     self.log("将直接下载完整视频文件", "DEBUG")
                     
-                    # 定义进度回调函数
-                    def progress_callback(percentage, downloaded, total):
-                        # 发射进度更新信号
-                        self.worker_thread.progress_updated.emit(percentage, downloaded, total)
-                    
                     self.log(f"[准备] 目标URL: {video_url}", "INFO")
                     self.log(f"[准备] 保存路径: {self.download_path}", "INFO")
                     self.log(f"视频URL: {video_url}", "DEBUG")
@@ -1785,12 +1668,117 @@ class MainWindow(QMainWindow):
                 self.log(f"[错误详情] {error_detail}", "ERROR")
                 return {'success': False, 'error': str(e)}
         
+        def download_videos():
+            if len(video_urls) == 1:
+                return download_video(video_urls[0])
+            # 普通视频文件并行下载（共享带宽上限），M3U8和getmovie视频依次用TS合并器下载
+            file_urls = [url for url in video_urls
+                         if 'getmovie' not in url.lower() and not self.ts_merger.is_m3u8_url(url)]
+            results = {}
+            if file_urls:
+                self.log(f"[模式] 并行下载 {len(file_urls)} 个普通视频文件"
+                         f"（同时 {self.downloader.max_parallel_downloads} 个）", "INFO")
+                try:
+                    file_results = self.downloader.download_videos(
+                        file_urls,
+                        self.download_path,
+                        progress_callback=progress_callback,
+                        file_progress_callback=lambda done, total: self.log(
+                            f"[批量下载] 已完成 {done}/{total} 个文件", "INFO")
+                    )
+                except Exception as e:
+                    self.log(f"[错误] 批量下载过程中发生错误: {str(e)}", "ERROR")
+                    file_results = [{'success': False, 'error': str(e)}] * len(file_urls)
+                results.update(zip(file_urls, file_results))
+            for video_url in video_urls:
+                if video_url not in results:
+                    self.log(f"[批量下载] 开始下载: {video_url}", "INFO")
+                    results[video_url] = download_video(video_url)
+            return {
+                'success': all(result.get('success') for result in results.values()),
+                'results': [dict(result, url=url) for url, result in results.items()]
+            }
+        
         # 启动线程
-        self.worker_thread = WorkerThread(download_video)
+        self.worker_thread = WorkerThread(download_videos)
         self.worker_thread.progress_updated.connect(self.on_progress_updated)
         self.worker_thread.finished.connect(self.on_download_finished)
         self.worker_thread.start()
     
+    def preview_selected_video(self):
+        """
+        预览选中的视频
+        只下载开头若干秒的分片并合并为小文件，分片保留供之后完整下载复用
+        """
+        selected_items = self.video_list.selectedItems()
+        if not selected_items or not isinstance(selected_items[0], VideoItem):
+            QMessageBox.warning(self, "警告", "请选择要预览的视频")
+            return
+        
+        video_url = selected_items[0].video_info.get('url', '')
+        if 'getmovie' not in video_url.lower() and not self.ts_merger.is_m3u8_url(video_url):
+            QMessageBox.warning(self, "警告", "只支持预览M3U8或getmovie视频")
+            return
+        if self.preview_thread and self.preview_thread.isRunning():
+            QMessageBox.warning(self, "警告", "正在生成预览，请稍候")
+            return
+        
+        self.preview_button.setEnabled(False)
+        self.log(f"开始预览视频（前 {self.preview_seconds} 秒）: {video_url}", "INFO")
+        self.progress_label.setText("正在生成预览...")
+        self.progress_bar.setValue(0)
+        
+        def preview_video():
+            try:
+                m3u8_url = video_url
+                if 'getmovie' in video_url.lower():
+                    import requests
+                    from urllib.parse import urljoin
+                    response = requests.get(video_url, timeout=30)
+                    response.raise_for_status()
+                    json_data = response.json()
+                    if 'm3u8' not in json_data:
+                        return {'success': False, 'error': 'getmovie JSON中没有找到m3u8字段'}
+                    m3u8_url = urljoin(video_url, json_data['m3u8'])
+                
+                def progress_callback(percentage, downloaded, total):
+                    self.preview_thread.progress_updated.emit(percentage, downloaded, total)
+                
+                # 预览不关联任务，使用独立的TS合并器，预览的临时目录记录在所有合并器共用的表中
+                self.preview_merger = TSMerger(log_callback=self.log)
+                return self.preview_merger.preview(
+                    m3u8_url,
+                    seconds=self.preview_seconds,
+                    progress_callback=progress_callback
+                )
+            except Exception as e:
+                self.log(f"[错误] 预览过程中发生错误: {str(e)}", "ERROR")
+                return {'success': False, 'error': str(e)}
+        
+        self.preview_thread = WorkerThread(preview_video)
+        self.preview_thread.progress_updated.connect(self.on_progress_updated)
+        self.preview_thread.finished.connect(self.on_preview_finished)
+        self.preview_thread.start()
+    
+    def on_preview_finished(self, result):
+        """
+        预览完成回调
+        """
+        self.preview_button.setEnabled(True)
+        
+        if result.get('success'):
+            file_path = result.get('file_path', '')
+            self.log(f"预览文件已生成: {file_path}", "INFO")
+            self.progress_label.setText("预览已生成")
+            # 使用系统默认播放器打开预览文件
+            from PyQt5.QtGui import QDesktopServices
+            QDesktopServices.openUrl(QUrl.fromLocalFile(file_path))
+        else:
+            error = result.get('error', '未知错误')
+            self.log(f"预览失败: {error}", "ERROR")
+            self.progress_label.setText("预览失败")
+            QMessageBox.critical(self, "错误", f"预览失败: {error}")
+    
     def on_progress_updated(self, percentage, downloaded, total):
         """
         进度更新回调
@@ -1805,10 +1793,13 @@ class MainWindow(QMainWindow):
         """
         # 启用按钮
         self.download_button.setEnabled(True)
+        self.preview_button.setEnabled(True)
         self.start_button.setEnabled(True)
         self.log("按钮已重新启用", "INFO")
         
-        if result['success']:
+        if 'results' in result:
+            self.on_batch_download_finished(result['results'])
+        elif result['success']:
             file_path = result.get('file_path', '')
             filename = result.get('filename', '')
             file_size = result.get('size', 0)
@@ -1820,17 +1811,44 @@ class MainWindow(QMainWindow):
             self.log(f"文件路径: {file_path}", "DEBUG")
             self.log(f"文件大小: {file_size} 字节", "DEBUG")
             
+            self.file_logger.record_video('success', file=file_path)
             self.progress_label.setText("下载完成")
             QMessageBox.information(self, "成功", f"视频下载完成！\n保存路径: {file_path}")
         else:
             error = result.get('error', '未知错误')
             self.log(f"下载失败: {error}", "ERROR")
+            self.file_logger.record_video('failed', error=error)
             self.progress_label.setText("下载失败")
             QMessageBox.critical(self, "错误", f"下载失败: {error}")
         
         self.progress_bar.setValue(100)
         self.log("下载任务完成", "INFO")
+        self.start_pending_api_tasks()
     
+    def on_batch_download_finished(self, results):
+        """
+        多个视频下载完成：逐个记录结果并汇总提示
+        """
+        failed = []
+        for result in results:
+            if result.get('success'):
+                file_path = result.get('file_path', '')
+                self.log(f"下载完成: {file_path}（{utils.format_file_size(result.get('size', 0))}）", "INFO")
+                self.file_logger.record_video('success', result['url'], file=file_path)
+            else:
+                error = result.get('error', '未知错误')
+                self.log(f"下载失败: {result['url']}: {error}", "ERROR")
+                self.file_logger.record_video('failed', result['url'], error=error)
+                failed.append(f"{result['url']}: {error}")
+        
+        succeeded = len(results) - len(failed)
+        self.progress_label.setText(f"下载完成，{succeeded} 个成功，{len(failed)} 个失败")
+        if failed:
+            failed_list = "\n".join(failed)
+            QMessageBox.warning(self, "部分失败", f"{succeeded} 个视频下载完成，{len(failed)} 个失败:\n\n{failed_list}")
+        else:
+            QMessageBox.information(self, "成功", f"{succeeded} 个视频全部下载完成！\n保存路径: {self.download_path}")
+
     def clear_all(self):
         """
         清空所有输入和输出
@@ -1840,7 +1858,7 @@ class MainWindow(QMainWindow):
         self.log("已清空URL列表", "INFO")
         
         # 清空控制台输出
-        self.console.clear()
+        self.console_model.clear()
         self.log("已清空控制台输出", "INFO")
         
         # 清空视频列表
@@ -1855,6 +1873,7 @@ class MainWindow(QMainWindow):
         
         # 禁用下载按钮
         self.download_button.setEnabled(False)
+        self.preview_button.setEnabled(False)
         self.log("已禁用下载按钮", "INFO")
         
         # 确保开始按钮是可用的
@@ -1931,6 +1950,7 @@ class MainWindow(QMainWindow):
         关闭窗口事件
         """
         print("[关闭] 开始关闭窗口事件")
+        self.stop_control_api()
         
         # 检查是否有任务正在下载
         has_downloading_tasks = False
@@ -1968,6 +1988,16 @@ class MainWindow(QMainWindow):
                     # 1. 停止所有下载相关的工作
                     print("[关闭] 开始停止下载工作")
                     
+                    # 停止下载流水线（各阶段的TS合并器可能有ffmpeg进程）
+                    # 流水线结束后self.pipeline会被清空，先保存引用，关闭状态管理器前等待各阶段线程结束
+                    pipeline = self.pipeline
+                    if pipeline:
+                        try:
+                            pipeline.stop()
+                            print("[关闭] 下载流水线已停止")
+                        except Exception as e:
+                            print(f"[关闭] 停止下载流水线失败: {e}")
+                    
                     # 停止TS合并器（优先级最高，因为它可能有ffmpeg进程）
                     if hasattr(self, 'ts_merger') and self.ts_merger:
                         try:
@@ -1976,6 +2006,16 @@ class MainWindow(QMainWindow):
                         except Exception as e:
                             print(f"[关闭] 停止TS合并器失败: {e}")
                     
+                    # 停止预览
+                    if self.preview_thread and self.preview_thread.isRunning():
+                        try:
+                            if self.preview_merger:
+                                self.preview_merger.stop()
+                            self.preview_thread.wait(3000)
+                            print("[关闭] 预览线程已停止")
+                        except Exception as e:
+                            print(f"[关闭] 停止预览线程失败: {e}")
+                    
                     # 停止工作线程
                     if hasattr(self, 'worker_thread') and self.worker_thread:
                         try:
@@ -1986,6 +2026,13 @@ class MainWindow(QMainWindow):
                         except Exception as e:
                             print(f"[关闭] 停止工作线程失败: {e}")
                     
+                    # 等待流水线各阶段线程结束，之后不会再有进度和分片写入
+                    if pipeline:
+                        if pipeline.wait(timeout=15):
+                            print("[关闭] 下载流水线线程已全部结束")
+                        else:
+                            print("[关闭] 警告：等待下载流水线线程结束超时")
+                    
                     # 停止浏览器模拟器
                     if hasattr(self, 'browser') and self.browser:
                         try:
@@ -1994,6 +2041,9 @@ class MainWindow(QMainWindow):
                         except Exception as e:
                             print(f"[关闭] 关闭浏览器失败: {e}")
                     
+                    # 关闭浏览器池
+                    self.close_browser_pool()
+                    
                     # 停止其他模块
                     if hasattr(self, 'downloader') and self.downloader:
                         try:
@@ -2025,20 +2075,23 @@ class MainWindow(QMainWindow):
                                     self.state_manager.update_task_status(task_id, 'paused')
                                     print(f"[关闭] 任务 {task_id} 已标记为暂停")
                             
+                            # 写入缓存的进度和已下载分片
+                            self.state_manager.close()
                             print(f"[关闭] 已保存任务状态")
                             
-                            # 检查配置文件是否存在
+                            # 检查状态数据库是否存在
                             import os
-                            if os.path.exists(self.state_manager.config_file):
-                                print(f"[关闭] 配置文件已创建: {self.state_manager.config_file}")
+                            if os.path.exists(self.state_manager.db_file):
+                                print(f"[关闭] 状态数据库已保存: {self.state_manager.db_file}")
                             else:
-                                print(f"[关闭] 警告：配置文件不存在: {self.state_manager.config_file}")
+                                print(f"[关闭] 警告：状态数据库不存在: {self.state_manager.db_file}")
                         except Exception as e:
                             print(f"[关闭] 保存任务状态失败: {e}")
                             import traceback
                             traceback.print_exc()
                     
-                    # 3. 关闭弹窗并退出程序
+                    # 3. 写入剩余的日志，关闭弹窗并退出程序
+                    self.file_logger.close()
                     print("[关闭] 准备关闭程序")
                     msg_box.close()
                     QApplication.quit()
@@ -2048,6 +2101,7 @@ class MainWindow(QMainWindow):
                     import traceback
                     traceback.print_exc()
                     # 即使出错也要关闭程序
+                    self.file_logger.close()
                     msg_box.close()
                     QApplication.quit()
             
@@ -2056,8 +2110,28 @@ class MainWindow(QMainWindow):
         else:
             # 如果没有任务正在下载，直接关闭
             print("[关闭] 没有任务正在下载，直接关闭")
+            self.close_browser_pool()
+            if hasattr(self, 'state_manager') and self.state_manager:
+                try:
+                    self.state_manager.close()
+                except Exception as e:
+                    print(f"[关闭] 保存任务状态失败: {e}")
+            self.file_logger.close()
             event.accept()
     
+    def close_browser_pool(self):
+        """
+        关闭浏览器池中的所有浏览器
+        """
+        if hasattr(self, 'tiered_detector') and self.tiered_detector:
+            self.tiered_detector.cancel_prefetch()
+        if hasattr(self, 'browser_pool') and self.browser_pool:
+            try:
+                self.browser_pool.close()
+                print("[关闭] 浏览器池已关闭")
+            except Exception as e:
+                print(f"[关闭] 关闭浏览器池失败: {e}")
+    
     def close_application(self):
         """
         关闭应用程序
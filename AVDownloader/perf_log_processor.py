@@ -0,0 +1,93 @@
+import json
+from typing import List, Dict, Any, Optional
+
+
+class PerformanceLogProcessor:
+    """
+    性能日志增量处理器
+    Chrome性能日志中绝大多数是Page.*、Network.dataReceived等与视频探测无关的事件，
+    先用子字符串检查原始消息，只对需要的事件调用json.loads，并只保留用到的字段
+    """
+
+    REQUEST_WILL_BE_SENT = 'Network.requestWillBeSent'
+    RESPONSE_RECEIVED = 'Network.responseReceived'
+    LOAD_EVENT_FIRED = 'Page.loadEventFired'
+
+    def __init__(self, track_load_event: bool = False):
+        """
+        初始化性能日志处理器
+
+        Args:
+            track_load_event: 是否保留Page.loadEventFired事件（多标签页探测时用于判断页面加载完成）
+        """
+        self.track_load_event = track_load_event
+        # 原始消息中方法名带引号出现，避免匹配到URL等字段中的同名字符串
+        self.request_marker = f'"{self.REQUEST_WILL_BE_SENT}"'
+        self.response_marker = f'"{self.RESPONSE_RECEIVED}"'
+        self.load_marker = f'"{self.LOAD_EVENT_FIRED}"'
+        # 统计信息
+        self.total_entries = 0
+        self.parsed_entries = 0
+
+    def _classify(self, message: str) -> Optional[str]:
+        """
+        根据原始消息字符串判断是否需要解析，返回事件方法名
+        """
+        if self.request_marker in message:
+            return self.REQUEST_WILL_BE_SENT
+        # 只关心HLS播放列表的响应
+        if self.response_marker in message and ('mpegurl' in message or 'mpegURL' in message):
+            return self.RESPONSE_RECEIVED
+        if self.track_load_event and self.load_marker in message:
+            return self.LOAD_EVENT_FIRED
+        return None
+
+    def process(self, logs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        处理一批性能日志
+
+        Returns:
+            精简后的事件列表，每项包含 method、webview 以及该事件需要的字段：
+            requestWillBeSent: url、http_method、resource_type、headers
+            responseReceived: url、mime_type、status
+        """
+        events = []
+        self.total_entries += len(logs)
+        for entry in logs:
+            message = entry.get('message', '')
+            method = self._classify(message)
+            if method is None:
+                continue
+            try:
+                data = json.loads(message)
+            except ValueError:
+                continue
+            self.parsed_entries += 1
+
+            params = data.get('message', {}).get('params', {})
+            event = {'method': method, 'webview': data.get('webview')}
+            if method == self.REQUEST_WILL_BE_SENT:
+                request_data = params.get('request', {})
+                event['url'] = request_data.get('url', '')
+                event['http_method'] = request_data.get('method', 'GET')
+                event['resource_type'] = params.get('type', '')
+                event['headers'] = request_data.get('headers', {})
+            elif method == self.RESPONSE_RECEIVED:
+                response = params.get('response', {})
+                event['url'] = response.get('url', '')
+                event['mime_type'] = response.get('mimeType', '').lower()
+                event['status'] = response.get('status', 200)
+            events.append(event)
+        return events
+
+    def drain(self, driver) -> List[Dict[str, Any]]:
+        """
+        读取浏览器中尚未读取的性能日志并处理（性能日志读取后即从浏览器中清除）
+        """
+        return self.process(driver.get_log('performance'))
+
+    def get_stats(self) -> Dict[str, int]:
+        """
+        获取处理统计：总日志条数和实际解析的条数
+        """
+        return {'total': self.total_entries, 'parsed': self.parsed_entries}
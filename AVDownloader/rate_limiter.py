@@ -0,0 +1,61 @@
+import threading
+import time
+from typing import Optional
+
+
+class TokenBucket:
+    """
+    令牌桶限速器
+    多个下载线程共享同一个令牌桶，使总带宽不超过设定的上限
+    """
+
+    def __init__(self, rate: Optional[float] = None, capacity: Optional[float] = None):
+        """
+        初始化令牌桶
+
+        Args:
+            rate: 每秒补充的令牌数（字节/秒），None或0表示不限速
+            capacity: 桶容量（允许的突发字节数），默认为1秒的流量
+        """
+        self.rate = rate or 0
+        self.capacity = capacity or self.rate
+        self.tokens = self.capacity
+        self.last_refill = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self) -> None:
+        """
+        按经过的时间补充令牌（调用方需持有锁）
+        """
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+
+    def consume(self, amount: float, should_stop=None) -> bool:
+        """
+        消耗指定数量的令牌，令牌不足时阻塞等待
+
+        Args:
+            amount: 需要消耗的令牌数（字节）
+            should_stop: 可选的停止检查函数，返回True时放弃等待
+
+        Returns:
+            成功获取令牌返回True，被停止时返回False
+        """
+        if self.rate <= 0:
+            return True
+
+        # 超过桶容量的请求拆分成多次获取，避免永远等不到
+        while amount > 0:
+            if should_stop and should_stop():
+                return False
+            part = min(amount, self.capacity)
+            with self.lock:
+                self._refill()
+                if self.tokens >= part:
+                    self.tokens -= part
+                    amount -= part
+                    continue
+                wait_time = (part - self.tokens) / self.rate
+            time.sleep(min(wait_time, 0.5))
+        return True
@@ -0,0 +1,96 @@
+from typing import List, Dict, Any, Callable, Iterator
+from utils import utils
+
+
+class VideoResourceRegistry:
+    """
+    视频资源登记表
+    以规范化URL为键保存视频资源，添加和去重都是O(1)；
+    同一资源被多个来源（网络请求、HTML标签、JavaScript）发现时合并来源信息，
+    排序时可以根据相互印证的来源数量判断可信度
+    """
+
+    # 资源类型对应的来源分类
+    PROVENANCE_NETWORK = 'network'
+    PROVENANCE_HTML = 'html'
+    PROVENANCE_JS = 'js'
+
+    def __init__(self):
+        # {规范化URL: 资源}，保持添加顺序
+        self.index = {}
+
+    @classmethod
+    def provenance_of(cls, resource: Dict[str, Any]) -> str:
+        """
+        判断资源的来源分类
+        """
+        if resource.get('source') == 'network' or resource.get('type') == 'network':
+            return cls.PROVENANCE_NETWORK
+        if resource.get('type') in ('regex', 'json', 'js'):
+            return cls.PROVENANCE_JS
+        return cls.PROVENANCE_HTML
+
+    def add(self, resource: Dict[str, Any]) -> bool:
+        """
+        添加视频资源，已存在时合并来源和缺少的字段
+
+        Returns:
+            是新资源返回True，已存在返回False
+        """
+        key = utils.canonicalize_url(resource.get('url', ''))
+        if not key:
+            return False
+
+        provenance = self.provenance_of(resource)
+        existing = self.index.get(key)
+        if existing is None:
+            resource = dict(resource)
+            resource['url'] = utils.unescape_url(resource['url'])
+            resource['sources'] = sorted(set(resource.get('sources', [])) | {provenance})
+            self.index[key] = resource
+            return True
+
+        existing['sources'] = sorted(set(existing['sources']) | set(resource.get('sources', [])) | {provenance})
+        # 浏览器实际请求的URL最可靠，优先使用
+        if provenance == self.PROVENANCE_NETWORK:
+            existing['url'] = utils.unescape_url(resource['url'])
+        for field, value in resource.items():
+            if field not in existing:
+                existing[field] = value
+        return False
+
+    def add_all(self, resources: List[Dict[str, Any]]) -> int:
+        """
+        批量添加视频资源
+
+        Returns:
+            新添加的资源数量
+        """
+        return sum(1 for resource in resources if self.add(resource))
+
+    def keep_if(self, predicate: Callable[[Dict[str, Any]], bool]) -> None:
+        """
+        只保留满足条件的资源
+        """
+        self.index = {key: resource for key, resource in self.index.items() if predicate(resource)}
+
+    def to_list(self) -> List[Dict[str, Any]]:
+        """
+        按添加顺序返回所有资源
+        """
+        return list(self.index.values())
+
+    def clear(self) -> None:
+        """
+        清空登记表
+        """
+        self.index.clear()
+
+    def __contains__(self, url: str) -> bool:
+        return utils.canonicalize_url(url) in self.index
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        return iter(list(self.index.values()))
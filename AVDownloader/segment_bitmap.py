@@ -0,0 +1,71 @@
+from typing import List, Iterator
+
+
+class SegmentBitmap:
+    """
+    分片完成位图
+    每个分片占一位，判断和记录分片是否已下载都是O(1)；
+    10000个分片只占约1.2KB，可以直接作为快照保存到数据库
+    """
+
+    def __init__(self, data: bytes = b''):
+        """
+        初始化位图
+
+        Args:
+            data: 之前保存的位图数据（to_bytes()的结果）
+        """
+        self.bits = bytearray(data)
+        self.count = bin(int.from_bytes(self.bits, 'little')).count('1') if self.bits else 0
+
+    def add(self, index: int) -> bool:
+        """
+        标记分片已完成
+
+        Returns:
+            之前未完成返回True，已经标记过返回False
+        """
+        byte, mask = index >> 3, 1 << (index & 7)
+        if byte >= len(self.bits):
+            self.bits.extend(bytes(byte - len(self.bits) + 1))
+        if self.bits[byte] & mask:
+            return False
+        self.bits[byte] |= mask
+        self.count += 1
+        return True
+
+    def indices(self) -> List[int]:
+        """
+        按顺序返回所有已完成的分片索引
+        """
+        result = []
+        for byte_index, value in enumerate(self.bits):
+            if not value:
+                continue
+            base = byte_index << 3
+            for bit in range(8):
+                if value & (1 << bit):
+                    result.append(base + bit)
+        return result
+
+    def to_bytes(self) -> bytes:
+        """
+        导出位图数据（用于保存快照）
+        """
+        return bytes(self.bits)
+
+    def copy(self) -> 'SegmentBitmap':
+        bitmap = SegmentBitmap()
+        bitmap.bits = bytearray(self.bits)
+        bitmap.count = self.count
+        return bitmap
+
+    def __contains__(self, index: int) -> bool:
+        byte = index >> 3
+        return 0 <= byte < len(self.bits) and bool(self.bits[byte] & (1 << (index & 7)))
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.indices())
@@ -0,0 +1,82 @@
+import re
+import time
+import random
+from content_scanner import content_scanner, AHOCORASICK_AVAILABLE
+
+# 测试页面扫描器的性能：构造与真实单页应用页面结构相似的大页面
+# （大段内联JavaScript、大量普通链接和图片、少量视频链接和getmovie数据），
+# 比较原来的多次正则扫描与单次扫描的耗时和结果
+def build_page(size_mb=4, seed=1):
+    random.seed(seed)
+    parts = ['<!DOCTYPE html><html><head><title>test</title>']
+    parts.append('<link rel="stylesheet" href="https://cdn.example.com/static/app.css">')
+    parts.append('</head><body><div id="app">')
+    target = size_mb * 1024 * 1024
+    size = 0
+    i = 0
+    while size < target:
+        i += 1
+        choice = random.random()
+        if choice < 0.45:
+            chunk = f'<a href="https://www.example.com/list/{i}?page={i % 50}"><img src="https://img.example.com/cover/{i}.jpg" alt="cover {i}"></a>'
+        elif choice < 0.9:
+            chunk = ('<script>!function(e){var t={};function n(r){if(t[r])return t[r].exports;' * 3
+                     + f'var o=t[r]={{i:r,l:!1,exports:{{}}}};e[r].call(o.exports,o,o.exports,n);return o.exports}}n.p="https://cdn.example.com/js/chunk-{i}.js";n.onkeydown=function(x){{return x.keyCode}}}}([]);</script>')
+        elif choice < 0.999:
+            chunk = f'<div class="item" data-id="{i}"><span>{"文字" * 20}</span></div>'
+        else:
+            chunk = (f'<video src="https://v.example.com/play/{i}/index.m3u8" controls></video>'
+                     f'<script>var player={{"url":"https:\\/\\/v.example.com\\/hls\\/{i}\\/index.m3u8"}};'
+                     f'var cfg={{"getmovie":"1","m3u8":"/hls/{i}/master.m3u8"}};</script>')
+        parts.append(chunk)
+        size += len(chunk)
+    parts.append('</div></body></html>')
+    return ''.join(parts)
+
+def legacy_scan(html):
+    # 原来的做法：每种关键词单独扫描一次，并用HTML解析器提取标签
+    found = set()
+    try:
+        from bs4 import BeautifulSoup
+        soup = BeautifulSoup(html, 'html.parser')
+        for tag in soup.find_all(['video', 'source', 'iframe']):
+            src = tag.get('src', '')
+            if 'm3u8' in src.lower() or 'key' in src.lower() or 'getmovie' in src.lower():
+                found.add(src)
+    except ImportError:
+        print("  （未安装BeautifulSoup，原做法只统计正则扫描部分）")
+    for keyword in ['m3u8', 'key', 'getmovie']:
+        pattern = re.compile(r'https?://[^\s"\']+[\w\-./?%&=]*' + keyword + r'[\w\-./?%&=]*', re.IGNORECASE)
+        for match in pattern.finditer(html):
+            found.add(match.group(0))
+    for match in re.compile(r'\{[^\}]*getmovie[^\}]*\}', re.IGNORECASE).finditer(html):
+        found.add(match.group(0))
+    return found
+
+def test_content_scanner():
+    print("开始测试页面扫描器性能...")
+    print(f"Aho-Corasick预过滤: {'已启用' if AHOCORASICK_AVAILABLE else '未安装pyahocorasick，使用字符串查找'}")
+
+    for size_mb in [1, 4]:
+        html = build_page(size_mb)
+        print(f"\n页面大小: {len(html) / 1024 / 1024:.1f} MB")
+
+        start_time = time.time()
+        legacy_results = legacy_scan(html)
+        legacy_time = time.time() - start_time
+
+        start_time = time.time()
+        results = content_scanner.scan(html, "https://www.example.com/video/1")
+        scan_time = time.time() - start_time
+
+        print(f"  原做法: {legacy_time:.3f} 秒，{len(legacy_results)} 个匹配")
+        print(f"  单次扫描: {scan_time:.3f} 秒，{len(results)} 个匹配")
+        kinds = {}
+        for item in results:
+            kinds[item['kind']] = kinds.get(item['kind'], 0) + 1
+        print(f"  匹配类型: {kinds}")
+
+    print("\n测试完成")
+
+if __name__ == "__main__":
+    test_content_scanner()
@@ -0,0 +1,61 @@
+import sys
+import time
+from browser_simulator import BrowserSimulator
+
+# 测试请求屏蔽对探测速度的影响：分别在屏蔽和不屏蔽的情况下加载同一批页面，
+# 比较从开始导航到发现可用视频链接的时间和页面总处理时间
+def measure(urls, block_requests, rounds):
+    results = []
+    for url in urls:
+        for _ in range(rounds):
+            # 每次使用新的浏览器，避免缓存影响结果
+            browser = BrowserSimulator()
+            browser.block_requests = block_requests
+            # 禁止加载图片也属于屏蔽的一部分，不屏蔽时需要关闭，否则对照组同样不加载图片
+            browser.disable_images = block_requests
+            try:
+                browser.init_browser(headless=True)
+                start_time = time.time()
+                success = browser.load_page(url, timeout=30, early_exit=True)
+                total_time = time.time() - start_time
+                results.append({
+                    'url': url,
+                    'success': success,
+                    'candidate_latency': browser.candidate_latency,
+                    'total_time': total_time,
+                    'requests': len(browser.get_network_requests())
+                })
+            except Exception as e:
+                print(f"加载失败: {e}")
+            finally:
+                browser.close()
+    return results
+
+def summarize(label, results):
+    latencies = [r['candidate_latency'] for r in results if r['candidate_latency'] is not None]
+    total_times = [r['total_time'] for r in results]
+    requests = [r['requests'] for r in results]
+    print(f"\n[{label}]")
+    print(f"  发现视频链接: {len(latencies)}/{len(results)}")
+    if latencies:
+        print(f"  平均发现时间: {sum(latencies) / len(latencies):.2f} 秒")
+    if total_times:
+        print(f"  平均总时间: {sum(total_times) / len(total_times):.2f} 秒")
+        print(f"  平均请求数: {sum(requests) / len(requests):.0f}")
+
+def test_request_blocking():
+    print("开始测试请求屏蔽...")
+
+    # 测试URL - 可以通过命令行参数传入视频页面地址
+    urls = sys.argv[1:] or ["https://www.baidu.com"]
+    rounds = 3
+
+    blocked = measure(urls, True, rounds)
+    unblocked = measure(urls, False, rounds)
+
+    summarize("屏蔽图片/字体/样式表/统计请求", blocked)
+    summarize("不屏蔽", unblocked)
+    print("\n测试完成")
+
+if __name__ == "__main__":
+    test_request_blocking()
@@ -0,0 +1,366 @@
+import os
+import queue
+import threading
+import time
+from urllib.parse import urlparse
+from typing import List, Dict, Any, Optional
+from browser_simulator import BrowserSimulator
+from utils import utils
+
+
+class TieredDetector:
+    """
+    分级视频探测器
+    第一级直接用HTTP请求获取页面，使用静态检测（HTML标签和JavaScript正则扫描）查找视频链接；
+    只有第一级找不到可用的视频链接时才借用Chrome（第二级）加载页面。
+    按域名记录哪一级探测成功，同一域名的后续URL直接从对应的级别开始；
+    记录为浏览器的域名超过有效期或经过若干次浏览器探测后重新尝试HTTP，避免一次偶然失败永久使用慢速探测
+    """
+
+    TIER_HTTP = 'http'        # 第一级：HTTP请求 + 静态检测
+    TIER_BROWSER = 'browser'  # 第二级：浏览器加载 + 网络请求捕获
+    TIER_CACHE = 'cache'      # 使用缓存的探测结果
+
+    def __init__(self, browser_pool=None, detector=None, memory_file: Optional[str] = None, timeout: int = 15,
+                 early_exit: bool = True, block_requests: bool = True, cache=None,
+                 browser_tier_ttl: float = 24 * 3600, browser_tier_max_uses: int = 20):
+        """
+        初始化分级探测器
+
+        Args:
+            browser_pool: 浏览器池，第二级探测时从池中借用浏览器
+            detector: VideoDetector实例，用于第一级的静态检测
+            memory_file: 域名探测级别记录文件（JSON），None表示不持久化
+            timeout: 第一级HTTP请求的超时时间（秒）
+            early_exit: 第二级探测是否在发现可用视频链接后提前结束页面加载
+            block_requests: 第二级探测是否屏蔽图片、字体、样式表和统计请求
+            cache: DetectionCache实例，探测前先查找缓存的结果，None表示不使用缓存
+            browser_tier_ttl: 域名记录为浏览器级别的有效期（秒），过期后重新尝试HTTP静态检测
+            browser_tier_max_uses: 记录为浏览器级别的域名连续使用浏览器探测达到该次数后重新尝试HTTP静态检测
+        """
+        self.browser_pool = browser_pool
+        self.detector = detector
+        self.memory_file = memory_file
+        self.timeout = timeout
+        self.early_exit = early_exit
+        self.block_requests = block_requests
+        self.cache = cache
+        self.browser_tier_ttl = browser_tier_ttl
+        self.browser_tier_max_uses = browser_tier_max_uses
+        # HTTP探测共享的会话（复用连接）
+        self.http_session = BrowserSimulator().session
+        # 域名探测级别记录 {domain: {'tier': 级别, 'time': 记录时间, 'uses': 记录后使用浏览器探测的次数}}
+        self.domain_tiers = {}
+        self.lock = threading.Lock()
+        # 后台多标签页预探测的结果 {url: result}，以及尚未完成预探测的URL
+        self.prefetched = {}
+        self.prefetch_pending = set()
+        self.prefetch_condition = threading.Condition()
+        self.prefetch_stop = threading.Event()
+        self._load_memory()
+
+    def _load_memory(self) -> None:
+        """
+        加载域名探测级别记录
+        """
+        if self.memory_file and os.path.exists(self.memory_file):
+            data = utils.read_json(self.memory_file)
+            if isinstance(data, dict):
+                for domain, entry in data.items():
+                    # 旧格式只记录级别，视为已过期，下次探测时重新尝试HTTP
+                    if isinstance(entry, str):
+                        entry = {'tier': entry, 'time': 0}
+                    if isinstance(entry, dict) and entry.get('tier') in (self.TIER_HTTP, self.TIER_BROWSER):
+                        self.domain_tiers[domain] = {'tier': entry['tier'], 'time': entry.get('time') or 0,
+                                                     'uses': entry.get('uses') or 0}
+
+    def _needs_reprobe(self, entry: Dict[str, Any]) -> bool:
+        """
+        记录为浏览器级别的域名是否需要重新尝试HTTP静态检测（调用方需持有锁）
+        """
+        return entry['tier'] == self.TIER_BROWSER and (
+            time.time() - entry['time'] > self.browser_tier_ttl or entry['uses'] >= self.browser_tier_max_uses
+        )
+
+    def _remember_tier(self, domain: str, tier: str) -> None:
+        """
+        记录域名的探测级别（级别变化或重新确认时写入文件）
+        """
+        if not domain:
+            return
+        with self.lock:
+            entry = self.domain_tiers.get(domain)
+            if entry and entry['tier'] == tier and not self._needs_reprobe(entry):
+                if tier == self.TIER_BROWSER:
+                    entry['uses'] += 1
+                return
+            self.domain_tiers[domain] = {'tier': tier, 'time': time.time(), 'uses': 0}
+            snapshot = {domain: dict(entry) for domain, entry in self.domain_tiers.items()}
+        if self.memory_file:
+            utils.write_json(self.memory_file, snapshot)
+
+    def get_domain_tier(self, url: str) -> Optional[str]:
+        """
+        获取URL所在域名上次成功的探测级别；浏览器级别的记录需要重新尝试HTTP时返回None
+        """
+        with self.lock:
+            entry = self.domain_tiers.get(urlparse(url).netloc.lower())
+            if entry is None or self._needs_reprobe(entry):
+                return None
+            return entry['tier']
+
+    @staticmethod
+    def has_usable_candidate(videos: List[Dict[str, Any]]) -> bool:
+        """
+        判断探测结果是否可以直接下载：包含getmovie链接，或者只有唯一的m3u8文件
+        """
+        return BrowserSimulator.has_usable_candidate(videos)
+
+    def _detect_http(self, url: str) -> List[Dict[str, Any]]:
+        """
+        第一级探测：HTTP获取页面后进行静态检测
+        """
+        # 每次使用新的模拟器保存解析状态（可以在多个线程中同时调用），共享HTTP会话
+        simulator = BrowserSimulator()
+        simulator.session = self.http_session
+        response = simulator.session.get(url, timeout=self.timeout, allow_redirects=True)
+        if response.status_code >= 400:
+            raise RuntimeError(f"HTTP状态码 {response.status_code}")
+        html = response.text
+        if not html:
+            raise RuntimeError("页面内容为空")
+
+        # 复用浏览器模拟器中的标签提取和JavaScript正则扫描
+        simulator.page_content = html
+        simulator._extract_video_resources(response.url)
+
+        # 合并VideoDetector的静态检测结果（同一资源合并来源信息）
+        if self.detector:
+            simulator.resource_registry.add_all(self.detector.detect_from_html(html, response.url))
+        return simulator.video_resources
+
+    def _detect_browser(self, url: str, log) -> Dict[str, Any]:
+        """
+        第二级探测：从浏览器池借用浏览器加载页面
+        """
+        with BrowserSimulator(pool=self.browser_pool) as browser:
+            browser.block_requests = self.block_requests
+            browser.init_browser()
+            log("浏览器初始化完成", "DEBUG")
+            # 发现可用视频链接后立即结束，不等待整个页面加载完成
+            if not browser.load_page(url, early_exit=self.early_exit):
+                return {'videos': [], 'error': "页面加载失败，页面可能无法访问或网络连接失败"}
+            html = browser.get_page_content()
+            if not html:
+                return {'videos': [], 'error': "无法获取页面内容"}
+            log(f"页面内容长度: {len(html)} 字符", "DEBUG")
+            return {'videos': list(browser.get_video_resources()), 'error': None, 'timings': dict(browser.timings)}
+
+    def detect(self, url: str, log=None) -> Dict[str, Any]:
+        """
+        分级探测视频资源
+
+        Args:
+            url: 页面URL
+            log: 日志回调函数 log(message, level)
+
+        Returns:
+            探测结果字典，包含 videos（视频资源列表）、tier（最终使用的级别）、error（失败原因）、elapsed 字段
+        """
+        log = log or (lambda message, level="INFO": print(message))
+        result = self._take_prefetched(url)
+        if result is not None:
+            log(f"[探测] 使用后台并行探测的结果（{result['tier']}）", "DEBUG")
+        else:
+            result = self._lookup_cache(url)
+            if result is not None:
+                log(f"[探测] 使用缓存的探测结果（{len(result['videos'])} 个资源），候选链接仍然可用", "INFO")
+            else:
+                result = self._detect_tiers(url, log)
+        if result.get('timings'):
+            log(f"[耗时] {self.describe_timings(result['timings'])}", "INFO")
+        self._cache_result(url, result)
+        return result
+
+    @staticmethod
+    def describe_timings(timings: Dict[str, Any]) -> str:
+        """
+        把浏览器探测的耗时统计转换为日志文本
+        """
+        parts = []
+        if timings.get('driver_start') is not None:
+            state = "新启动" if timings.get('cold_start') else "复用"
+            parts.append(f"获取浏览器 {timings['driver_start']:.2f} 秒（{state}）")
+        if timings.get('first_navigation') is not None:
+            parts.append(f"首次导航 {timings['first_navigation']:.2f} 秒")
+        if timings.get('capture') is not None:
+            parts.append(f"捕获处理 {timings['capture']:.2f} 秒")
+        return "，".join(parts)
+
+    def _lookup_cache(self, url: str) -> Optional[Dict[str, Any]]:
+        """
+        查找缓存的探测结果（候选链接失效时返回None）
+        """
+        if not self.cache:
+            return None
+        start = time.time()
+        videos = self.cache.lookup(url)
+        if videos is None:
+            return None
+        return {'videos': videos, 'tier': self.TIER_CACHE, 'error': None, 'elapsed': time.time() - start}
+
+    def _cache_result(self, url: str, result: Dict[str, Any]) -> None:
+        """
+        缓存可以直接下载的探测结果
+        """
+        if self.cache and result['tier'] != self.TIER_CACHE and result['error'] is None \
+                and self.has_usable_candidate(result['videos']):
+            self.cache.put(url, result['videos'])
+
+    def _detect_tiers(self, url: str, log) -> Dict[str, Any]:
+        """
+        按级别探测：先HTTP静态检测，没有可用视频链接时使用浏览器
+        """
+        start = time.time()
+        domain = urlparse(url).netloc.lower()
+        remembered = self.get_domain_tier(url)
+
+        http_videos = []
+        if remembered != self.TIER_BROWSER:
+            try:
+                http_videos = self._detect_http(url)
+                if self.has_usable_candidate(http_videos):
+                    log(f"[探测] HTTP静态检测找到可用视频链接（{len(http_videos)} 个资源），跳过浏览器", "INFO")
+                    self._remember_tier(domain, self.TIER_HTTP)
+                    return {'videos': http_videos, 'tier': self.TIER_HTTP, 'error': None, 'elapsed': time.time() - start}
+                log(f"[探测] HTTP静态检测未找到可用视频链接（{len(http_videos)} 个资源），改用浏览器", "INFO")
+            except Exception as e:
+                log(f"[探测] HTTP静态检测失败: {e}，改用浏览器", "DEBUG")
+        else:
+            log(f"[探测] 域名 {domain} 需要浏览器探测，跳过HTTP静态检测", "DEBUG")
+
+        result = self._detect_browser(url, log)
+        result['tier'] = self.TIER_BROWSER
+        self._finalize_browser_result(domain, result, http_videos)
+        result['elapsed'] = time.time() - start
+        return result
+
+    def _finalize_browser_result(self, domain: str, result: Dict[str, Any], http_videos: List[Dict[str, Any]]) -> None:
+        """
+        记录浏览器探测成功的域名；浏览器没有找到任何资源时退回HTTP静态检测的结果
+        """
+        if result['error'] is None:
+            if self.has_usable_candidate(result['videos']):
+                self._remember_tier(domain, self.TIER_BROWSER)
+            elif not result['videos'] and http_videos:
+                result['videos'] = http_videos
+
+    def prefetch(self, urls: List[str], tabs: int = 4, log=None) -> None:
+        """
+        在后台并行探测一批URL：先逐个进行HTTP静态检测，需要浏览器的URL交给同一个浏览器的多个标签页并行加载。
+        探测结果保存在内存中，之后调用detect()时直接使用
+
+        Args:
+            urls: 需要探测的URL列表（按处理顺序）
+            tabs: 浏览器同时使用的标签页数量
+            log: 日志回调函数 log(message, level)
+        """
+        log = log or (lambda message, level="INFO": print(message))
+        urls = list(dict.fromkeys(urls))
+        self.prefetch_stop.clear()
+        with self.prefetch_condition:
+            # 丢弃上一批未被使用的结果
+            self.prefetched.clear()
+            self.prefetch_pending.update(urls)
+        thread = threading.Thread(target=self._run_prefetch, args=(urls, tabs, log), daemon=True)
+        thread.start()
+
+    def cancel_prefetch(self) -> None:
+        """
+        停止后台预探测，尚未完成的URL由detect()逐个探测
+        """
+        self.prefetch_stop.set()
+        with self.prefetch_condition:
+            self.prefetch_pending.clear()
+            self.prefetch_condition.notify_all()
+
+    def _store_prefetched(self, url: str, result: Dict[str, Any]) -> None:
+        """
+        保存预探测结果并唤醒等待该URL的detect()
+        """
+        with self.prefetch_condition:
+            if url in self.prefetch_pending:
+                self.prefetch_pending.discard(url)
+                self.prefetched[url] = result
+            self.prefetch_condition.notify_all()
+
+    def _take_prefetched(self, url: str) -> Optional[Dict[str, Any]]:
+        """
+        取出URL的预探测结果，预探测尚未完成时等待；URL不在预探测中时返回None
+        """
+        with self.prefetch_condition:
+            while url in self.prefetch_pending:
+                self.prefetch_condition.wait()
+            return self.prefetched.pop(url, None)
+
+    def _run_prefetch(self, urls: List[str], tabs: int, log) -> None:
+        """
+        后台预探测线程：HTTP静态检测与浏览器多标签页探测同时进行
+        """
+        browser_queue = queue.Queue()
+        http_results = {}
+        start_times = {}
+
+        def on_browser_result(url, result):
+            result['tier'] = self.TIER_BROWSER
+            result['elapsed'] = time.time() - start_times.get(url, time.time())
+            self._finalize_browser_result(urlparse(url).netloc.lower(), result, http_results.get(url, []))
+            self._store_prefetched(url, result)
+
+        def browser_worker():
+            try:
+                with BrowserSimulator(pool=self.browser_pool) as browser:
+                    browser.block_requests = self.block_requests
+                    browser.init_browser()
+                    log(f"[并行探测] {self.describe_timings(browser.timings)}", "DEBUG")
+                    browser.detect_in_tabs(browser_queue, tabs=tabs, on_result=on_browser_result,
+                                           should_stop=self.prefetch_stop.is_set)
+            except Exception as e:
+                log(f"[并行探测] 浏览器多标签页探测失败: {e}", "ERROR")
+
+        browser_thread = threading.Thread(target=browser_worker, daemon=True)
+        browser_thread.start()
+        log(f"[并行探测] 开始后台探测 {len(urls)} 个URL（{tabs} 个标签页）", "INFO")
+
+        try:
+            for url in urls:
+                if self.prefetch_stop.is_set():
+                    break
+                start_times[url] = time.time()
+                cached = self._lookup_cache(url)
+                if cached is not None:
+                    self._store_prefetched(url, cached)
+                    continue
+                if self.get_domain_tier(url) == self.TIER_BROWSER:
+                    browser_queue.put(url)
+                    continue
+                try:
+                    videos = self._detect_http(url)
+                except Exception as e:
+                    log(f"[并行探测] HTTP静态检测失败: {e}: {url}", "DEBUG")
+                    videos = []
+                if self.has_usable_candidate(videos):
+                    self._remember_tier(urlparse(url).netloc.lower(), self.TIER_HTTP)
+                    self._store_prefetched(url, {'videos': videos, 'tier': self.TIER_HTTP, 'error': None,
+                                                 'elapsed': time.time() - start_times[url]})
+                else:
+                    http_results[url] = videos
+                    browser_queue.put(url)
+        finally:
+            browser_queue.put(None)
+            browser_thread.join()
+            # 没有得到结果的URL（浏览器异常或已停止）交给detect()逐个探测
+            with self.prefetch_condition:
+                self.prefetch_pending.difference_update(urls)
+                self.prefetch_condition.notify_all()
+            log("[并行探测] 后台探测结束", "DEBUG")
@@ -5,10 +5,14 @@ import subprocess
 import tempfile
 import concurrent.futures
 import shutil
+import threading
 from urllib.parse import urljoin, urlparse
 from typing import List, Dict, Optional, Callable, Tuple
 from tqdm import tqdm
 from video_downloader import VideoDownloader
+from ad_segment_filter import AdSegmentFilter
+from segment_bitmap import SegmentBitmap
+from history_store import HistoryStore
 try:
     from Crypto.Cipher import AES
     from Crypto.Util.Padding import unpad
@@ -18,18 +22,58 @@ except ImportError:
     print("警告: 未安装pycryptodome库，无法处理加密的M3U8流")
     print("可以使用: pip install pycryptodome")
 
+class PreviewRegistry:
+    """
+    预览过的M3U8对应的临时目录
+    所有TSMerger实例共用（下载流水线的每个线程使用独立的TSMerger），
+    以去掉签名和过期参数后的链接为键，getmovie重新获取的M3U8链接也能找到预览时的分片
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.dirs = {}
+
+    @staticmethod
+    def _key(m3u8_url: str) -> str:
+        return HistoryStore.normalize_target(m3u8_url)
+
+    def get(self, m3u8_url: str) -> Optional[str]:
+        with self.lock:
+            return self.dirs.get(self._key(m3u8_url))
+
+    def set(self, m3u8_url: str, temp_subdir: str) -> None:
+        with self.lock:
+            self.dirs[self._key(m3u8_url)] = temp_subdir
+
+    def pop(self, m3u8_url: str, default: Optional[str] = None) -> Optional[str]:
+        with self.lock:
+            return self.dirs.pop(self._key(m3u8_url), default)
+
+
+# 进程内共用的预览临时目录记录
+PREVIEW_TEMP_DIRS = PreviewRegistry()
+
+
 class TSMerger:
-    def __init__(self, log_callback=None, state_manager=None):
+    def __init__(self, log_callback=None, state_manager=None, temp_dir=None, accurate_trim=True):
         self.downloader = VideoDownloader()
         self.max_workers = 8  # 并行下载线程数
         self.chunk_size = 1024 * 1024  # 1MB
         self.timeout = 60  # 秒
-        # 固定的 temp 目录
-        self.temp_dir = r"C:\index\temp"
+        # temp 目录（默认固定为C:\index\temp）
+        self.temp_dir = temp_dir or r"C:\index\temp"
         # 确保temp目录存在
         os.makedirs(self.temp_dir, exist_ok=True)
         # ffmpeg路径配置
         self.ffmpeg_path = self._find_ffmpeg()
+        # 是否在下载前剔除不连续分组中的广告分片
+        self.skip_ad_segments = True
+        self.ad_filter = AdSegmentFilter()
+        # 指定了开始时间的截取是否重新编码以获得帧级精确的起点
+        # （False时只做无损重封装，起点落在开始时间之前最近的关键帧）
+        self.accurate_trim = accurate_trim
+        # 预览过的M3U8对应的临时目录（所有实例共用），完整下载时复用其中的分片
+        self.preview_temp_dirs = PREVIEW_TEMP_DIRS
         # 添加停止标志
         self.should_stop = False
         # 添加ffmpeg进程跟踪
@@ -139,23 +183,11 @@ class TSMerger:
             print(f"找到ffmpeg.exe: {ffmpeg_path}")
             return ffmpeg_path
         
-        # 3. 系统PATH
-        try:
-            import subprocess
-            result = subprocess.run(
-                ["where", "ffmpeg"],
-                capture_output=True,
-                text=True,
-                shell=True
-            )
-            if result.returncode == 0 and result.stdout:
-                # 获取第一个结果
-                ffmpeg_path = result.stdout.strip().split('\n')[0]
-                if os.path.exists(ffmpeg_path):
-                    print(f"找到ffmpeg.exe: {ffmpeg_path}")
-                    return ffmpeg_path
-        except Exception as e:
-            print(f"在系统PATH中查找ffmpeg失败: {e}")
+        # 3. 系统PATH（不启动where进程，每个TS合并器创建时都会查找）
+        ffmpeg_path = shutil.which("ffmpeg")
+        if ffmpeg_path:
+            print(f"找到ffmpeg.exe: {ffmpeg_path}")
+            return ffmpeg_path
         
         # 4. 默认返回ffmpeg（依赖系统PATH）
         print("警告: 未找到ffmpeg.exe，将使用系统PATH中的ffmpeg")
@@ -268,7 +300,7 @@ class TSMerger:
             # 检查是否是我们自己创建的临时目录（在self.temp_dir下）
             if not subdir_path.startswith(self.temp_dir):
                 print(f"警告: 尝试删除非程序创建的临时目录: {subdir_path}")
-                print("只允许删除程序在 C:\\index\\temp 下创建的临时目录")
+                print(f"只允许删除程序在 {self.temp_dir} 下创建的临时目录")
                 return False
             
             # 检查是否存在
@@ -291,6 +323,18 @@ class TSMerger:
         返回: (ts_urls, encryption_info)
         encryption_info = {'method': 'NONE', 'key_url': None, 'key': None, 'iv': None}
         """
+        segments, encryption_info = self.parse_m3u8_segments(m3u8_url)
+        return [segment['url'] for segment in segments], encryption_info
+    
+    def parse_m3u8_segments(self, m3u8_url: str) -> tuple:
+        """
+        解析M3U8播放列表，返回带元数据的分片列表和加密信息
+        返回: (segments, encryption_info)
+        segments中每一项为 {'index', 'url', 'duration', 'group', 'method', 'key_url', 'iv'}
+        group为#EXT-X-DISCONTINUITY划分的分组编号，method、key_url、iv为该分片生效的#EXT-X-KEY
+        encryption_info中method、key_url、key、iv为最后一个#EXT-X-KEY，
+        segment_keys为每个分片的 {'method', 'key', 'iv'}（按分片索引），解密时优先使用
+        """
         try:
             # 构建更完整的请求头，模拟真实浏览器
             enhanced_headers = self.headers.copy()
@@ -319,7 +363,6 @@ class TSMerger:
             response.raise_for_status()
             
             m3u8_content = response.text
-            ts_urls = []
             
             # 检查是否为HTML内容
             if '<!DOCTYPE html>' in m3u8_content or '<html>' in m3u8_content:
@@ -334,27 +377,52 @@ class TSMerger:
                     real_m3u8_url = query_params['url'][0]
                     print(f"从参数中提取到真正的M3U8 URL: {real_m3u8_url}")
                     
-                    # 递归调用parse_m3u8处理真正的M3U8 URL
-                    return self.parse_m3u8(real_m3u8_url)
+                    # 递归调用parse_m3u8_segments处理真正的M3U8 URL
+                    return self.parse_m3u8_segments(real_m3u8_url)
             
             # 解析加密信息
             encryption_info = {'method': 'NONE', 'key_url': None, 'key': None, 'iv': None}
             
             # 提取URLs
             nested_m3u8_urls = []
+            segments = []
+            # 当前分片的时长、不连续分组和生效的加密方法、密钥URL、IV
+            current_duration = None
+            current_group = 0
+            current_method = 'NONE'
+            current_key_url = None
+            current_iv = None
             
             for line in m3u8_content.split('\n'):
                 line = line.strip()
                 
+                # 记录分片时长
+                if line.startswith('#EXTINF:'):
+                    try:
+                        current_duration = float(line[len('#EXTINF:'):].split(',')[0].strip())
+                    except ValueError:
+                        current_duration = None
+                    continue
+                
+                # 不连续标记开启新的分组（通常是插入的广告）
+                if line.startswith('#EXT-X-DISCONTINUITY') and not line.startswith('#EXT-X-DISCONTINUITY-SEQUENCE'):
+                    if segments and segments[-1]['group'] == current_group:
+                        current_group += 1
+                    continue
+                
                 # 处理加密信息
                 if line.startswith('#EXT-X-KEY:'):
                     self.log(f"[M3U8解析] 发现加密信息: {line}")
                     # 解析加密信息
                     key_info = line[len('#EXT-X-KEY:'):].strip()
+                    # 新的#EXT-X-KEY替换之前的密钥和IV
+                    current_key_url = None
+                    current_iv = None
                     # 提取METHOD
                     if 'METHOD=' in key_info:
                         method_match = key_info.split('METHOD=')[1].split(',')[0].strip('"\'')
                         encryption_info['method'] = method_match
+                        current_method = method_match
                         self.log(f"[M3U8解析] 加密方法: {method_match}")
                     # 提取KEY URL
                     if 'URI=' in key_info:
@@ -366,6 +434,7 @@ class TSMerger:
                             if not key_url.startswith('http'):
                                 key_url = self._normalize_url(key_url, response.url)
                             encryption_info['key_url'] = key_url
+                            current_key_url = key_url
                             self.log(f"[M3U8解析] 密钥URL: {key_url}")
                     # 提取IV
                     if 'IV=' in key_info:
@@ -373,6 +442,7 @@ class TSMerger:
                         iv_match = re.search(r'IV=0x([0-9A-Fa-f]+)', key_info)
                         if iv_match:
                             encryption_info['iv'] = iv_match.group(1)
+                            current_iv = iv_match.group(1)
                             self.log(f"[M3U8解析] 初始化向量: {encryption_info['iv']}")
                 
                 # 跳过注释和空行
@@ -388,75 +458,51 @@ class TSMerger:
                         nested_m3u8_urls.append(full_url)
                     else:
                         # 假设是TS分片
-                        ts_urls.append(full_url)
+                        segments.append({
+                            'index': len(segments),
+                            'url': full_url,
+                            'duration': current_duration,
+                            'group': current_group,
+                            'method': current_method,
+                            'key_url': current_key_url,
+                            'iv': current_iv
+                        })
+                    current_duration = None
             
-            # 如果找到加密密钥URL，下载密钥
-            if encryption_info['key_url']:
+            # 下载所有分片用到的密钥（密钥轮换或广告分组使用不同的密钥时有多个）
+            key_urls = list(dict.fromkeys(segment['key_url'] for segment in segments if segment['key_url']))
+            if encryption_info['key_url'] and encryption_info['key_url'] not in key_urls:
+                key_urls.append(encryption_info['key_url'])
+            if key_urls:
                 self.log("[密钥处理] 开始处理加密密钥...")
-                try:
-                    # 检查是否需要使用本地getmovie.key文件
-                    if 'getmovie' in m3u8_url.lower() or 'custom_key' in encryption_info['key_url'].lower():
-                        # 尝试使用resource目录中的getmovie.key文件
-                        import os
-                        current_dir = os.path.dirname(os.path.abspath(__file__))
-                        resource_dir = os.path.join(current_dir, '..', 'Resources')
-                        key_file_path = os.path.join(resource_dir, 'getmovie.key')
-                        
-                        if os.path.exists(key_file_path):
-                            with open(key_file_path, 'r', encoding='utf-8') as f:
-                                key_content = f.read().strip()
-                                encryption_info['key'] = key_content.encode('ascii')
-                                self.log(f"[密钥处理] 使用resource目录的getmovie.key文件")
-                                self.log(f"[密钥处理] 密钥长度: {len(encryption_info['key'])} 字节")
-                                self.log(f"[密钥处理] 解密方法: 使用本地密钥文件")
-                        else:
-                            # 尝试正常下载密钥
-                            self.log(f"[密钥处理] resource目录中未找到getmovie.key文件，尝试从网络下载")
-                            self.log(f"[密钥处理] 密钥URL: {encryption_info['key_url']}")
-                            key_response = requests.get(
-                                encryption_info['key_url'],
-                                headers=enhanced_headers,
-                                timeout=30,
-                                verify=False
-                            )
-                            key_response.raise_for_status()
-                            encryption_info['key'] = key_response.content
-                            self.log(f"[密钥处理] 密钥下载成功")
-                            self.log(f"[密钥处理] 密钥长度: {len(encryption_info['key'])} 字节")
-                            self.log(f"[密钥处理] 解密方法: 使用网络下载的密钥")
-                    else:
-                        # 正常下载密钥
-                        self.log(f"[密钥处理] 从网络下载密钥")
-                        self.log(f"[密钥处理] 密钥URL: {encryption_info['key_url']}")
-                        key_response = requests.get(
-                            encryption_info['key_url'],
-                            headers=enhanced_headers,
-                            timeout=30,
-                            verify=False
-                        )
-                        key_response.raise_for_status()
-                        encryption_info['key'] = key_response.content
-                        self.log(f"[密钥处理] 密钥下载成功")
-                        self.log(f"[密钥处理] 密钥长度: {len(encryption_info['key'])} 字节")
-                        self.log(f"[密钥处理] 解密方法: 使用网络下载的密钥")
-                except Exception as e:
-                    self.log(f"[密钥处理] 下载密钥失败: {e}", "ERROR")
-                    encryption_info['key'] = None
+                keys = {key_url: self._fetch_key(key_url, m3u8_url, enhanced_headers) for key_url in key_urls}
+                if len(key_urls) > 1:
+                    self.log(f"[密钥处理] 播放列表使用了 {len(key_urls)} 个不同的密钥")
+                encryption_info['key'] = keys.get(encryption_info['key_url'])
+                # 每个分片按自己的密钥和IV解密
+                encryption_info['segment_keys'] = {
+                    segment['index']: {
+                        'method': segment['method'],
+                        'key': keys.get(segment['key_url']),
+                        'iv': segment['iv']
+                    }
+                    for segment in segments
+                }
             else:
                 self.log("[密钥处理] 未发现加密密钥URL，视频未加密")
                 self.log("[密钥处理] 解密方法: 无需解密")
             
             # 如果找到TS分片，直接返回
-            if ts_urls:
-                return ts_urls, encryption_info
+            if segments:
+                return segments, encryption_info
             
             # 如果没有找到TS分片，但找到嵌套的M3U8播放列表，递归解析
             if nested_m3u8_urls:
                 print(f"找到 {len(nested_m3u8_urls)} 个嵌套的M3U8播放列表，开始递归解析")
                 # 只解析第一个嵌套的M3U8播放列表（通常包含最高质量的视频）
-                return self.parse_m3u8(nested_m3u8_urls[0])
+                return self.parse_m3u8_segments(nested_m3u8_urls[0])
             
-            return ts_urls, encryption_info
+            return segments, encryption_info
             
         except Exception as e:
             print(f"解析M3U8失败: {e}")
@@ -464,6 +510,36 @@ class TSMerger:
             traceback.print_exc()
             return [], {'method': 'NONE', 'key_url': None, 'key': None, 'iv': None}
     
+    def _fetch_key(self, key_url: str, m3u8_url: str, headers: dict) -> Optional[bytes]:
+        """
+        获取解密密钥：getmovie视频优先使用Resources目录中的getmovie.key，其他从网络下载，失败返回None
+        """
+        try:
+            if 'getmovie' in m3u8_url.lower() or 'custom_key' in key_url.lower():
+                # 尝试使用resource目录中的getmovie.key文件
+                current_dir = os.path.dirname(os.path.abspath(__file__))
+                key_file_path = os.path.join(current_dir, '..', 'Resources', 'getmovie.key')
+                if os.path.exists(key_file_path):
+                    with open(key_file_path, 'r', encoding='utf-8') as f:
+                        key = f.read().strip().encode('ascii')
+                    self.log(f"[密钥处理] 使用resource目录的getmovie.key文件")
+                    self.log(f"[密钥处理] 密钥长度: {len(key)} 字节")
+                    self.log(f"[密钥处理] 解密方法: 使用本地密钥文件")
+                    return key
+                self.log(f"[密钥处理] resource目录中未找到getmovie.key文件，尝试从网络下载")
+            else:
+                self.log(f"[密钥处理] 从网络下载密钥")
+            self.log(f"[密钥处理] 密钥URL: {key_url}")
+            key_response = requests.get(key_url, headers=headers, timeout=30, verify=False)
+            key_response.raise_for_status()
+            self.log(f"[密钥处理] 密钥下载成功")
+            self.log(f"[密钥处理] 密钥长度: {len(key_response.content)} 字节")
+            self.log(f"[密钥处理] 解密方法: 使用网络下载的密钥")
+            return key_response.content
+        except Exception as e:
+            self.log(f"[密钥处理] 下载密钥失败: {e}", "ERROR")
+            return None
+    
     def _normalize_url(self, url: str, base_url: str) -> str:
         """
         规范化URL，处理相对路径
@@ -477,11 +553,22 @@ class TSMerger:
         except Exception:
             return ''
     
+    @staticmethod
+    def get_segment_key(encryption_info: dict, segment_index: int) -> tuple:
+        """
+        分片生效的 (加密方法, 密钥, IV)：有segment_keys时使用该分片自己的密钥，否则使用播放列表的密钥
+        """
+        segment_key = (encryption_info.get('segment_keys') or {}).get(segment_index)
+        if segment_key is None:
+            return encryption_info['method'], encryption_info['key'], encryption_info['iv']
+        return segment_key['method'], segment_key['key'], segment_key['iv']
+    
     def decrypt_ts_segment(self, encrypted_data: bytes, encryption_info: dict, segment_index: int) -> bytes:
         """
-        解密TS分片
+        解密TS分片（使用该分片自己的密钥和IV）
         """
-        if encryption_info['method'] == 'NONE' or not encryption_info['key']:
+        method, key, iv = self.get_segment_key(encryption_info, segment_index)
+        if method == 'NONE' or not key:
             return encrypted_data
         
         if not CRYPTO_AVAILABLE:
@@ -489,8 +576,6 @@ class TSMerger:
             return encrypted_data
         
         try:
-            key = encryption_info['key']
-            iv = encryption_info['iv']
             
             # 如果没有提供IV，使用segment_index作为IV
             if iv is None:
@@ -521,6 +606,47 @@ class TSMerger:
             traceback.print_exc()
             return encrypted_data
     
+    def select_time_range(self, 
+                          segments: List[Dict], 
+                          start_time: Optional[float] = None, 
+                          end_time: Optional[float] = None) -> Tuple[List[Dict], float, Optional[float]]:
+        """
+        根据#EXTINF累计时长选出覆盖指定时间段的分片
+        
+        Args:
+            segments: parse_m3u8_segments返回的分片列表（可已剔除广告）
+            start_time: 开始时间（秒），None表示从头开始
+            end_time: 结束时间（秒），None表示到结尾
+            
+        Returns:
+            (覆盖该时间段的分片列表, 相对于第一个选中分片的起始偏移, 截取时长或None)
+        """
+        start_time = max(0.0, start_time or 0.0)
+        if end_time is not None and end_time <= start_time:
+            raise ValueError(f"结束时间({end_time})必须大于开始时间({start_time})")
+        
+        selected = []
+        offset = 0.0
+        position = 0.0
+        for segment in segments:
+            duration = segment.get('duration') or 0.0
+            segment_start = position
+            segment_end = position + duration
+            position = segment_end
+            
+            # 分片完全在时间段之前或之后则跳过
+            if segment_end <= start_time:
+                continue
+            if end_time is not None and segment_start >= end_time:
+                break
+            
+            if not selected:
+                offset = start_time - segment_start
+            selected.append(segment)
+        
+        duration = end_time - start_time if end_time is not None else None
+        return selected, offset, duration
+    
     def download_ts_segment(self, ts_url: str, output_path: str, encryption_info: dict = None, segment_index: int = 0) -> bool:
         """
         下载单个TS分片
@@ -576,7 +702,8 @@ class TSMerger:
                         data += chunk
                 
                 # 如果需要解密
-                if encryption_info and encryption_info['method'] != 'NONE' and encryption_info['key']:
+                method, key, _ = self.get_segment_key(encryption_info, segment_index) if encryption_info else ('NONE', None, None)
+                if method != 'NONE' and key:
                     msg = f"[分片下载] 解密分片: {segment_index}"
                     print(msg)
                     data = self.decrypt_ts_segment(data, encryption_info, segment_index)
@@ -625,21 +752,27 @@ class TSMerger:
                            ts_urls: List[str], 
                            temp_dir: str, 
                            encryption_info: dict = None,
-                           progress_callback: Optional[Callable] = None) -> List[str]:
+                           progress_callback: Optional[Callable] = None,
+                           segment_indices: Optional[List[int]] = None) -> List[str]:
         """
         并行下载所有TS分片，并按顺序返回
+        
+        Args:
+            segment_indices: 只下载指定索引的分片（如剔除广告后的分片），默认下载全部
         """
         downloaded_segments = []
-        total_segments = len(ts_urls)
+        if segment_indices is None:
+            segment_indices = list(range(len(ts_urls)))
+        total_segments = len(segment_indices)
         
         # 创建临时目录
         os.makedirs(temp_dir, exist_ok=True)
         
         # 获取已下载的分片列表
-        downloaded_indices = []
+        downloaded_indices = SegmentBitmap()
         if self.state_manager and self.current_task_id:
-            downloaded_indices = self.state_manager.get_downloaded_segments(self.current_task_id)
-            print(f"[分片下载] 已下载 {len(downloaded_indices)} 个分片: {downloaded_indices}")
+            downloaded_indices = self.state_manager.get_segment_bitmap(self.current_task_id)
+            print(f"[分片下载] 已下载 {len(downloaded_indices)} 个分片")
         
         # 使用线程池并行下载
         with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
@@ -650,7 +783,8 @@ class TSMerger:
             future_to_segment = {}
             skipped_count = 0  # 跳过的分片计数
             try:
-                for i, ts_url in enumerate(ts_urls):
+                for i in segment_indices:
+                    ts_url = ts_urls[i]
                     # 检查是否应该停止
                     if self.should_stop:
                         print(f"[分片下载] 收到停止信号，停止提交下载任务")
@@ -723,7 +857,7 @@ class TSMerger:
         
         # 按顺序返回下载成功的分片
         final_downloaded_segments = []
-        for i in range(total_segments):
+        for i in segment_indices:
             segment_path = os.path.join(temp_dir, f"segment_{i:06d}.ts")
             if os.path.exists(segment_path) and os.path.getsize(segment_path) > 0:
                 final_downloaded_segments.append(segment_path)
@@ -739,9 +873,15 @@ class TSMerger:
     
     def merge_ts_segments(self, 
                          ts_files: List[str], 
-                         output_file: str) -> bool:
+                         output_file: str,
+                         start_offset: Optional[float] = None,
+                         duration: Optional[float] = None) -> bool:
         """
         合并TS分片为MP4文件
+        
+        Args:
+            start_offset: 相对于第一个分片的起始偏移（秒），用于时间段截取
+            duration: 截取时长（秒），None表示到结尾
         """
         try:
             # 检查是否有TS分片
@@ -812,12 +952,27 @@ class TSMerger:
                 '-y',  # 覆盖现有文件
                 '-f', 'concat',
                 '-safe', '0',
-                '-i', ts_list_file,
-                '-c', 'copy',
-                '-bsf:a', 'aac_adtstoasc',  # 修复音频流
-                output_file
+                '-i', ts_list_file
             ]
             
+            # 时间段截取（-ss放在-i之后，按解码时间戳精确定位）
+            if start_offset:
+                cmd += ['-ss', f"{start_offset:.3f}"]
+            if duration:
+                cmd += ['-t', f"{duration:.3f}"]
+            
+            if start_offset and self.accurate_trim:
+                # 重新编码视频以获得帧级精确的起点（只截取结尾时无损重封装即可）
+                cmd += ['-c:v', 'libx264', '-preset', 'veryfast', '-crf', '18', '-c:a', 'aac']
+            else:
+                cmd += [
+                    '-c', 'copy',
+                    '-bsf:a', 'aac_adtstoasc'  # 修复音频流
+                ]
+            if start_offset or duration:
+                cmd += ['-avoid_negative_ts', 'make_zero']
+            cmd.append(output_file)
+            
             # 打印命令以便于调试
             debug_message = f"执行ffmpeg命令: {' '.join(cmd)}"
             self.log(debug_message, "DEBUG")
@@ -844,7 +999,7 @@ class TSMerger:
                     cmd,
                     stdout=subprocess.DEVNULL,
                     stderr=subprocess.DEVNULL,
-                    creationflags=subprocess.CREATE_NO_WINDOW,
+                    creationflags=getattr(subprocess, 'CREATE_NO_WINDOW', 0),  # 只在Windows上隐藏控制台窗口
                     shell=False  # 确保不使用shell
                 )
                 
@@ -896,22 +1051,154 @@ class TSMerger:
                 except:
                     pass
     
-    def download_and_merge(self, 
-                          m3u8_url: str, 
-                          output_path: Optional[str] = None, 
-                          output_filename: Optional[str] = None, 
-                          progress_callback: Optional[Callable] = None) -> Dict:
+    def _prepare_temp_subdir(self, m3u8_url: str) -> str:
+        """
+        获取任务的临时目录
+        优先使用状态管理器中保存的目录（断点续传），其次使用预览时创建的目录，否则新建
         """
-        完整的下载和合并流程
+        if self.state_manager and self.current_task_id:
+            # 获取任务信息
+            task_info = self.state_manager.get_task(self.current_task_id)
+            if task_info:
+                saved_temp_dir = task_info.get('temp_dir')
+                if saved_temp_dir and os.path.exists(saved_temp_dir):
+                    # 使用保存的临时目录（断点续传）
+                    print(f"[断点续传] 使用已存在的临时目录: {saved_temp_dir}")
+                    return saved_temp_dir
+                # 创建新的临时目录
+                temp_subdir = self._get_preview_temp_subdir(m3u8_url) or self.create_temp_subdir()
+                print(f"[新建任务] 使用临时目录: {temp_subdir}")
+                # 保存临时目录路径到状态管理器
+                self.state_manager.update_task_info(self.current_task_id, {'temp_dir': temp_subdir})
+                return temp_subdir
+        
+        # 预览过的M3U8复用预览时下载的分片
+        temp_subdir = self._get_preview_temp_subdir(m3u8_url)
+        if temp_subdir:
+            print(f"[预览复用] 使用预览时的临时目录: {temp_subdir}")
+            return temp_subdir
+        
+        # 创建新的临时目录
+        temp_subdir = self.create_temp_subdir()
+        print(f"[新建任务] 创建新的临时目录: {temp_subdir}")
+        return temp_subdir
+    
+    def _get_preview_temp_subdir(self, m3u8_url: str) -> Optional[str]:
+        """
+        获取预览时为该M3U8创建的临时目录（不存在则返回None）
+        """
+        temp_subdir = self.preview_temp_dirs.get(m3u8_url)
+        if temp_subdir and os.path.exists(temp_subdir):
+            return temp_subdir
+        return None
+    
+    def _filter_ad_segments(self, segments: List[Dict]) -> List[Dict]:
+        """
+        剔除广告分组（保留原始索引，保证解密IV和断点续传记录不变）
+        """
+        if not self.skip_ad_segments:
+            return segments
+        
+        selected_segments, ad_groups = self.ad_filter.filter_segments(segments)
+        for group in ad_groups:
+            self.log(f"[广告过滤] 跳过分组 {group['group']}: {group['segment_count']} 个分片, "
+                     f"{group['total_duration']:.1f} 秒, 原因: {', '.join(group['reasons'])}")
+        skipped_ad_count = len(segments) - len(selected_segments)
+        if skipped_ad_count:
+            self.log(f"[广告过滤] 共跳过 {skipped_ad_count} 个广告分片")
+        return selected_segments
+    
+    def preview(self, 
+                m3u8_url: str, 
+                seconds: float = 30, 
+                output_file: Optional[str] = None, 
+                progress_callback: Optional[Callable] = None) -> Dict:
+        """
+        预览模式：只下载开头覆盖指定秒数的分片并立即合并为小文件
+        下载的分片保留在任务的临时目录中，之后完整下载时直接复用，不会重复下载
+        
+        Args:
+            m3u8_url: M3U8播放列表URL
+            seconds: 预览时长（秒）
+            output_file: 预览文件路径，默认保存在临时目录下
+            progress_callback: 进度回调函数
+            
+        Returns:
+            包含结果的字典，包含预览文件路径和临时目录
+        """
+        temp_subdir = self._prepare_temp_subdir(m3u8_url)
+        self.preview_temp_dirs.set(m3u8_url, temp_subdir)
+        
+        try:
+            self.log(f"[预览] 正在解析M3U8播放列表: {m3u8_url}")
+            segments, encryption_info = self.parse_m3u8_segments(m3u8_url)
+            ts_urls = [segment['url'] for segment in segments]
+            if not ts_urls:
+                return {'success': False, 'error': '未找到TS分片', 'temp_subdir': temp_subdir}
+            
+            selected_segments = self._filter_ad_segments(segments)
+            if any(segment.get('duration') for segment in selected_segments):
+                selected_segments, _, _ = self.select_time_range(selected_segments, 0, seconds)
+            else:
+                # 没有时长信息时按每个分片10秒估算
+                selected_segments = selected_segments[:max(1, int(seconds // 10) + 1)]
+            segment_indices = [segment['index'] for segment in selected_segments]
+            self.log(f"[预览] 下载开头 {seconds} 秒，共 {len(segment_indices)}/{len(ts_urls)} 个分片")
+            
+            downloaded_segments = self.download_ts_segments(
+                ts_urls,
+                temp_subdir,
+                encryption_info,
+                progress_callback,
+                segment_indices
+            )
+            if not downloaded_segments:
+                return {'success': False, 'error': 'TS分片下载失败', 'temp_subdir': temp_subdir}
+            
+            if not output_file:
+                output_file = os.path.join(self.temp_dir, f"preview_{os.path.basename(temp_subdir)}.mp4")
+            
+            if not self.merge_ts_segments(downloaded_segments, output_file, duration=seconds):
+                return {'success': False, 'error': '预览文件合并失败', 'temp_subdir': temp_subdir}
+            
+            self.log(f"[预览] 预览文件已生成: {output_file}")
+            return {
+                'success': True,
+                'file_path': output_file,
+                'filename': os.path.basename(output_file),
+                'segments_count': len(downloaded_segments),
+                'original_segments_count': len(ts_urls),
+                'temp_subdir': temp_subdir  # 保留供完整下载复用
+            }
+        except Exception as e:
+            print(f"预览失败: {e}")
+            import traceback
+            traceback.print_exc()
+            return {'success': False, 'error': str(e), 'temp_subdir': temp_subdir}
+        finally:
+            # 重置停止标志
+            self.should_stop = False
+    
+    def prepare_download(self,
+                         m3u8_url: str,
+                         output_path: Optional[str] = None,
+                         output_filename: Optional[str] = None,
+                         start_time: Optional[float] = None,
+                         end_time: Optional[float] = None) -> Dict:
+        """
+        下载前的准备：确定输出文件和临时目录，解析M3U8，剔除广告分组并按时间段选取分片
         
         Args:
             m3u8_url: M3U8播放列表URL
             output_path: 输出路径，默认使用C:\\index
             output_filename: 输出文件名，默认使用时间戳格式
-            progress_callback: 进度回调函数
+            start_time: 截取开始时间（秒），只下载覆盖该时间段的分片
+            end_time: 截取结束时间（秒）
             
         Returns:
-            包含结果的字典，包含 temp_subdir 字段用于后续清理
+            准备结果字典，success为True时包含后续下载和合并需要的全部信息
+            （m3u8_url、output_file、output_filename、temp_subdir、ts_urls、segment_indices、
+            encryption_info、trim_offset、trim_duration、skipped_ad_segments）
         """
         # 使用默认输出路径
         if not output_path:
@@ -932,37 +1219,13 @@ class TSMerger:
         output_file = os.path.join(output_path, output_filename)
         
         # 检查是否是恢复任务（有保存的临时目录）
-        temp_subdir = None
-        is_resume = False  # 是否是断点续传
-        if self.state_manager and self.current_task_id:
-            # 获取任务信息
-            task_info = self.state_manager.get_task(self.current_task_id)
-            if task_info:
-                saved_temp_dir = task_info.get('temp_dir')
-                if saved_temp_dir and os.path.exists(saved_temp_dir):
-                    # 使用保存的临时目录（断点续传）
-                    temp_subdir = saved_temp_dir
-                    is_resume = True
-                    print(f"[断点续传] 使用已存在的临时目录: {temp_subdir}")
-                else:
-                    # 创建新的临时目录
-                    temp_subdir = self.create_temp_subdir()
-                    print(f"[新建任务] 创建新的临时目录: {temp_subdir}")
-                    # 保存临时目录路径到状态管理器
-                    self.state_manager.update_task_info(self.current_task_id, {'temp_dir': temp_subdir})
-            else:
-                # 任务信息不存在，创建新的临时目录
-                temp_subdir = self.create_temp_subdir()
-                print(f"[新建任务] 创建新的临时目录: {temp_subdir}")
-        else:
-            # 创建新的临时目录
-            temp_subdir = self.create_temp_subdir()
-            print(f"[新建任务] 创建新的临时目录: {temp_subdir}")
+        temp_subdir = self._prepare_temp_subdir(m3u8_url)
         
         try:
             # 1. 解析M3U8
             print(f"正在解析M3U8播放列表: {m3u8_url}")
-            ts_urls, encryption_info = self.parse_m3u8(m3u8_url)
+            segments, encryption_info = self.parse_m3u8_segments(m3u8_url)
+            ts_urls = [segment['url'] for segment in segments]
             
             if not ts_urls:
                 return {
@@ -972,6 +1235,31 @@ class TSMerger:
                 }
             
             self.log(f"[M3U8解析] 找到 {len(ts_urls)} 个TS分片")
+            
+            # 剔除广告分组
+            selected_segments = self._filter_ad_segments(segments)
+            skipped_ad_count = len(segments) - len(selected_segments)
+            
+            # 时间段截取：只选取覆盖该时间段的分片
+            trim_offset = None
+            trim_duration = None
+            if start_time is not None or end_time is not None:
+                if not any(segment.get('duration') for segment in selected_segments):
+                    self.log("[时间段] 播放列表缺少#EXTINF时长信息，将下载全部分片", "WARNING")
+                else:
+                    selected_segments, trim_offset, trim_duration = self.select_time_range(
+                        selected_segments, start_time, end_time
+                    )
+                    if not selected_segments:
+                        return {
+                            'success': False,
+                            'error': '指定的时间段超出视频长度',
+                            'temp_subdir': temp_subdir
+                        }
+                    self.log(f"[时间段] 截取 {start_time or 0:.1f}s - "
+                             f"{'结尾' if end_time is None else f'{end_time:.1f}s'}，"
+                             f"需下载 {len(selected_segments)}/{len(ts_urls)} 个分片")
+            segment_indices = [segment['index'] for segment in selected_segments]
             if encryption_info['method'] != 'NONE':
                 self.log(f"[加密检测] 视频已加密")
                 self.log(f"[加密检测] 加密方法: {encryption_info['method']}")
@@ -987,13 +1275,45 @@ class TSMerger:
                 self.log(f"[加密检测] 视频未加密，无需解密")
                 self.log(f"[加密检测] 解密方式: 无需解密")
             
-            # 2. 下载TS分片到临时目录
+            return {
+                'success': True,
+                'm3u8_url': m3u8_url,
+                'output_file': output_file,
+                'output_filename': output_filename,
+                'temp_subdir': temp_subdir,
+                'ts_urls': ts_urls,
+                'segment_indices': segment_indices,
+                'encryption_info': encryption_info,
+                'trim_offset': trim_offset,
+                'trim_duration': trim_duration,
+                'skipped_ad_segments': skipped_ad_count
+            }
+        except Exception as e:
+            print(f"处理失败: {e}")
+            import traceback
+            traceback.print_exc()
+            return {
+                'success': False,
+                'error': str(e),
+                'temp_subdir': temp_subdir  # 保留临时目录供用户处理
+            }
+    
+    def download_prepared(self, prepared: Dict, progress_callback: Optional[Callable] = None) -> Dict:
+        """
+        下载prepare_download()选取的TS分片到临时目录
+        
+        Returns:
+            成功时在准备结果的基础上增加downloaded_segments（按顺序的分片文件列表）
+        """
+        temp_subdir = prepared['temp_subdir']
+        try:
             print(f"开始下载TS分片到临时目录: {temp_subdir}")
             downloaded_segments = self.download_ts_segments(
-                ts_urls, 
+                prepared['ts_urls'],
                 temp_subdir,
-                encryption_info,
-                progress_callback
+                prepared['encryption_info'],
+                progress_callback,
+                prepared['segment_indices']
             )
             
             if not downloaded_segments:
@@ -1003,14 +1323,36 @@ class TSMerger:
                     'temp_subdir': temp_subdir
                 }
             
-            if len(downloaded_segments) != len(ts_urls):
-                print(f"警告: 只下载了 {len(downloaded_segments)} 个分片，共 {len(ts_urls)} 个")
+            if len(downloaded_segments) != len(prepared['segment_indices']):
+                print(f"警告: 只下载了 {len(downloaded_segments)} 个分片，共 {len(prepared['segment_indices'])} 个")
             
-            # 3. 合并TS分片
+            return dict(prepared, downloaded_segments=downloaded_segments)
+        except Exception as e:
+            print(f"处理失败: {e}")
+            import traceback
+            traceback.print_exc()
+            return {
+                'success': False,
+                'error': str(e),
+                'temp_subdir': temp_subdir
+            }
+    
+    def merge_prepared(self, prepared: Dict) -> Dict:
+        """
+        合并download_prepared()下载的TS分片，成功后清理临时目录
+        
+        Returns:
+            与download_and_merge()相同格式的结果字典
+        """
+        temp_subdir = prepared['temp_subdir']
+        output_file = prepared['output_file']
+        try:
             print(f"开始合并TS分片为MP4文件...")
             merge_success = self.merge_ts_segments(
-                downloaded_segments, 
-                output_file
+                prepared['downloaded_segments'],
+                output_file,
+                start_offset=prepared['trim_offset'],
+                duration=prepared['trim_duration']
             )
             
             if not merge_success:
@@ -1022,9 +1364,10 @@ class TSMerger:
             
             print(f"合并成功: {output_file}")
             
-            # 4. 清理临时子目录（只有合并成功才清理）
+            # 清理临时子目录（只有合并成功才清理）
             print(f"清理临时目录: {temp_subdir}")
             self.delete_temp_subdir(temp_subdir)
+            self.preview_temp_dirs.pop(prepared['m3u8_url'], None)
             
             # 清理key文件（如果存在）
             current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -1038,13 +1381,13 @@ class TSMerger:
                 except Exception as e:
                     print(f"删除key文件失败: {e}")
             
-            # 5. 返回结果
             return {
                 'success': True,
                 'file_path': output_file,
-                'filename': output_filename,
-                'segments_count': len(downloaded_segments),
-                'original_segments_count': len(ts_urls),
+                'filename': prepared['output_filename'],
+                'segments_count': len(prepared['downloaded_segments']),
+                'original_segments_count': len(prepared['ts_urls']),
+                'skipped_ad_segments': prepared['skipped_ad_segments'],
                 'temp_subdir': None  # 已清理
             }
         except Exception as e:
@@ -1065,6 +1408,37 @@ class TSMerger:
                 except:
                     pass
                 self.ffmpeg_process = None
+    
+    def download_and_merge(self, 
+                          m3u8_url: str, 
+                          output_path: Optional[str] = None, 
+                          output_filename: Optional[str] = None, 
+                          progress_callback: Optional[Callable] = None,
+                          start_time: Optional[float] = None,
+                          end_time: Optional[float] = None) -> Dict:
+        """
+        完整的下载和合并流程（依次执行准备、下载和合并）
+        
+        Args:
+            m3u8_url: M3U8播放列表URL
+            output_path: 输出路径，默认使用C:\\index
+            output_filename: 输出文件名，默认使用时间戳格式
+            progress_callback: 进度回调函数
+            start_time: 截取开始时间（秒），只下载覆盖该时间段的分片
+            end_time: 截取结束时间（秒）
+            
+        Returns:
+            包含结果的字典，包含 temp_subdir 字段用于后续清理
+        """
+        try:
+            prepared = self.prepare_download(m3u8_url, output_path, output_filename, start_time, end_time)
+            if not prepared['success']:
+                return prepared
+            prepared = self.download_prepared(prepared, progress_callback)
+            if not prepared['success']:
+                return prepared
+            return self.merge_prepared(prepared)
+        finally:
             # 重置停止标志
             self.should_stop = False
     
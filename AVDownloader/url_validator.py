@@ -0,0 +1,140 @@
+import threading
+import time
+import concurrent.futures
+import requests
+from typing import List, Dict, Any, Iterable, Tuple
+
+
+class URLValidator:
+    """
+    URL预检查器
+    在启动浏览器探测之前，通过有界线程池并行检查所有URL的可访问性（HEAD失败时回退到GET），
+    可以访问的结果在本次会话中缓存，避免对同一URL重复检查；
+    失败的结果（可能只是网络暂时不稳定）只缓存很短的时间，重试时会重新检查
+    """
+
+    # 检查结果分类
+    STATUS_OK = 'ok'                    # 可以访问
+    STATUS_HTTP_ERROR = 'http_error'    # 能连通但返回错误状态码（可能是反爬，仍然尝试）
+    STATUS_UNREACHABLE = 'unreachable'  # 无法连接（DNS失败、连接超时等）
+
+    def __init__(self, max_workers: int = 16, timeout: int = 10, failure_ttl: float = 60):
+        """
+        初始化URL预检查器
+
+        Args:
+            max_workers: 并行检查的最大线程数
+            timeout: 单个请求的超时时间（秒）
+            failure_ttl: 检查失败（错误状态码、无法连接）的结果缓存的秒数
+        """
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.failure_ttl = failure_ttl
+        self.session = requests.Session()
+        self.session.headers.update({
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8'
+        })
+        # 会话内的检查结果缓存 {url: (result, 过期时间)}，可以访问的结果不过期（过期时间为None）
+        self.cache = {}
+        self.lock = threading.Lock()
+
+    def check_url(self, url: str, use_cache: bool = True) -> Dict[str, Any]:
+        """
+        检查单个URL的可访问性（优先使用未过期的缓存）
+
+        Args:
+            url: 要检查的URL
+            use_cache: 为False时忽略缓存重新检查（如重试之前失败的URL）
+
+        Returns:
+            检查结果字典，包含 url、status、status_code、error、elapsed 字段
+        """
+        if use_cache:
+            with self.lock:
+                cached = self.cache.get(url)
+            if cached is not None:
+                result, expires = cached
+                if expires is None or time.time() < expires:
+                    return result
+
+        start = time.time()
+        result = {'url': url, 'status': self.STATUS_UNREACHABLE, 'status_code': None, 'error': None}
+        try:
+            response = self.session.head(url, timeout=self.timeout, allow_redirects=True)
+            # 部分站点不支持HEAD请求，回退到GET（只读取响应头）
+            if response.status_code in (403, 405, 501) or response.status_code >= 500:
+                response = self.session.get(url, timeout=self.timeout, allow_redirects=True, stream=True)
+                response.close()
+            result['status_code'] = response.status_code
+            result['status'] = self.STATUS_OK if response.status_code < 400 else self.STATUS_HTTP_ERROR
+        except requests.RequestException as e:
+            try:
+                # HEAD连接异常时再用GET确认一次
+                response = self.session.get(url, timeout=self.timeout, allow_redirects=True, stream=True)
+                response.close()
+                result['status_code'] = response.status_code
+                result['status'] = self.STATUS_OK if response.status_code < 400 else self.STATUS_HTTP_ERROR
+            except requests.RequestException:
+                result['error'] = str(e)
+        result['elapsed'] = time.time() - start
+
+        expires = None if result['status'] == self.STATUS_OK else time.time() + self.failure_ttl
+        with self.lock:
+            self.cache[url] = (result, expires)
+        return result
+
+    def validate_all(self, urls: List[str], refresh: Iterable[str] = ()) -> Dict[str, Dict[str, Any]]:
+        """
+        并行检查所有URL
+
+        Args:
+            urls: 要检查的URL列表
+            refresh: 忽略缓存、重新检查的URL（如重试之前失败的URL）
+
+        Returns:
+            {url: 检查结果}
+        """
+        results = {}
+        unique_urls = list(dict.fromkeys(urls))
+        if not unique_urls:
+            return results
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(self.max_workers, len(unique_urls))) as executor:
+            refresh = set(refresh)
+            future_to_url = {executor.submit(self.check_url, url, url not in refresh): url for url in unique_urls}
+            for future in concurrent.futures.as_completed(future_to_url):
+                url = future_to_url[future]
+                try:
+                    results[url] = future.result()
+                except Exception as e:
+                    results[url] = {'url': url, 'status': self.STATUS_UNREACHABLE, 'status_code': None, 'error': str(e)}
+        return results
+
+    def partition(self, urls: List[str], results: Dict[str, Dict[str, Any]]) -> Tuple[List[str], List[str]]:
+        """
+        根据检查结果重新排序URL
+        可访问的URL在前，返回错误状态码的URL在后，无法连接的URL单独返回
+
+        Returns:
+            (需要处理的URL列表, 无法连接的URL列表)
+        """
+        ok_urls = []
+        error_urls = []
+        unreachable_urls = []
+        for url in urls:
+            status = results.get(url, {}).get('status', self.STATUS_OK)
+            if status == self.STATUS_OK:
+                ok_urls.append(url)
+            elif status == self.STATUS_HTTP_ERROR:
+                error_urls.append(url)
+            else:
+                unreachable_urls.append(url)
+        return ok_urls + error_urls, unreachable_urls
+
+    def clear_cache(self) -> None:
+        """
+        清空检查结果缓存
+        """
+        with self.lock:
+            self.cache.clear()
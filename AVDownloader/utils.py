@@ -166,6 +166,35 @@ class Utils:
         except Exception:
             return ''
     
+    @staticmethod
+    def unescape_url(url: str) -> str:
+        """
+        还原页面源码中URL的HTML实体（&amp;）和JavaScript转义（\\/）
+        """
+        return url.strip().replace('\\/', '/').replace('&amp;', '&')
+    
+    @staticmethod
+    def canonicalize_url(url: str) -> str:
+        """
+        生成URL的规范形式，用于判断两个URL是否指向同一资源：
+        还原HTML实体和JavaScript转义，协议和主机名转为小写，去掉默认端口和片段
+        """
+        if not url:
+            return ''
+        url = Utils.unescape_url(url)
+        try:
+            parsed = urlparse(url)
+        except ValueError:
+            return url
+        scheme = parsed.scheme.lower()
+        netloc = parsed.netloc.lower()
+        if (scheme == 'http' and netloc.endswith(':80')) or (scheme == 'https' and netloc.endswith(':443')):
+            netloc = netloc.rsplit(':', 1)[0]
+        canonical = f"{scheme}://{netloc}{parsed.path or '/'}"
+        if parsed.query:
+            canonical += f"?{parsed.query}"
+        return canonical
+    
     @staticmethod
     def format_time(timestamp: float) -> str:
         """
@@ -195,6 +224,28 @@ class Utils:
         except Exception:
             return 'N/A'
     
+    @staticmethod
+    def parse_time_string(time_str: str) -> Optional[float]:
+        """
+        解析时间字符串为秒数
+        支持 "90"、"1:30"、"01:02:03.5" 等格式，空字符串返回None
+        """
+        time_str = (time_str or '').strip()
+        if not time_str:
+            return None
+        
+        parts = time_str.split(':')
+        if len(parts) > 3:
+            raise ValueError(f"无效的时间格式: {time_str}")
+        
+        seconds = 0.0
+        for part in parts:
+            value = float(part)
+            if value < 0:
+                raise ValueError(f"无效的时间格式: {time_str}")
+            seconds = seconds * 60 + value
+        return seconds
+    
     @staticmethod
     def read_json(file_path: str) -> Optional[Dict]:
         """
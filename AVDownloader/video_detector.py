@@ -1,7 +1,7 @@
 import re
-from bs4 import BeautifulSoup
 from urllib.parse import urljoin, urlparse
 from typing import List, Dict, Optional, Set
+from content_scanner import content_scanner
 
 class VideoDetector:
     def __init__(self):
@@ -32,72 +32,18 @@ class VideoDetector:
         seen_urls = set()
         
         try:
-            soup = BeautifulSoup(html, 'lxml')
-            
-            # 提取video标签（只保留包含m3u8或key的链接）
-            for video_tag in soup.find_all('video'):
-                # 提取src属性
-                if video_tag.get('src'):
-                    video_url = self._normalize_url(video_tag['src'], base_url)
-                    # 只保留包含m3u8或key的链接
-                    if video_url and video_url not in seen_urls and ('m3u8' in video_url.lower() or 'key' in video_url.lower()):
-                        seen_urls.add(video_url)
-                        videos.append({
-                            'url': video_url,
-                            'type': 'video_tag',
-                            'source': 'html'
-                        })
-                
-                # 提取source标签（只保留包含m3u8或key的链接）
-                for source_tag in video_tag.find_all('source'):
-                    if source_tag.get('src'):
-                        video_url = self._normalize_url(source_tag['src'], base_url)
-                        # 只保留包含m3u8或key的链接
-                        if video_url and video_url not in seen_urls and ('m3u8' in video_url.lower() or 'key' in video_url.lower()):
-                            seen_urls.add(video_url)
-                            videos.append({
-                                'url': video_url,
-                                'type': 'source_tag',
-                                'source': 'html'
-                            })
-            
-            # 提取iframe标签（只保留包含m3u8或key的链接）
-            for iframe_tag in soup.find_all('iframe'):
-                if iframe_tag.get('src'):
-                    iframe_url = self._normalize_url(iframe_tag['src'], base_url)
-                    # 只保留包含m3u8或key的链接
-                    if iframe_url and iframe_url not in seen_urls and ('m3u8' in iframe_url.lower() or 'key' in iframe_url.lower()):
-                        seen_urls.add(iframe_url)
-                        videos.append({
-                            'url': iframe_url,
-                            'type': 'iframe',
-                            'source': 'html'
-                        })
-            
-            # 使用正则表达式提取包含m3u8或key的链接
-            m3u8_pattern = re.compile(r'https?://[^\s"\']+[\w\-./?%&=]*m3u8[\w\-./?%&=]*', re.IGNORECASE)
-            for match in m3u8_pattern.finditer(html):
-                video_url = match.group(0)
-                if video_url and video_url not in seen_urls:
-                    seen_urls.add(video_url)
-                    videos.append({
-                        'url': video_url,
-                        'type': 'regex',
-                        'source': 'html'
-                    })
-            
-            # 使用正则表达式提取包含key的链接
-            key_pattern = re.compile(r'https?://[^\s"\']+[\w\-./?%&=]*key[\w\-./?%&=]*', re.IGNORECASE)
-            for match in key_pattern.finditer(html):
-                video_url = match.group(0)
+            # 使用共享的页面扫描器一次扫描video/source/iframe标签和页面中的URL
+            for item in content_scanner.scan(html, base_url):
+                if item['keyword'] not in ('m3u8', 'key'):
+                    continue
+                video_url = self._normalize_url(item['url'], base_url)
                 if video_url and video_url not in seen_urls:
                     seen_urls.add(video_url)
                     videos.append({
                         'url': video_url,
-                        'type': 'regex',
+                        'type': 'regex' if item['kind'] in ('url', 'json') else item['kind'],
                         'source': 'html'
                     })
-            
         except Exception as e:
             print(f"从HTML提取视频失败: {e}")
         
@@ -179,6 +125,7 @@ class VideoDetector:
         优先级：
         1. M3U8播放列表
         2. key文件
+        同一类型中，被更多来源（网络请求、HTML、JavaScript）同时发现的资源排在前面
         """
         def video_priority(video):
             url = video.get('url', '')
@@ -192,7 +139,7 @@ class VideoDetector:
             else:
                 return 2
         
-        return sorted(videos, key=video_priority)
+        return sorted(videos, key=lambda video: (video_priority(video), -len(video.get('sources', []))))
     
     def detect_all_videos(self, html: str, network_requests: List[Dict], base_url: str) -> List[Dict[str, str]]:
         """
@@ -1,9 +1,22 @@
 import os
 import requests
 import time
+import threading
+import concurrent.futures
 from datetime import datetime
 from typing import Dict, Optional, Callable
+from urllib.parse import urlparse
 from tqdm import tqdm
+from rate_limiter import TokenBucket
+
+# 可以直接作为保存文件扩展名的视频容器格式
+VIDEO_EXTENSIONS = {'.mp4', '.m4v', '.mkv', '.webm', '.mov', '.flv', '.avi', '.wmv', '.ts', '.3gp'}
+# URL中没有扩展名时根据Content-Type判断
+CONTENT_TYPE_EXTENSIONS = {
+    'video/mp4': '.mp4', 'video/x-m4v': '.m4v', 'video/x-matroska': '.mkv', 'video/webm': '.webm',
+    'video/quicktime': '.mov', 'video/x-flv': '.flv', 'video/x-msvideo': '.avi', 'video/x-ms-wmv': '.wmv',
+    'video/mp2t': '.ts', 'video/3gpp': '.3gp'
+}
 
 class VideoDownloader:
     def __init__(self):
@@ -13,6 +26,8 @@ class VideoDownloader:
         self.retry_delay = 3  # 秒
         self.timeout = 60  # 秒
         self.should_stop = False  # 添加停止标志
+        self.max_parallel_downloads = 3  # 批量下载时同时下载的文件数
+        self.bandwidth_limit = None  # 批量下载的总带宽上限（字节/秒），None表示不限速
         self.headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
             'Accept': '*/*',
@@ -39,10 +54,25 @@ class VideoDownloader:
             print(f"创建下载目录失败: {e}")
             return False
     
+    def get_extension(self, video_url: str) -> str:
+        """
+        根据视频资源确定保存文件的扩展名：先看URL路径，再看HEAD请求返回的Content-Type，都无法判断时使用.mp4
+        """
+        if not video_url:
+            return '.mp4'
+        ext = os.path.splitext(urlparse(video_url).path)[1].lower()
+        if ext in VIDEO_EXTENSIONS:
+            return ext
+        info = self.get_video_info(video_url)
+        if info['success']:
+            content_type = info['content_type'].split(';', 1)[0].strip().lower()
+            return CONTENT_TYPE_EXTENSIONS.get(content_type, '.mp4')
+        return '.mp4'
+    
     def generate_filename(self, video_url: str) -> str:
         """
         生成时间戳格式的文件名
-        格式: 年-月-日-时-分-秒.mp4
+        格式: 年-月-日-时-分-秒.扩展名（扩展名根据视频资源确定，默认.mp4）
         """
         try:
             import time
@@ -52,7 +82,7 @@ class VideoDownloader:
             now = datetime.now()
             
             # 生成时间戳格式的文件名
-            filename = f"{now.year}-{now.month}-{now.day}-{now.hour}-{now.minute}-{now.second}.mp4"
+            filename = f"{now.year}-{now.month}-{now.day}-{now.hour}-{now.minute}-{now.second}{self.get_extension(video_url)}"
             
             return filename
         except Exception as e:
@@ -63,7 +93,8 @@ class VideoDownloader:
                       video_url: str, 
                       download_path: Optional[str] = None, 
                       filename: Optional[str] = None, 
-                      progress_callback: Optional[Callable] = None) -> Dict:
+                      progress_callback: Optional[Callable] = None,
+                      rate_limiter: Optional[TokenBucket] = None) -> Dict:
         """
         下载视频文件
         
@@ -72,6 +103,7 @@ class VideoDownloader:
             download_path: 下载路径，默认使用C:\\index
             filename: 文件名，默认使用时间戳格式
             progress_callback: 进度回调函数，接收(percentage, downloaded, total)参数
+            rate_limiter: 共享的令牌桶限速器，用于控制总带宽
             
         Returns:
             包含下载结果的字典
@@ -145,6 +177,12 @@ class VideoDownloader:
                                 }
                             
                             if chunk:
+                                # 从共享令牌桶获取带宽配额
+                                if rate_limiter and not rate_limiter.consume(len(chunk), lambda: self.should_stop):
+                                    return {
+                                        'success': False,
+                                        'error': '下载已取消'
+                                    }
                                 f.write(chunk)
                                 downloaded += len(chunk)
                                 pbar.update(len(chunk))
@@ -185,34 +223,92 @@ class VideoDownloader:
     def download_videos(self, 
                        video_urls: list, 
                        download_path: Optional[str] = None, 
-                       progress_callback: Optional[Callable] = None) -> list:
+                       progress_callback: Optional[Callable] = None,
+                       max_parallel: Optional[int] = None,
+                       bandwidth_limit: Optional[float] = None,
+                       file_progress_callback: Optional[Callable] = None) -> list:
         """
-        批量下载视频文件
+        批量并行下载视频文件
+        所有文件共享同一个令牌桶，总带宽不超过bandwidth_limit
         
         Args:
             video_urls: 视频URL列表
             download_path: 下载路径
-            progress_callback: 进度回调函数
+            progress_callback: 进度回调函数，接收(global_percentage, downloaded_bytes, total_bytes)参数
+            max_parallel: 同时下载的文件数，默认使用self.max_parallel_downloads
+            bandwidth_limit: 总带宽上限（字节/秒），默认使用self.bandwidth_limit
+            file_progress_callback: 文件进度回调函数，接收(completed_files, total_files)参数
             
         Returns:
-            下载结果列表
+            下载结果列表（与video_urls顺序一致）
         """
-        results = []
+        total_files = len(video_urls)
+        if total_files == 0:
+            return []
+        
+        max_parallel = max_parallel or self.max_parallel_downloads
+        rate_limiter = TokenBucket(
+            bandwidth_limit if bandwidth_limit is not None else self.bandwidth_limit,
+            capacity=self.chunk_size
+        )
+        
+        # 各文件的下载进度 {索引: (已下载字节, 总字节)}
+        file_progress = {}
+        finished_files = set()
+        progress_lock = threading.Lock()
+        
+        def report_progress():
+            # 调用方需持有progress_lock
+            if not progress_callback:
+                return
+            downloaded_bytes = sum(downloaded for downloaded, _ in file_progress.values())
+            total_bytes = sum(total for _, total in file_progress.values())
+            # 按文件平均计算全局百分比，已结束的文件按完成计，未知大小的文件按0计
+            fractions = len(finished_files) + sum(
+                min(downloaded / total, 1.0) if total > 0 else 0.0
+                for index, (downloaded, total) in file_progress.items()
+                if index not in finished_files
+            )
+            global_percentage = fractions / total_files * 100
+            progress_callback(global_percentage, downloaded_bytes, total_bytes)
         
-        for i, video_url in enumerate(video_urls):
-            # 计算全局进度
+        def make_progress_callback(index):
             def batch_progress_callback(percentage, downloaded, total):
-                if progress_callback:
-                    global_percentage = (i + percentage / 100) / len(video_urls) * 100
-                    progress_callback(global_percentage, downloaded, total)
-            
-            # 下载单个视频
-            result = self.download_video(
+                with progress_lock:
+                    file_progress[index] = (downloaded, total)
+                    report_progress()
+            return batch_progress_callback
+        
+        # 同一秒内生成的时间戳文件名会重复，批量下载时追加序号；扩展名按各自的视频资源确定
+        base_name = os.path.splitext(self.generate_filename(''))[0]
+        
+        def download_one(index, video_url):
+            return self.download_video(
                 video_url,
                 download_path,
-                progress_callback=batch_progress_callback
+                filename=f"{base_name}-{index + 1}{self.get_extension(video_url)}",
+                progress_callback=make_progress_callback(index),
+                rate_limiter=rate_limiter
             )
-            results.append(result)
+        
+        results = [None] * total_files
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_parallel) as executor:
+            future_to_index = {
+                executor.submit(download_one, i, video_url): i
+                for i, video_url in enumerate(video_urls)
+            }
+            for future in concurrent.futures.as_completed(future_to_index):
+                i = future_to_index[future]
+                try:
+                    results[i] = future.result()
+                except Exception as e:
+                    results[i] = {'success': False, 'error': str(e)}
+                
+                with progress_lock:
+                    finished_files.add(i)
+                    report_progress()
+                    if file_progress_callback:
+                        file_progress_callback(len(finished_files), total_files)
         
         return results
     